@@ -50,6 +50,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     'django.contrib.sites',
     'allauth',
@@ -84,6 +85,8 @@ MIDDLEWARE = [
 
     "debug_toolbar.middleware.DebugToolbarMiddleware",
     'allauth.account.middleware.AccountMiddleware',
+    # Лічильник звернень до R2 за запит (заголовок X-Storage-Round-Trips)
+    'bins.middleware.StorageRoundTripsMiddleware',
 ]
 
 ROOT_URLCONF = 'app.urls'
@@ -192,10 +195,25 @@ AWS_S3_CUSTOM_DOMAIN = env('AWS_S3_CUSTOM_DOMAIN', default=(
 ))
 AWS_DEFAULT_ACL = None
 
+# Пул з'єднань до R2: один boto3-клієнт на процес (див. bins/storage.py).
+# max_pool_connections варто тримати >= кількості потоків воркера gunicorn.
+R2_MAX_POOL_CONNECTIONS = env.int('R2_MAX_POOL_CONNECTIONS', default=32)
+R2_CONNECT_TIMEOUT = env.float('R2_CONNECT_TIMEOUT', default=2.0)  # секунди
+R2_READ_TIMEOUT = env.float('R2_READ_TIMEOUT', default=10.0)  # секунди
+R2_MAX_ATTEMPTS = env.int('R2_MAX_ATTEMPTS', default=3)  # разом з першою спробою
+R2_RETRY_MODE = env('R2_RETRY_MODE', default='standard')  # legacy | standard | adaptive
+R2_TCP_KEEPALIVE = env.bool('R2_TCP_KEEPALIVE', default=True)
+
+# Сховище контенту бінів: 'r2' (Cloudflare R2) або 'local' (диск ноди, читання через mmap)
+CONTENT_STORE_BACKEND = env('CONTENT_STORE_BACKEND', default='r2')
+CONTENT_STORE_LOCAL_ROOT = env('CONTENT_STORE_LOCAL_ROOT', default=str(MEDIA_ROOT / 'content'))
+CONTENT_STREAM_CHUNK_SIZE = env.int('CONTENT_STREAM_CHUNK_SIZE', default=64 * 1024)  # байт на шматок у raw-відповідях
+
 CSRF_TRUSTED_ORIGINS = env.list('CSRF_TRUSTED_ORIGINS', default=["http://localhost:8080"])
 
 CRONJOBS = [
-    ('0 0 * * *', 'django.core.management.call_command', ['delete_bins']),  # кожного дня
+    # кожного дня (або worker з --daemon); скан таблиці ловить і біни, яких немає в індексі спливань
+    ('0 0 * * *', 'django.core.management.call_command', ['delete_expired_bins'], {'source': 'scan'}),
 ]
 
 REST_FRAMEWORK = {
@@ -240,6 +258,13 @@ SIMPLE_JWT = {
 REDIS_HOST = env('REDIS_HOST', default='localhost')
 REDIS_PORT = env.int('REDIS_PORT', default=6379)
 REDIS_DB = env.int('REDIS_DB', default=0)
+# Пул з'єднань і circuit breaker (bins/redis_client.py): клієнт один на процес,
+# живучість перевіряє фоновий потік, а не кожен виклик get_redis_client()
+REDIS_MAX_CONNECTIONS = env.int('REDIS_MAX_CONNECTIONS', default=50)
+REDIS_SOCKET_CONNECT_TIMEOUT = env.float('REDIS_SOCKET_CONNECT_TIMEOUT', default=1.0)  # секунди
+REDIS_SOCKET_TIMEOUT = env.float('REDIS_SOCKET_TIMEOUT', default=2.0)  # секунди
+REDIS_HEALTH_CHECK_INTERVAL = env.int('REDIS_HEALTH_CHECK_INTERVAL', default=5)  # секунди між ping
+REDIS_CIRCUIT_COOLDOWN = env.int('REDIS_CIRCUIT_COOLDOWN', default=30)  # секунди на FakeRedis після збою
 # Upstash (managed Redis via REST) configuration
 # If you use Upstash, set UPSTASH_REDIS_REST_URL and UPSTASH_REDIS_REST_TOKEN in your .env
 UPSTASH_REDIS_REST_URL = env('UPSTASH_REDIS_REST_URL', default=None)
@@ -260,6 +285,53 @@ if UPSTASH_REDIS_REST_URL and UPSTASH_REDIS_REST_TOKEN:
     except Exception:
         # If the package is not installed or instantiation fails, keep None
         UPSTASH_REDIS_CLIENT = None
+
+# Дворівневий кеш бінів (bins/cache.py): локальний LRU у кожному воркері перед Redis
+BIN_LOCAL_CACHE_MAX_BYTES = env.int('BIN_LOCAL_CACHE_MAX_BYTES', default=32 * 1024 * 1024)  # байт на процес
+BIN_LOCAL_CACHE_TTL = env.int('BIN_LOCAL_CACHE_TTL', default=60)  # секунди, страховка без pub/sub
+BIN_CACHE_INVALIDATION_CHANNEL = env('BIN_CACHE_INVALIDATION_CHANNEL', default='bin_cache_invalidate')
+# Політика кешування контенту бінів (bins/cache_policy.py)
+BIN_CACHE_TTL = env.int('BIN_CACHE_TTL', default=3600)  # секунди
+BIN_CACHE_ADMISSION_THRESHOLD = env.int('BIN_CACHE_ADMISSION_THRESHOLD', default=3)  # звернень за вікно
+BIN_CACHE_SKETCH_WINDOW = env.int('BIN_CACHE_SKETCH_WINDOW', default=10000)  # звернень до старіння лічильників
+BIN_CACHE_LOCK_TIMEOUT = env.float('BIN_CACHE_LOCK_TIMEOUT', default=5.0)  # секунди, TTL замка single-flight
+BIN_CACHE_LOCK_WAIT = env.float('BIN_CACHE_LOCK_WAIT', default=2.0)  # секунди очікування чужого fetch
+BIN_CACHE_EARLY_REFRESH_BETA = env.float('BIN_CACHE_EARLY_REFRESH_BETA', default=1.0)
+BIN_COMMENTS_PAGE_SIZE = env.int('BIN_COMMENTS_PAGE_SIZE', default=20)  # коментарів на сторінці перегляду біна
+# Пошук бінів: 'database' (pg_trgm / icontains) або 'memory' (in-process fuzzy-індекс)
+SEARCH_BACKEND = env('SEARCH_BACKEND', default='database')
+SEARCH_INDEX_TOP_K = env.int('SEARCH_INDEX_TOP_K', default=500)  # скільки id індекс віддає в БД
+SEARCH_INDEX_WORKERS = env.int('SEARCH_INDEX_WORKERS', default=-1)  # потоки rapidfuzz.cdist, -1 = усі ядра
+SEARCH_INDEX_REBUILD_INTERVAL = env.int('SEARCH_INDEX_REBUILD_INTERVAL', default=300)  # секунди
+# Буферизований підрахунок переглядів (bins/view_tracking.py)
+BIN_VIEWS_DEDUP_TTL = env.int('BIN_VIEWS_DEDUP_TTL', default=30 * 24 * 3600)  # секунди життя множини/ключів глядачів
+BIN_VIEWS_FLUSH_BATCH_SIZE = env.int('BIN_VIEWS_FLUSH_BATCH_SIZE', default=1000)  # записів на транзакцію
+BIN_VIEWS_FLUSH_INTERVAL = env.float('BIN_VIEWS_FLUSH_INTERVAL', default=10)  # секунди між проходами flush_bin_views --daemon
+BIN_VIEWS_FLUSH_LOCK_TTL = env.float('BIN_VIEWS_FLUSH_LOCK_TTL', default=300)  # секунди, замок одного проходу flush
+BIN_VIEWS_DEDUP_MODE = env('BIN_VIEWS_DEDUP_MODE', default='set')  # 'set' (множина на бін) або 'hll' (ключ на глядача з TTL; HLL — лише оцінки унікальних)
+BIN_VIEWS_ROW_SAMPLE_RATE = env.float('BIN_VIEWS_ROW_SAMPLE_RATE', default=1.0)  # частка рядків ViewBin у БД, 0 — не зберігати
+BIN_VIEWS_HLL_HOUR_TTL = env.int('BIN_VIEWS_HLL_HOUR_TTL', default=7 * 24 * 3600)  # секунди
+BIN_VIEWS_HLL_DAY_TTL = env.int('BIN_VIEWS_HLL_DAY_TTL', default=90 * 24 * 3600)  # секунди
+# Локальна оренда хешів воркером (bins/hash_lease.py)
+BIN_HASH_LEASE_BLOCK = env.int('BIN_HASH_LEASE_BLOCK', default=256)  # хешів за один LPOP; 1 — без оренди
+BIN_HASH_LEASE_LOW_WATER = env.int('BIN_HASH_LEASE_LOW_WATER', default=64)  # поріг фонового доповнення черги
+# Лідерборди бінів (bins/leaderboard.py)
+BIN_LEADERBOARD_SIZE = env.int('BIN_LEADERBOARD_SIZE', default=20)  # бінів у top-N
+BIN_LEADERBOARD_CACHE_TTL = env.int('BIN_LEADERBOARD_CACHE_TTL', default=30)  # секунди кешу серіалізованого top-N
+BIN_TRENDING_BUCKET = env.int('BIN_TRENDING_BUCKET', default=300)  # секунди одного trending-кошика
+BIN_TRENDING_LIKE_WEIGHT = env.float('BIN_TRENDING_LIKE_WEIGHT', default=1.0)  # вага лайка
+BIN_TRENDING_VIEW_WEIGHT = env.float('BIN_TRENDING_VIEW_WEIGHT', default=0.1)  # вага унікального перегляду
+BIN_TRENDING_HOUR_HALF_LIFE = env.int('BIN_TRENDING_HOUR_HALF_LIFE', default=15 * 60)  # секунди напіврозпаду у вікні "hour"
+BIN_TRENDING_DAY_HALF_LIFE = env.int('BIN_TRENDING_DAY_HALF_LIFE', default=6 * 3600)  # секунди напіврозпаду у вікні "day"
+# Пагінація списків бінів (bins/pagination.py)
+BIN_LIST_PAGINATION = env('BIN_LIST_PAGINATION', default='page')  # 'page' (номери сторінок) або 'cursor' (keyset)
+# Reaper прострочених бінів (bins/tasks.py)
+BIN_REAPER_CHUNK_SIZE = env.int('BIN_REAPER_CHUNK_SIZE', default=500)  # бінів в одній пачці
+BIN_REAPER_SOURCE = env('BIN_REAPER_SOURCE', default='index')  # 'index' (Redis ZSET спливань) або 'scan' (таблиця)
+BIN_REAPER_INTERVAL = env.float('BIN_REAPER_INTERVAL', default=300)  # секунди між циклами --daemon
+BIN_REAPER_JITTER = env.float('BIN_REAPER_JITTER', default=30)  # секунди випадкового відхилення інтервалу
+BIN_REAPER_TIME_BUDGET = env.float('BIN_REAPER_TIME_BUDGET', default=60)  # секунди роботи на цикл
+BIN_REAPER_SCAN_INTERVAL = env.float('BIN_REAPER_SCAN_INTERVAL', default=3600)  # секунди між звірочними сканами таблиці в режимі index
 # ============================================================================
 # PRODUCTION SECURITY SETTINGS
 # ============================================================================
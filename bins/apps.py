@@ -6,3 +6,5 @@ class BinsConfig(AppConfig):
     name = "bins"
     verbose_name = "Створити_Bin"
 
+    def ready(self):
+        from . import signals  # noqa: F401
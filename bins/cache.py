@@ -0,0 +1,323 @@
+"""
+Дворівневий кеш бінів: in-process LRU перед Redis.
+
+Ключі ті самі, що й раніше (`bin_meta:<hash>`, `bin_content:<hash>`). Читання
+спершу йде у локальний LRU воркера (обмежений за розміром у байтах, з TTL), і
+лише при промаху — у Redis; знайдене в Redis кладеться у локальний рівень.
+
+Інвалідація між воркерами: `invalidate_bin()` публікує хеш біна у Redis-канал
+`BIN_CACHE_INVALIDATION_CHANNEL`, а фоновий підписник у кожному процесі
+викидає відповідні ключі зі свого LRU. Якщо клієнт не підтримує pub/sub
+(Upstash REST, FakeRedis) — локальні записи живуть не довше `BIN_LOCAL_CACHE_TTL`.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import redis
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Приблизні накладні витрати на один запис (ключ, кортеж, вузол OrderedDict)
+ENTRY_OVERHEAD_BYTES = 128
+
+CACHE_KEY_PREFIXES = ("bin_meta:", "bin_content:")
+
+# Маркер конверта "термін життя + час обчислення" перед значенням
+ENVELOPE_PREFIX = b"\x00xf1:"
+
+# Скільки секунд підписник чекає на повідомлення за один опит; менше за
+# REDIS_SOCKET_TIMEOUT, тож тихий канал не обриває з'єднання таймаутом читання
+SUBSCRIBER_POLL_TIMEOUT = 1.0
+
+
+class LocalLRUCache:
+    """
+    Потокобезпечний LRU-кеш, обмежений сумарним розміром значень у байтах.
+
+    Значення зберігаються як bytes (так само, як їх повертає redis-py).
+    Лічильники: hits, misses, evictions, expirations.
+    """
+
+    def __init__(self, max_bytes, default_ttl):
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (value, expires_at, size)
+        self._bytes = 0
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+    @staticmethod
+    def _entry_size(key, value):
+        return len(key) + len(value) + ENTRY_OVERHEAD_BYTES
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+        return entry
+
+    def get(self, key):
+        """Повертає значення або None (промах чи прострочений запис)."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            value, expires_at, _ = entry
+            if expires_at <= now:
+                self._remove(key)
+                self._stats["expirations"] += 1
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        """Кладе значення у кеш, витісняючи найдавніше використані записи за потреби."""
+        if isinstance(value, str):
+            value = value.encode("utf-8")
+        size = self._entry_size(key, value)
+        if size > self.max_bytes:
+            # Один запис більший за весь бюджет — не кешуємо локально
+            return False
+        ttl = self.default_ttl if ttl is None else min(ttl, self.default_ttl)
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (value, time.monotonic() + ttl, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._stats["evictions"] += 1
+        return True
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries), bytes=self._bytes, max_bytes=self.max_bytes)
+
+
+class InvalidationSubscriber(threading.Thread):
+    """
+    Фоновий потік, що слухає Redis-канал інвалідації і чистить локальний LRU.
+
+    Канал опитується `get_message(timeout=...)`, а не блокуючим `listen()`:
+    спільний пул має socket_timeout, і на тихому каналі `listen()` падав би
+    таймаутом читання. Після справжньої втрати з'єднання локальний кеш
+    очищується повністю — повідомлення, надіслані поки нас не було, могли загубитися.
+    """
+
+    def __init__(self, redis_client, channel, local_cache):
+        super().__init__(name="bin-cache-invalidation", daemon=True)
+        self.redis_client = redis_client
+        self.channel = channel
+        self.local_cache = local_cache
+        self._stopped = threading.Event()
+
+    def stop(self):
+        self._stopped.set()
+
+    def handle(self, message):
+        data = message.get("data")
+        if isinstance(data, bytes):
+            data = data.decode("utf-8")
+        # Одне повідомлення може містити кілька хешів через кому (invalidate_bins)
+        for hash in filter(None, (data or "").split(",")):
+            self.local_cache.delete(*bin_cache_keys(hash))
+
+    def run(self):
+        backoff = 1
+        while not self._stopped.is_set():
+            pubsub = None
+            try:
+                pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                backoff = 1
+                while not self._stopped.is_set():
+                    message = pubsub.get_message(timeout=SUBSCRIBER_POLL_TIMEOUT)
+                    if message is not None:
+                        self.handle(message)
+            except Exception as e:
+                logger.warning("Cache invalidation subscriber disconnected: %s", e)
+                self.local_cache.clear()
+                self._stopped.wait(backoff)
+                backoff = min(backoff * 2, 30)
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+
+
+def bin_cache_keys(hash):
+    """Повертає всі ключі кешу, що належать біну з даним хешем."""
+    return [f"{prefix}{hash}" for prefix in CACHE_KEY_PREFIXES]
+
+
+_local_cache = None
+_subscriber = None
+_init_lock = threading.Lock()
+
+
+def get_local_cache():
+    """Повертає LRU поточного процесу, створюючи його з налаштувань при першому виклику."""
+    global _local_cache
+    if _local_cache is None:
+        with _init_lock:
+            if _local_cache is None:
+                _local_cache = LocalLRUCache(
+                    max_bytes=getattr(settings, "BIN_LOCAL_CACHE_MAX_BYTES", 32 * 1024 * 1024),
+                    default_ttl=getattr(settings, "BIN_LOCAL_CACHE_TTL", 60),
+                )
+    return _local_cache
+
+
+def _get_redis():
+    from .utils import get_redis_client
+
+    return get_redis_client()
+
+
+def _ensure_subscriber(redis_client):
+    """Запускає підписника інвалідації, якщо клієнт підтримує pub/sub і він ще не запущений."""
+    global _subscriber
+    if _subscriber is not None and _subscriber.is_alive():
+        return
+    if not isinstance(redis_client, redis.Redis):
+        # pub/sub є лише у redis-py; Upstash REST і FakeRedis покладаються на TTL
+        return
+    with _init_lock:
+        if _subscriber is not None and _subscriber.is_alive():
+            return
+        _subscriber = InvalidationSubscriber(
+            redis_client,
+            getattr(settings, "BIN_CACHE_INVALIDATION_CHANNEL", "bin_cache_invalidate"),
+            get_local_cache(),
+        )
+        _subscriber.start()
+
+
+def _pack_entry(value, ttl, delta):
+    """Загортає значення у конверт з часом спливання та часом обчислення (для early refresh)."""
+    if isinstance(value, str):
+        value = value.encode("utf-8")
+    header = f"{time.time() + ttl:.3f}:{delta:.4f}:".encode("ascii")
+    return ENVELOPE_PREFIX + header + value
+
+
+def _unpack_entry(raw):
+    """
+    Розбирає значення з кешу.
+
+    Returns:
+        tuple: (value, expires_at або None, delta або None) — для значень без конверта
+               expires_at і delta дорівнюють None
+    """
+    if isinstance(raw, str):
+        raw = raw.encode("utf-8")
+    if not raw.startswith(ENVELOPE_PREFIX):
+        return raw, None, None
+    try:
+        expires_at, delta, value = raw[len(ENVELOPE_PREFIX):].split(b":", 2)
+        return value, float(expires_at), float(delta)
+    except ValueError:
+        return raw, None, None
+
+
+def cache_get_entry(key):
+    """
+    Повертає (value, expires_at, delta) з локального LRU або Redis, чи None.
+
+    Значення, знайдене в Redis, кладеться у локальний рівень.
+    """
+    local = get_local_cache()
+    raw = local.get(key)
+    if raw is None:
+        redis_client = _get_redis()
+        _ensure_subscriber(redis_client)
+        try:
+            raw = redis_client.get(key)
+        except Exception as e:
+            logger.warning("Redis get failed for %s: %s", key, e)
+            return None
+        if raw is None:
+            return None
+        local.set(key, raw)
+    return _unpack_entry(raw)
+
+
+def cache_get(key):
+    """Повертає значення (bytes) з локального LRU або Redis чи None."""
+    entry = cache_get_entry(key)
+    return entry[0] if entry is not None else None
+
+
+def cache_set(key, value, ttl, delta=None):
+    """
+    Записує значення у Redis (setex) і в локальний LRU.
+
+    Args:
+        delta (float, optional): скільки секунд зайняло обчислення значення; якщо задано,
+            значення зберігається в конверті для ймовірнісного раннього оновлення
+    """
+    if delta is not None:
+        value = _pack_entry(value, ttl, delta)
+    redis_client = _get_redis()
+    _ensure_subscriber(redis_client)
+    redis_client.setex(key, ttl, value)
+    get_local_cache().set(key, value, ttl)
+
+
+def invalidate_bin(hash):
+    """
+    Видаляє кеш біна з усіх рівнів і сповіщає інші воркери.
+
+    Повідомлення у канал — best-effort: без pub/sub інші воркери побачать зміну
+    після спливання BIN_LOCAL_CACHE_TTL.
+    """
+    invalidate_bins([hash])
+
+
+def invalidate_bins(hashes):
+    """
+    Видаляє кеш набору бінів: один DEL у Redis і одне повідомлення у канал
+    (хеші через кому), незалежно від кількості бінів.
+    """
+    hashes = [hash for hash in dict.fromkeys(hashes) if hash]
+    if not hashes:
+        return
+    keys = [key for hash in hashes for key in bin_cache_keys(hash)]
+    get_local_cache().delete(*keys)
+    redis_client = _get_redis()
+    redis_client.delete(*keys)
+    publish = getattr(redis_client, "publish", None)
+    if callable(publish):
+        try:
+            publish(getattr(settings, "BIN_CACHE_INVALIDATION_CHANNEL", "bin_cache_invalidate"), ",".join(hashes))
+        except Exception as e:
+            logger.warning("Failed to publish cache invalidation for %s bins: %s", len(hashes), e)
+
+
+def get_cache_stats():
+    """Повертає лічильники локального рівня кешу (hits/misses/evictions/...)."""
+    return get_local_cache().stats()
+
+
+def clear_local_cache():
+    """Очищує локальний LRU поточного процесу (для тестів)."""
+    get_local_cache().clear()
@@ -0,0 +1,268 @@
+"""
+Політика кешування контенту бінів: допуск за частотою, single-flight і раннє оновлення.
+
+Замість статичного правила `views_count >= 50`:
+
+- Допуск (admission): частота звернень до біна оцінюється count-min sketch'ем
+  у стилі TinyLFU. Лічильники періодично діляться навпіл, тож оцінка відображає
+  недавню популярність, а не загальну кількість переглядів за весь час.
+- Single-flight: при промаху контент з R2 тягне лише один запит на хеш —
+  у межах процесу через локальний замок (фіксований масив смуг, хеш → смуга),
+  між воркерами через Redis `SET NX PX`.
+  Решта чекають, поки значення з'явиться в кеші (до `BIN_CACHE_LOCK_WAIT`).
+- Раннє оновлення (XFetch): запис зберігає час власного обчислення `delta`;
+  незадовго до спливання TTL окремий запит з ймовірністю, що зростає до
+  спливання, перечитує контент у фоні власного запиту, поки інші ще отримують
+  старе значення.
+"""
+import logging
+import math
+import random
+import threading
+import time
+import uuid
+import zlib
+
+from django.conf import settings
+
+from . import cache
+from .redis_client import RELEASE_LOCK
+
+logger = logging.getLogger(__name__)
+
+LOCK_KEY_PREFIX = "bin_content_lock:"
+# Кількість локальних замків: пам'ять не росте з кількістю хешів
+LOCAL_LOCK_STRIPES = 256
+
+
+class FrequencySketch:
+    """
+    Count-min sketch з періодичним старінням (TinyLFU).
+
+    Після `window` інкрементів усі лічильники діляться навпіл, тому оцінка
+    частоти — це приблизна кількість звернень за останнє "вікно" запитів.
+    """
+
+    def __init__(self, width=4096, depth=4, window=10000):
+        self.width = width
+        self.depth = depth
+        self.window = window
+        self._rows = [[0] * width for _ in range(depth)]
+        self._additions = 0
+        self._lock = threading.Lock()
+
+    def _indexes(self, key):
+        data = key.encode("utf-8")
+        for seed in range(self.depth):
+            yield seed, zlib.crc32(data, seed * 0x9E3779B1 & 0xFFFFFFFF) % self.width
+
+    def increment(self, key):
+        """Рахує одне звернення до ключа і повертає нову оцінку частоти."""
+        with self._lock:
+            estimate = None
+            for row, idx in self._indexes(key):
+                self._rows[row][idx] += 1
+                value = self._rows[row][idx]
+                estimate = value if estimate is None else min(estimate, value)
+            self._additions += 1
+            if self._additions >= self.window:
+                self._age()
+            return estimate
+
+    def estimate(self, key):
+        with self._lock:
+            return min(self._rows[row][idx] for row, idx in self._indexes(key))
+
+    def _age(self):
+        for row in self._rows:
+            for i, value in enumerate(row):
+                row[i] = value >> 1
+        self._additions //= 2
+
+    def reset(self):
+        with self._lock:
+            self._rows = [[0] * self.width for _ in range(self.depth)]
+            self._additions = 0
+
+
+_sketch = None
+_sketch_lock = threading.Lock()
+_local_locks = [threading.Lock() for _ in range(LOCAL_LOCK_STRIPES)]
+
+
+def get_sketch():
+    """Повертає sketch частот поточного процесу."""
+    global _sketch
+    if _sketch is None:
+        with _sketch_lock:
+            if _sketch is None:
+                _sketch = FrequencySketch(window=getattr(settings, "BIN_CACHE_SKETCH_WINDOW", 10000))
+    return _sketch
+
+
+def reset_policy():
+    """Скидає sketch (для тестів)."""
+    global _sketch
+    with _sketch_lock:
+        _sketch = None
+
+
+def record_access(hash):
+    """Фіксує звернення до біна; повертає оцінку частоти за поточне вікно."""
+    return get_sketch().increment(hash)
+
+
+def should_admit(hash):
+    """Чи достатньо популярний бін (за недавніми зверненнями), щоб кешувати його контент."""
+    return get_sketch().estimate(hash) >= getattr(settings, "BIN_CACHE_ADMISSION_THRESHOLD", 3)
+
+
+def should_refresh_early(expires_at, delta, beta=None, now=None):
+    """
+    Ймовірнісне рішення XFetch: оновлювати запис до спливання TTL чи ні.
+
+    Args:
+        expires_at (float): unix-час спливання запису
+        delta (float): скільки секунд зайняло обчислення значення
+        beta (float, optional): агресивність (>1 — оновлювати раніше)
+
+    Returns:
+        bool: True, якщо цей запит має перечитати значення
+    """
+    if expires_at is None or delta is None:
+        return False
+    if beta is None:
+        beta = getattr(settings, "BIN_CACHE_EARLY_REFRESH_BETA", 1.0)
+    now = time.time() if now is None else now
+    # -log(U) з U∈(0, 1] — експоненційно розподілений "запас" часу
+    gap = -delta * beta * math.log(1.0 - random.random())
+    return now + gap >= expires_at
+
+
+def _local_lock(hash):
+    # Різні хеші можуть ділити смугу — це лише зрідка серіалізує їхні промахи
+    return _local_locks[zlib.crc32(hash.encode("utf-8")) % LOCAL_LOCK_STRIPES]
+
+
+def _acquire_redis_lock(redis_client, hash):
+    """Пробує взяти розподілений замок; повертає токен або None."""
+    timeout_ms = int(getattr(settings, "BIN_CACHE_LOCK_TIMEOUT", 5) * 1000)
+    token = uuid.uuid4().hex
+    try:
+        if redis_client.set(f"{LOCK_KEY_PREFIX}{hash}", token, px=timeout_ms, nx=True):
+            return token
+        return None
+    except Exception as e:
+        # Без Redis координуємося лише в межах процесу
+        logger.warning("Cache lock for %s unavailable: %s", hash, e)
+        return token
+
+
+def _release_redis_lock(redis_client, hash, token):
+    try:
+        # Не знімаємо чужий замок, якщо наш встиг спливти (порівняння і DEL — атомарно)
+        RELEASE_LOCK(redis_client, [f"{LOCK_KEY_PREFIX}{hash}"], [token])
+    except Exception as e:
+        logger.warning("Failed to release cache lock for %s: %s", hash, e)
+
+
+def _wait_for_value(key):
+    """Чекає, поки власник замка покладе значення в кеш; повертає його або None."""
+    deadline = time.monotonic() + getattr(settings, "BIN_CACHE_LOCK_WAIT", 2)
+    pause = 0.01
+    while time.monotonic() < deadline:
+        time.sleep(pause)
+        value = cache.cache_get(key)
+        if value is not None:
+            return value
+        pause = min(pause * 2, 0.2)
+    return None
+
+
+def _fetch_and_store(bin, fetch, key, ttl):
+    started = time.monotonic()
+    content = fetch(bin)
+    delta = time.monotonic() - started
+    if content is not None:
+        try:
+            cache.cache_set(key, content, ttl, delta=delta)
+        except Exception as e:
+            logger.warning("Failed to cache content of %s: %s", bin.hash, e)
+    return content
+
+
+def _decode(value):
+    return value.decode("utf-8") if isinstance(value, bytes) else value
+
+
+def get_bin_content_cached(bin, fetch):
+    """
+    Повертає контент біна через кеш згідно з політикою.
+
+    Args:
+        bin: об'єкт біна (Create_Bins або FakeBin) з атрибутом hash
+        fetch (callable): fetch(bin) -> str | None, читання контенту з R2;
+            None (немає об'єкта чи помилка сховища) ніколи не кешується
+
+    Returns:
+        str | None: контент біна
+    """
+    key = f"bin_content:{bin.hash}"
+    ttl = getattr(settings, "BIN_CACHE_TTL", 3600)
+    record_access(bin.hash)
+
+    entry = cache.cache_get_entry(key)
+    if entry is not None:
+        value, expires_at, delta = entry
+        if should_refresh_early(expires_at, delta):
+            lock = _local_lock(bin.hash)
+            # Оновлює лише той, хто першим взяв замок; решта віддають поточне значення
+            if lock.acquire(blocking=False):
+                try:
+                    redis_client = cache._get_redis()
+                    token = _acquire_redis_lock(redis_client, bin.hash)
+                    if token is not None:
+                        try:
+                            fresh = _fetch_and_store(bin, fetch, key, ttl)
+                            if fresh is not None:
+                                return fresh
+                        finally:
+                            _release_redis_lock(redis_client, bin.hash, token)
+                finally:
+                    lock.release()
+        return _decode(value)
+
+    if not should_admit(bin.hash):
+        return fetch(bin)
+
+    # Промах для популярного біна: тягнемо з R2 один раз на хеш
+    with _local_lock(bin.hash):
+        value = cache.cache_get(key)
+        if value is not None:
+            return _decode(value)
+        redis_client = cache._get_redis()
+        token = _acquire_redis_lock(redis_client, bin.hash)
+        if token is None:
+            value = _wait_for_value(key)
+            if value is not None:
+                return _decode(value)
+            # Власник замка не встиг — читаємо самі, щоб не тримати користувача
+            return fetch(bin)
+        try:
+            return _fetch_and_store(bin, fetch, key, ttl)
+        finally:
+            _release_redis_lock(redis_client, bin.hash, token)
+
+
+def warm_bin_cache(bin, content):
+    """
+    Кладе свіжий контент у кеш після редагування, якщо бін зараз популярний.
+
+    Returns:
+        bool: True, якщо контент закешовано
+    """
+    if content is None or not should_admit(bin.hash):
+        return False
+    ttl = getattr(settings, "BIN_CACHE_TTL", 3600)
+    cache.cache_set(f"bin_content:{bin.hash}", content, ttl, delta=0.0)
+    return True
@@ -0,0 +1,182 @@
+"""
+Лічильники біна в Redis для сторінки перегляду.
+
+Hash `bin_counters:<id>` з полями likes / dislikes / views дзеркалить
+`likes_count`, `dislikes_count`, `views_count` рядка, тож гарячий бін з
+`bin_meta:<hash>` у кеші рендериться без читання Create_Bins.
+
+Створює hash лише `get_counters` при промаху — одним вузьким запитом до
+БД. Голоси (`vote_bin_service`, у MULTI разом з лідербордами) і
+`flush_pending_views` (HINCRBY views) змінюють лише наявний hash: запис і
+перевірка EXISTS — один Lua-скрипт, тож часткового hash не буває. Кожен
+такий запис збільшує лічильник покоління `bin_counters_gen:<id>`, а
+заповнення при промаху спрацьовує лише тоді, коли покоління не змінилося
+з моменту читання БД, — значення, прочитане до паралельного голосу чи
+перенесення переглядів, не перезапише новіше.
+"""
+import logging
+
+from django.conf import settings
+
+from .models import Create_Bins
+from .redis_client import RedisScript
+
+logger = logging.getLogger(__name__)
+
+COUNTERS_KEY = "bin_counters:{}"
+GENERATION_KEY = "bin_counters_gen:{}"
+FIELDS = ("likes", "dislikes", "views")
+
+
+def _decode(value):
+    return value.decode("utf-8") if isinstance(value, bytes) else value
+
+
+def _pairs(values):
+    return [item for field, value in values.items() for item in (field, value)]
+
+
+def _bump_generation(client, key, ttl):
+    client.incr(key)
+    client.expire(key, ttl)
+
+
+def _update_existing(client, keys, args):
+    _bump_generation(client, keys[1], int(args[0]))
+    if not client.hgetall(keys[0]):
+        return 0
+    pairs = args[1:]
+    client.hset(keys[0], mapping=dict(zip(pairs[::2], pairs[1::2])))
+    client.expire(keys[0], int(args[0]))
+    return 1
+
+
+def _incr_existing(client, keys, args):
+    _bump_generation(client, keys[1], int(args[0]))
+    if not client.hgetall(keys[0]):
+        return 0
+    client.hincrby(keys[0], "views", int(args[1]))
+    client.expire(keys[0], int(args[0]))
+    return 1
+
+
+def _fill_if_unchanged(client, keys, args):
+    if (_decode(client.get(keys[1])) or "") != args[1] or client.hgetall(keys[0]):
+        return 0
+    pairs = args[2:]
+    client.hset(keys[0], mapping=dict(zip(pairs[::2], pairs[1::2])))
+    client.expire(keys[0], int(args[0]))
+    return 1
+
+
+# KEYS: hash, покоління; ARGV[1] — TTL
+UPDATE_EXISTING = RedisScript(
+    "redis.call('INCR', KEYS[2]) redis.call('EXPIRE', KEYS[2], ARGV[1]) "
+    "if redis.call('EXISTS', KEYS[1]) == 0 then return 0 end "
+    "redis.call('HSET', KEYS[1], unpack(ARGV, 2)) redis.call('EXPIRE', KEYS[1], ARGV[1]) return 1",
+    _update_existing,
+)
+INCR_EXISTING = RedisScript(
+    "redis.call('INCR', KEYS[2]) redis.call('EXPIRE', KEYS[2], ARGV[1]) "
+    "if redis.call('EXISTS', KEYS[1]) == 0 then return 0 end "
+    "redis.call('HINCRBY', KEYS[1], 'views', ARGV[2]) redis.call('EXPIRE', KEYS[1], ARGV[1]) return 1",
+    _incr_existing,
+)
+# ARGV[2] — покоління, прочитане до запиту в БД ("" — ключа не було)
+FILL_IF_UNCHANGED = RedisScript(
+    "if (redis.call('GET', KEYS[2]) or '') ~= ARGV[2] or redis.call('EXISTS', KEYS[1]) == 1 then return 0 end "
+    "redis.call('HSET', KEYS[1], unpack(ARGV, 3)) redis.call('EXPIRE', KEYS[1], ARGV[1]) return 1",
+    _fill_if_unchanged,
+)
+
+
+def _get_redis():
+    from .utils import get_redis_client
+
+    return get_redis_client()
+
+
+def _ttl():
+    return getattr(settings, "BIN_CACHE_TTL", 3600)
+
+
+def _read(bin_id):
+    try:
+        raw = _get_redis().hgetall(COUNTERS_KEY.format(bin_id))
+    except Exception as e:
+        logger.warning("Failed to read counters of bin %s: %s", bin_id, e)
+        return None
+    values = {
+        (field.decode("utf-8") if isinstance(field, bytes) else field): value
+        for field, value in (raw or {}).items()
+    }
+    try:
+        return {field: int(values[field]) for field in FIELDS}
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def set_counters(bin_id, pipeline=None, **values):
+    """
+    Записує свіжі значення лічильників (likes, dislikes, views — будь-яку підмножину), якщо hash уже є.
+
+    Args:
+        pipeline (optional): MULTI-конвеєр, у який лише поставити скрипт (виконує викликач)
+    """
+    keys = [COUNTERS_KEY.format(bin_id), GENERATION_KEY.format(bin_id)]
+    args = [_ttl(), *_pairs(values)]
+    if pipeline is not None:
+        UPDATE_EXISTING(pipeline, keys, args)
+        return
+    try:
+        UPDATE_EXISTING(_get_redis(), keys, args)
+    except Exception as e:
+        logger.warning("Failed to store counters of bin %s: %s", bin_id, e)
+
+
+def add_views(bin_id, count):
+    """Додає перенесені в БД перегляди до закешованого views (flush_pending_views), якщо hash уже є."""
+    keys = [COUNTERS_KEY.format(bin_id), GENERATION_KEY.format(bin_id)]
+    try:
+        INCR_EXISTING(_get_redis(), keys, [_ttl(), count])
+    except Exception as e:
+        logger.warning("Failed to add views to counters of bin %s: %s", bin_id, e)
+
+
+def get_counters(bin_id):
+    """
+    Повертає лічильники біна з Redis, при промаху — одним запитом values_list.
+
+    Args:
+        bin_id (int): id біна
+
+    Returns:
+        dict or None: {"likes", "dislikes", "views"}; None — біна в БД немає
+    """
+    counters = _read(bin_id)
+    if counters is not None:
+        return counters
+    redis_client = _get_redis()
+    try:
+        generation = _decode(redis_client.get(GENERATION_KEY.format(bin_id))) or ""
+    except Exception as e:
+        logger.warning("Failed to read counters generation of bin %s: %s", bin_id, e)
+        generation = None
+    row = (
+        Create_Bins.objects.filter(pk=bin_id)
+        .values_list("likes_count", "dislikes_count", "views_count")
+        .first()
+    )
+    if row is None:
+        return None
+    counters = dict(zip(FIELDS, row))
+    if generation is not None:
+        try:
+            FILL_IF_UNCHANGED(
+                redis_client,
+                [COUNTERS_KEY.format(bin_id), GENERATION_KEY.format(bin_id)],
+                [_ttl(), generation, *_pairs(counters)],
+            )
+        except Exception as e:
+            logger.warning("Failed to store counters of bin %s: %s", bin_id, e)
+    return counters
@@ -0,0 +1,103 @@
+"""
+Індекс спливання бінів у Redis sorted set (`bin_expiry_index`).
+
+Член — id біна, score — `expiry_at` у секундах epoch. Розклад оновлює
+сигнал post_save (bins/signals.py), тож усі шляхи створення й редагування
+(`create_bin_service`, `create_bin_from_data`, форми, адмінка) потрапляють
+в індекс без окремих викликів. Члени видалених бінів прибирає reaper.
+
+- `is_expired(bin_id)` — один ZSCORE: читання простроченого, але ще не
+  прибраного біна отримує 404 без запиту до БД.
+- `due_bin_ids()` — ZRANGEBYSCORE по простроченим членам для reaper'а
+  (`delete_expired_bins(source="index")`), без сканування таблиці.
+"""
+import logging
+import time
+
+from django.db.models import Q
+
+from .models import Create_Bins
+
+logger = logging.getLogger(__name__)
+
+EXPIRY_INDEX_KEY = "bin_expiry_index"
+
+
+def _get_redis():
+    from .utils import get_redis_client
+
+    return get_redis_client()
+
+
+def schedule_expiry(bin_id, expiry_at):
+    """Записує (або прибирає, якщо expiry_at порожній) час спливання біна в індекс."""
+    redis_client = _get_redis()
+    try:
+        if expiry_at is None:
+            redis_client.zrem(EXPIRY_INDEX_KEY, str(bin_id))
+        else:
+            redis_client.zadd(EXPIRY_INDEX_KEY, {str(bin_id): expiry_at.timestamp()})
+    except Exception as e:
+        logger.warning("Failed to schedule expiry of bin %s: %s", bin_id, e)
+
+
+def unschedule(*bin_ids):
+    """Прибирає біни з індексу (після видалення)."""
+    if not bin_ids:
+        return
+    try:
+        _get_redis().zrem(EXPIRY_INDEX_KEY, *[str(pk) for pk in bin_ids])
+    except Exception as e:
+        logger.warning("Failed to unschedule %s bins: %s", len(bin_ids), e)
+
+
+def is_expired(bin_id, now=None):
+    """
+    Чи сплив бін згідно з індексом.
+
+    Returns:
+        bool: True лише якщо бін є в індексі і його час минув; при недоступності
+              Redis — False (далі діє звичайна перевірка по БД)
+    """
+    try:
+        score = _get_redis().zscore(EXPIRY_INDEX_KEY, str(bin_id))
+    except Exception as e:
+        logger.warning("Expiry index lookup failed for bin %s: %s", bin_id, e)
+        return False
+    if score is None:
+        return False
+    return float(score) <= (time.time() if now is None else now)
+
+
+def due_bin_ids(limit, offset=0, now=None):
+    """Повертає до `limit` id бінів, час яких минув, від найдавніших."""
+    now = time.time() if now is None else now
+    members = _get_redis().zrangebyscore(EXPIRY_INDEX_KEY, "-inf", now, start=offset, num=limit)
+    return [int(m.decode("utf-8") if isinstance(m, bytes) else m) for m in members]
+
+
+def backfill_expiry_index(chunk_size=5000):
+    """
+    Заносить у індекс усі біни з expiry_at (для бінів, створених до появи індексу).
+
+    Returns:
+        int: скільки бінів занесено
+    """
+    redis_client = _get_redis()
+    rows = (
+        Create_Bins.objects.filter(~Q(expiry_at=None))
+        .values_list("id", "expiry_at")
+        .iterator(chunk_size=chunk_size)
+    )
+    total = 0
+    batch = {}
+    for pk, expiry_at in rows:
+        batch[str(pk)] = expiry_at.timestamp()
+        if len(batch) >= chunk_size:
+            redis_client.zadd(EXPIRY_INDEX_KEY, batch)
+            total += len(batch)
+            batch = {}
+    if batch:
+        redis_client.zadd(EXPIRY_INDEX_KEY, batch)
+        total += len(batch)
+    return total
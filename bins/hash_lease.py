@@ -0,0 +1,181 @@
+"""
+Локальна оренда хешів у воркері.
+
+Замість LPOP `my_unique_hash_pool` на кожне створення біна процес бере блок
+хешів (`BIN_HASH_LEASE_BLOCK`) одним `LPOP pool count` у власну чергу. Коли
+в черзі лишається менше `BIN_HASH_LEASE_LOW_WATER`, наступний блок підтягує
+фоновий потік, тож створення біна зазвичай не звертається до Redis зовсім і
+переживає короткі збої Redis. Хеш біна, який не вдалося створити, вертається
+в чергу (`release_unless_taken`), якщо його не зайняв інший бін; невикористані хеші при завершенні процесу
+(graceful shutdown воркера gunicorn) повертаються в пул через atexit.
+"""
+import atexit
+import logging
+import os
+import threading
+from collections import deque
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+POOL_KEY = "my_unique_hash_pool"
+
+
+def _get_redis():
+    from .utils import get_redis_client
+
+    return get_redis_client()
+
+
+def _decode(value):
+    return value.decode("utf-8") if isinstance(value, (bytes, bytearray)) else str(value)
+
+
+class HashLease:
+    """Потокобезпечна черга орендованих хешів процесу."""
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self._queue = deque()
+        self._lock = threading.Lock()
+        self._refill_lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def _check_fork(self):
+        # Після fork (gunicorn --preload) черга батька не повинна дістатись кільком воркерам
+        if self._pid != os.getpid():
+            self._reset()
+
+    def __len__(self):
+        return len(self._queue)
+
+    def _lease_block(self):
+        """Бере блок хешів з Redis у чергу, якщо вона нижче порогу. Повертає кількість узятих."""
+        with self._refill_lock:
+            if len(self._queue) >= getattr(settings, "BIN_HASH_LEASE_LOW_WATER", 64):
+                return 0
+            try:
+                raw = _get_redis().lpop(POOL_KEY, getattr(settings, "BIN_HASH_LEASE_BLOCK", 256))
+            except Exception as e:
+                logger.warning("Failed to lease hashes from Redis: %s", e)
+                return 0
+            if not raw:
+                return 0
+            if not isinstance(raw, list):
+                raw = [raw]
+            hashes = [_decode(value) for value in raw if value]
+            with self._lock:
+                self._queue.extend(hashes)
+            return len(hashes)
+
+    def _refill_async(self):
+        if not self._refill_lock.locked():
+            threading.Thread(target=self._lease_block, name="hash-lease-refill", daemon=True).start()
+
+    def acquire(self):
+        """
+        Видає хеш з локальної черги; порожня черга доповнюється синхронно.
+
+        Returns:
+            str or None: хеш, або None — пул порожній або Redis недоступний
+        """
+        self._check_fork()
+        with self._lock:
+            value = self._queue.popleft() if self._queue else None
+        if value is None:
+            self._lease_block()
+            with self._lock:
+                value = self._queue.popleft() if self._queue else None
+            if value is None:
+                return None
+        if len(self._queue) < getattr(settings, "BIN_HASH_LEASE_LOW_WATER", 64):
+            self._refill_async()
+        return value
+
+    def release(self, value):
+        """Повертає невикористаний хеш на початок черги."""
+        with self._lock:
+            self._queue.appendleft(value)
+
+    def return_unused(self):
+        """Повертає всі хеші черги назад у Redis-пул (при завершенні процесу)."""
+        if self._pid != os.getpid():
+            return 0
+        with self._lock:
+            hashes = list(self._queue)
+            self._queue.clear()
+        if not hashes:
+            return 0
+        try:
+            # LPUSH кладе кожен наступний на голову — у зворотному порядку перший лишається першим
+            _get_redis().lpush(POOL_KEY, *reversed(hashes))
+        except Exception as e:
+            logger.warning("Failed to return %s leased hashes to Redis: %s", len(hashes), e)
+            return 0
+        return len(hashes)
+
+
+_lease = HashLease()
+atexit.register(_lease.return_unused)
+
+
+def acquire_hash():
+    """Повертає унікальний хеш для нового біна або None."""
+    if getattr(settings, "BIN_HASH_LEASE_BLOCK", 256) <= 1:
+        # Оренду вимкнено — як раніше, LPOP на кожен бін
+        try:
+            value = _get_redis().lpop(POOL_KEY)
+        except Exception as e:
+            logger.warning("Failed to lpop from Redis: %s", e)
+            return None
+        return _decode(value) if value else None
+    return _lease.acquire()
+
+
+def release_hash(value):
+    """Повертає хеш біна, який не вдалося створити."""
+    if not value:
+        return
+    if getattr(settings, "BIN_HASH_LEASE_BLOCK", 256) <= 1:
+        try:
+            _get_redis().lpush(POOL_KEY, value)
+        except Exception as e:
+            logger.warning("Failed to return hash to Redis: %s", e)
+        return
+    _lease.release(value)
+
+
+def release_unless_taken(value, error):
+    """
+    Повертає хеш після невдалого створення біна, якщо хеш не зайнятий.
+
+    IntegrityError через уже наявний бін з цим хешем означає, що хеш видано
+    двічі: повернення в чергу лише віддало б його наступному біну і повторило
+    помилку, тож такий хеш відкидається.
+
+    Returns:
+        bool: True, якщо хеш повернуто
+    """
+    from django.db import IntegrityError
+
+    from .models import Create_Bins
+
+    if value and isinstance(error, IntegrityError):
+        try:
+            taken = Create_Bins.objects.filter(hash=value).exists()
+        except Exception as e:
+            logger.warning("Failed to check hash %s after IntegrityError: %s", value, e)
+            taken = True
+        if taken:
+            logger.warning("Hash %s is already used by another bin, dropping it", value)
+            return False
+    release_hash(value)
+    return bool(value)
+
+
+def reset_hash_lease():
+    """Забуває чергу процесу без повернення в пул (для тестів)."""
+    _lease._reset()
@@ -0,0 +1,270 @@
+"""
+Лідерборди бінів у Redis sorted sets.
+
+`popular` — ZSET `bin_leaderboard:popular` (член — id біна, score —
+likes_count), який оновлює кожен голос (`vote_bin_service`), тож
+PopularBinsListAPIView не сортує таблицю на кожен запит.
+
+`hour` / `day` — trending: лайки й перегляди додаються ZINCRBY у кошики
+по `BIN_TRENDING_BUCKET` секунд (`bin_trending:b:<n>`); при читанні кошики
+вікна зводяться ZUNIONSTORE з вагами 0.5^(вік / half-life), тож свіжа
+активність важить більше за давню.
+
+Поки `popular` не заповнено повністю (`rebuild_popular_leaderboard`; маркер
+`bin_leaderboard:popular:ready`), top-N читається з БД. Rebuild запускає
+лідер `delete_expired_bins --daemon`, щойно маркера немає (новий деплой,
+скинутий Redis).
+
+Серіалізований top-N кожного лідерборду кешується на
+`BIN_LEADERBOARD_CACHE_TTL` секунд і віддається без запитів до БД.
+Видалені, прострочені й приватні біни відсіюються під час побудови top-N;
+сервіси і view видалення та reaper прибирають свої біни з `popular` пачкою,
+а редагування (`sync_bin`) оновлює або прибирає бін і скидає закешовані top-N.
+"""
+import json
+import logging
+import time
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Create_Bins
+from .pagination import POPULAR_ORDERING
+
+logger = logging.getLogger(__name__)
+
+POPULAR_KEY = "bin_leaderboard:popular"
+POPULAR_READY_KEY = "bin_leaderboard:popular:ready"
+TRENDING_BUCKET_KEY = "bin_trending:b:{}"
+TRENDING_KEY = "bin_trending:w:{}"
+PAYLOAD_KEY = "bin_leaderboard_payload:{}"
+
+# вікно -> (тривалість у секундах, налаштування half-life, half-life за замовчуванням)
+TRENDING_WINDOWS = {
+    "hour": (3600, "BIN_TRENDING_HOUR_HALF_LIFE", 15 * 60),
+    "day": (24 * 3600, "BIN_TRENDING_DAY_HALF_LIFE", 6 * 3600),
+}
+# вид активності -> (налаштування ваги, вага за замовчуванням)
+TRENDING_WEIGHTS = {
+    "like": ("BIN_TRENDING_LIKE_WEIGHT", 1.0),
+    "view": ("BIN_TRENDING_VIEW_WEIGHT", 0.1),
+}
+BOARDS = ("popular", *TRENDING_WINDOWS)
+
+
+def _get_redis():
+    from .utils import get_redis_client
+
+    return get_redis_client()
+
+
+def _listed_bins():
+    """Біни, що можуть потрапити в лідерборд: публічні й непрострочені."""
+    return Create_Bins.objects.filter(access="public").filter(
+        Q(expiry_at__isnull=True) | Q(expiry_at__gt=timezone.now())
+    )
+
+
+def is_listed(access, expiry_at):
+    return access == "public" and (expiry_at is None or expiry_at > timezone.now())
+
+
+def is_popular_ready(redis_client=None):
+    """Чи `popular` повністю заповнений (rebuild завершився і Redis відтоді не скидався)."""
+    try:
+        return bool((redis_client or _get_redis()).get(POPULAR_READY_KEY))
+    except Exception as e:
+        logger.warning("Failed to check popular leaderboard state: %s", e)
+        return False
+
+
+def update_popular(bin_id, likes, listed=True, pipeline=None):
+    """
+    Записує кількість лайків біна в `popular` або прибирає бін, якщо він не публічний чи прострочений.
+
+    Args:
+        pipeline (optional): MULTI-конвеєр, у який лише поставити команду (виконує викликач)
+    """
+    if pipeline is not None:
+        if listed:
+            pipeline.zadd(POPULAR_KEY, {str(bin_id): likes})
+        else:
+            pipeline.zrem(POPULAR_KEY, str(bin_id))
+        return
+    try:
+        if listed:
+            _get_redis().zadd(POPULAR_KEY, {str(bin_id): likes})
+        else:
+            _get_redis().zrem(POPULAR_KEY, str(bin_id))
+    except Exception as e:
+        logger.warning("Failed to update popular leaderboard for bin %s: %s", bin_id, e)
+
+
+def record_activity(bin_id, kind, count=1, pipeline=None):
+    """
+    Додає активність біна в поточний trending-кошик.
+
+    Args:
+        bin_id (int): id біна
+        kind (str): "like" або "view"
+        count (int): кількість (від'ємна — зняти, напр. лайк змінився на дизлайк)
+        pipeline (optional): MULTI-конвеєр, у який лише поставити команди (виконує викликач)
+    """
+    setting, default = TRENDING_WEIGHTS[kind]
+    bucket = getattr(settings, "BIN_TRENDING_BUCKET", 300)
+    key = TRENDING_BUCKET_KEY.format(int(time.time() // bucket))
+    ttl = max(duration for duration, _, _ in TRENDING_WINDOWS.values()) + bucket
+    if pipeline is not None:
+        pipeline.zincrby(key, getattr(settings, setting, default) * count, str(bin_id))
+        pipeline.expire(key, ttl)
+        return
+    redis_client = _get_redis()
+    try:
+        redis_client.zincrby(key, getattr(settings, setting, default) * count, str(bin_id))
+        redis_client.expire(key, ttl)
+    except Exception as e:
+        logger.warning("Failed to record %s of bin %s for trending: %s", kind, bin_id, e)
+
+
+def remove_from_leaderboards(*bin_ids):
+    """Прибирає видалені біни з `popular` і скидає закешовані top-N (одним ZREM і одним DEL)."""
+    if not bin_ids:
+        return
+    redis_client = _get_redis()
+    try:
+        redis_client.zrem(POPULAR_KEY, *[str(pk) for pk in bin_ids])
+        redis_client.delete(*[PAYLOAD_KEY.format(board) for board in BOARDS])
+    except Exception as e:
+        logger.warning("Failed to remove %s bins from leaderboards: %s", len(bin_ids), e)
+
+
+def sync_bin(bin_obj):
+    """
+    Після редагування біна: оновлює його в `popular` або прибирає (став приватним чи
+    простроченим) і скидає закешовані top-N, щоб зміни не чекали BIN_LEADERBOARD_CACHE_TTL.
+    """
+    update_popular(bin_obj.pk, bin_obj.likes_count, listed=is_listed(bin_obj.access, bin_obj.expiry_at))
+    try:
+        _get_redis().delete(*[PAYLOAD_KEY.format(board) for board in BOARDS])
+    except Exception as e:
+        logger.warning("Failed to drop cached leaderboards after editing bin %s: %s", bin_obj.pk, e)
+
+
+def _trending_entries(redis_client, window, count):
+    """Зводить кошики вікна з експоненційним згасанням і повертає top `count` (id, score)."""
+    duration, setting, default = TRENDING_WINDOWS[window]
+    half_life = getattr(settings, setting, default)
+    bucket = getattr(settings, "BIN_TRENDING_BUCKET", 300)
+    now = time.time()
+    current = int(now // bucket)
+    weights = {}
+    for index in range(current - max(duration // bucket, 1) + 1, current + 1):
+        age = max(now - (index + 0.5) * bucket, 0.0)
+        weights[TRENDING_BUCKET_KEY.format(index)] = 0.5 ** (age / half_life)
+    dest = TRENDING_KEY.format(window)
+    redis_client.zunionstore(dest, weights)
+    redis_client.expire(dest, getattr(settings, "BIN_LEADERBOARD_CACHE_TTL", 30) * 2)
+    return redis_client.zrevrange(dest, 0, count - 1, withscores=True)
+
+
+def _top_bins(board, size):
+    """
+    Повертає до `size` бінів лідерборду, від найвищих.
+
+    З ZSET береться вдвічі більше кандидатів — із запасом на видалені,
+    приватні й прострочені біни; порядок серед кандидатів уточнюється за
+    даними БД (для `popular` — як у POPULAR_ORDERING).
+    """
+    redis_client = _get_redis()
+    if board == "popular":
+        # До завершення rebuild (після деплою, скидання Redis, на FakeRedis процесу) у ZSET лише
+        # біни з голосами після старту — такий top-N неповний, тож поки що читаємо з БД
+        entries = redis_client.zrevrange(POPULAR_KEY, 0, size * 2 - 1, withscores=True) if is_popular_ready(redis_client) else []
+        if not entries:
+            return list(_listed_bins().select_related("author").order_by(*POPULAR_ORDERING)[:size])
+    else:
+        entries = _trending_entries(redis_client, board, size * 2)
+    # Нульовий або від'ємний score лишається після знятих лайків — такі біни не в trending
+    scores = {
+        int(member.decode("utf-8") if isinstance(member, bytes) else member): float(score)
+        for member, score in entries
+        if board == "popular" or float(score) > 0
+    }
+    if not scores:
+        return []
+    bins = list(_listed_bins().filter(pk__in=scores).select_related("author"))
+    if board == "popular":
+        stale = set(scores) - {b.pk for b in bins}
+        if stale:
+            redis_client.zrem(POPULAR_KEY, *[str(pk) for pk in stale])
+        bins.sort(key=lambda b: (b.likes_count, b.created_at, b.pk), reverse=True)
+    else:
+        bins.sort(key=lambda b: (scores[b.pk], b.created_at, b.pk), reverse=True)
+    return bins[:size]
+
+
+def get_leaderboard(board="popular"):
+    """
+    Повертає серіалізований top-N лідерборду (BinListSerializer), з кешу, якщо він свіжий.
+
+    Args:
+        board (str): "popular", "hour" або "day"
+
+    Returns:
+        list: дані бінів у форматі BinListSerializer
+    Raises:
+        ValueError: невідомий лідерборд
+    """
+    from .serializers import BinListSerializer
+
+    if board not in BOARDS:
+        raise ValueError(f"Unknown leaderboard '{board}'")
+    key = PAYLOAD_KEY.format(board)
+    redis_client = _get_redis()
+    try:
+        cached = redis_client.get(key)
+        if cached:
+            return json.loads(cached)
+    except Exception as e:
+        logger.warning("Failed to read cached leaderboard %s: %s", board, e)
+    size = getattr(settings, "BIN_LEADERBOARD_SIZE", 20)
+    try:
+        bins = _top_bins(board, size)
+    except Exception as e:
+        if board != "popular":
+            raise
+        logger.warning("Popular leaderboard unavailable, falling back to the database: %s", e)
+        bins = list(_listed_bins().select_related("author").order_by(*POPULAR_ORDERING)[:size])
+    data = BinListSerializer(bins, many=True).data
+    try:
+        redis_client.set(key, json.dumps(data), ex=getattr(settings, "BIN_LEADERBOARD_CACHE_TTL", 30))
+    except Exception as e:
+        logger.warning("Failed to cache leaderboard %s: %s", board, e)
+    return data
+
+
+def rebuild_popular_leaderboard(chunk_size=5000):
+    """
+    Заповнює `popular` з БД: усі публічні непрострочені біни з лайками.
+
+    Returns:
+        int: скільки бінів занесено
+    """
+    redis_client = _get_redis()
+    redis_client.delete(POPULAR_READY_KEY, POPULAR_KEY, *[PAYLOAD_KEY.format(board) for board in BOARDS])
+    rows = _listed_bins().filter(likes_count__gt=0).values_list("id", "likes_count").iterator(chunk_size=chunk_size)
+    total = 0
+    batch = {}
+    for pk, likes in rows:
+        batch[str(pk)] = likes
+        if len(batch) >= chunk_size:
+            # NX: голос, що прийшов під час rebuild, свіжіший за прочитаний тут рядок
+            redis_client.zadd(POPULAR_KEY, batch, nx=True)
+            total += len(batch)
+            batch = {}
+    if batch:
+        redis_client.zadd(POPULAR_KEY, batch, nx=True)
+        total += len(batch)
+    redis_client.set(POPULAR_READY_KEY, 1)
+    return total
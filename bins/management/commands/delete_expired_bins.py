@@ -1,15 +1,133 @@
+import random
+import signal
+import threading
+import time
+
+from django.conf import settings
 from django.core.management.base import BaseCommand
-from bins.tasks import delete_expired_bins
+from django.db import close_old_connections
+
+from bins import leaderboard
+from bins.expiry_index import backfill_expiry_index
+from bins.tasks import ReaperLeaderLock, delete_expired_bins
+from bins.redis_client import is_fallback_client
+from bins.utils import get_redis_client
 
 
 class Command(BaseCommand):
-    help = "Видаляє прострочені біни, викликаючи `bins.tasks.delete_expired_bins()`"
+    help = (
+        "Видаляє прострочені біни пачками, викликаючи `bins.tasks.delete_expired_bins()`. "
+        "З --daemon працює постійно: цикл кожні --interval секунд (± --jitter), прибирає лише "
+        "репліка-лідер (Redis-замок), на цикл — не більше --time-budget секунд."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=None, help="Бінів в одній пачці")
+        parser.add_argument("--max-chunks", type=int, default=None, help="Скільки пачок обробити за запуск")
+        parser.add_argument("--no-resume", action="store_true", help="Почати спочатку, ігноруючи checkpoint")
+        parser.add_argument("--source", choices=["index", "scan"], default=None,
+                            help="Звідки брати кандидатів: Redis ZSET спливань або скан таблиці (BIN_REAPER_SOURCE)")
+        parser.add_argument("--backfill-index", action="store_true",
+                            help="Занести в Redis ZSET спливань усі біни з expiry_at і вийти")
+        parser.add_argument("--daemon", action="store_true", help="Працювати постійно, циклами")
+        parser.add_argument("--interval", type=float, default=None, help="Секунд між циклами (BIN_REAPER_INTERVAL)")
+        parser.add_argument("--jitter", type=float, default=None, help="Випадкове відхилення інтервалу, секунд (BIN_REAPER_JITTER)")
+        parser.add_argument("--time-budget", type=float, default=None, help="Максимум секунд на цикл (BIN_REAPER_TIME_BUDGET)")
+        parser.add_argument("--scan-interval", type=float, default=None,
+                            help="Секунд між звірочними проходами скану таблиці в режимі index (BIN_REAPER_SCAN_INTERVAL)")
 
     def handle(self, *args, **options):
+        if options["backfill_index"]:
+            total = backfill_expiry_index()
+            self.stdout.write(self.style.SUCCESS(f"Expiry index backfilled: {total} bins"))
+            return
+        if options["daemon"]:
+            return self.run_daemon(options)
         try:
-            result = delete_expired_bins()
-            # delete_expired_bins() повертає True/False або None — просто повідомимо про виконання
-            self.stdout.write(self.style.SUCCESS('delete_expired_bins executed successfully'))
+            stats = delete_expired_bins(
+                chunk_size=options["chunk_size"],
+                max_chunks=options["max_chunks"],
+                resume=not options["no_resume"],
+                time_budget=options["time_budget"],
+                source=options["source"],
+            )
+            self.report(stats)
         except Exception as e:
             self.stderr.write(f'Error running delete_expired_bins: {e}')
             raise
+
+    def report(self, stats):
+        self.stdout.write(self.style.SUCCESS(
+            f'delete_expired_bins ({stats["source"]}): {stats["deleted"]} deleted, {stats["failed"]} failed, '
+            f'{stats["chunks"]} chunks in {stats["elapsed"]}s ({stats["bins_per_sec"]} bins/s)'
+        ))
+
+    def run_daemon(self, options):
+        interval = options["interval"] if options["interval"] is not None else getattr(settings, "BIN_REAPER_INTERVAL", 300)
+        jitter = options["jitter"] if options["jitter"] is not None else getattr(settings, "BIN_REAPER_JITTER", 30)
+        budget = options["time_budget"] if options["time_budget"] is not None else getattr(settings, "BIN_REAPER_TIME_BUDGET", 60)
+        scan_interval = (
+            options["scan_interval"] if options["scan_interval"] is not None
+            else getattr(settings, "BIN_REAPER_SCAN_INTERVAL", 3600)
+        )
+        source = options["source"] or getattr(settings, "BIN_REAPER_SOURCE", "index")
+        # Біни, яких немає в ZSET (Redis скинуто, сигнал не спрацював), знаходить лише скан —
+        # у режимі index він іде рідко і лише на залишок бюджету циклу, продовжуючись з checkpoint
+        next_scan = time.monotonic() + scan_interval if source == "index" else None
+
+        stop_event = threading.Event()
+
+        def request_stop(signum, frame):
+            self.stdout.write(f"Received signal {signum}, finishing current chunk and stopping")
+            stop_event.set()
+
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
+
+        # Замок живе довше за цикл, тож лідер утримує його між циклами, а після падіння лідера його бере інша репліка
+        leader = ReaperLeaderLock(None, ttl=interval + jitter + budget)
+        self.stdout.write(f"Reaper daemon started: interval={interval}s jitter={jitter}s budget={budget}s")
+        try:
+            while not stop_event.is_set():
+                # Клієнт — на кожен цикл: circuit breaker міг замкнутися або розімкнутися
+                redis_client = get_redis_client()
+                if is_fallback_client(redis_client):
+                    # FakeRedis процесу не спільний — на ньому лідером стала б кожна репліка
+                    self.stdout.write("Redis unavailable, not taking the reaper lock this cycle")
+                elif leader.acquire(redis_client):
+                    try:
+                        close_old_connections()
+                        if not leaderboard.is_popular_ready(redis_client):
+                            # Після деплою або скидання Redis заповнюємо `popular`, поки API читає з БД
+                            total = leaderboard.rebuild_popular_leaderboard()
+                            self.stdout.write(f"Popular leaderboard rebuilt: {total} bins")
+                        stats = delete_expired_bins(
+                            chunk_size=options["chunk_size"],
+                            resume=not options["no_resume"],
+                            time_budget=budget,
+                            stop_event=stop_event,
+                            source=source,
+                        )
+                        self.report(stats)
+                        remaining = budget - stats["elapsed"]
+                        if next_scan is not None and time.monotonic() >= next_scan and remaining > 0:
+                            scan_stats = delete_expired_bins(
+                                chunk_size=options["chunk_size"],
+                                time_budget=remaining,
+                                stop_event=stop_event,
+                                source="scan",
+                            )
+                            self.report(scan_stats)
+                            if scan_stats["completed"]:
+                                next_scan = time.monotonic() + scan_interval
+                    except Exception as e:
+                        # Одна невдала ітерація не зупиняє демон
+                        self.stderr.write(f'Error running delete_expired_bins: {e}')
+                else:
+                    self.stdout.write("Another replica holds the reaper lock, skipping cycle")
+                stop_event.wait(max(0.0, interval + random.uniform(-jitter, jitter)))
+        finally:
+            if leader.redis_client is not None and not is_fallback_client(leader.redis_client):
+                leader.release()
+            close_old_connections()
+        self.stdout.write("Reaper daemon stopped")
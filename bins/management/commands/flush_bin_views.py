@@ -0,0 +1,61 @@
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from bins.view_tracking import flush_pending_views
+
+
+class Command(BaseCommand):
+    help = (
+        "Переносить накопичені в Redis перегляди бінів у БД (`bins.view_tracking.flush_pending_views()`). "
+        "З --daemon працює постійно: прохід кожні --interval секунд."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=None, help="Записів черги на одну транзакцію")
+        parser.add_argument("--daemon", action="store_true", help="Працювати постійно, циклами")
+        parser.add_argument("--interval", type=float, default=None, help="Секунд між проходами (BIN_VIEWS_FLUSH_INTERVAL)")
+
+    def handle(self, *args, **options):
+        if options["daemon"]:
+            return self.run_daemon(options)
+        try:
+            self.report(flush_pending_views(batch_size=options["batch_size"]))
+        except Exception as e:
+            self.stderr.write(f'Error running flush_bin_views: {e}')
+            raise
+
+    def report(self, stats):
+        self.stdout.write(self.style.SUCCESS(
+            f'flush_bin_views: {stats["views"]} views for {stats["bins"]} bins, {stats["dropped"]} dropped'
+        ))
+
+    def run_daemon(self, options):
+        interval = options["interval"] if options["interval"] is not None else getattr(settings, "BIN_VIEWS_FLUSH_INTERVAL", 10)
+        stop_event = threading.Event()
+
+        def request_stop(signum, frame):
+            self.stdout.write(f"Received signal {signum}, finishing current batch and stopping")
+            stop_event.set()
+
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
+
+        self.stdout.write(f"Views flush daemon started: interval={interval}s")
+        try:
+            while not stop_event.is_set():
+                try:
+                    close_old_connections()
+                    stats = flush_pending_views(batch_size=options["batch_size"])
+                    if stats["views"] or stats["dropped"]:
+                        self.report(stats)
+                except Exception as e:
+                    # Пачка лишилась у processing-списку — наступний прохід її повторить
+                    self.stderr.write(f'Error running flush_bin_views: {e}')
+                stop_event.wait(interval)
+        finally:
+            close_old_connections()
+        self.stdout.write("Views flush daemon stopped")
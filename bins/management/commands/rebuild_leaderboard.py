@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from bins.leaderboard import rebuild_popular_leaderboard
+
+
+class Command(BaseCommand):
+    help = "Заповнює Redis-лідерборд популярних бінів з БД (`bins.leaderboard.rebuild_popular_leaderboard()`)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=5000, help="Бінів на один ZADD")
+
+    def handle(self, *args, **options):
+        try:
+            total = rebuild_popular_leaderboard(chunk_size=options["chunk_size"])
+            self.stdout.write(self.style.SUCCESS(f"rebuild_leaderboard: {total} bins"))
+        except Exception as e:
+            self.stderr.write(f'Error running rebuild_leaderboard: {e}')
+            raise
@@ -0,0 +1,28 @@
+import logging
+
+from . import storage
+
+logger = logging.getLogger(__name__)
+
+
+class StorageRoundTripsMiddleware:
+    """
+    Рахує мережеві звернення до сховища контенту (R2) за один HTTP-запит.
+
+    Значення віддається у заголовку `X-Storage-Round-Trips` і пишеться у лог,
+    щоб регресії на кшталт зайвого HEAD перед GET було видно одразу.
+    """
+
+    header_name = "X-Storage-Round-Trips"
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        storage.reset_round_trips()
+        response = self.get_response(request)
+        round_trips = storage.get_round_trips()
+        response[self.header_name] = str(round_trips)
+        if round_trips:
+            logger.debug("%s %s: %s storage round trip(s)", request.method, request.path, round_trips)
+        return response
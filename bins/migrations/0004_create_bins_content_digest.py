@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 09:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bins', '0003_alter_create_bins_expiry_alter_create_bins_language_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='create_bins',
+            name='content_digest',
+            field=models.CharField(blank=True, default='', help_text='SHA-256 контенту у сховищі (для ETag без звернення до R2)', max_length=64, verbose_name='Дайджест вмісту'),
+        ),
+    ]
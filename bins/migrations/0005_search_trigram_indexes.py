@@ -0,0 +1,35 @@
+from django.db import migrations
+
+TRIGRAM_INDEXES = (
+    ("create_bin_title_trgm", "title"),
+    ("create_bin_tags_trgm", "tags"),
+)
+
+
+def create_trigram_indexes(apps, schema_editor):
+    # pg_trgm і GIN є лише у PostgreSQL; на SQLite пошук іде через icontains
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for name, column in TRIGRAM_INDEXES:
+        schema_editor.execute(
+            f"CREATE INDEX IF NOT EXISTS {name} ON create_bin USING gin ({column} gin_trgm_ops)"
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    for name, _ in TRIGRAM_INDEXES:
+        schema_editor.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bins', '0004_create_bins_content_digest'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2 on 2026-10-18 10:06
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bins', '0006_viewbin_viewed_at_default'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='create_bins',
+            index=models.Index(fields=['expiry_at', 'id'], name='create_bin_expiry_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2 on 2026-10-18 10:13
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bins', '0007_create_bin_expiry_idx'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='create_bins',
+            index=models.Index(fields=['-created_at', '-id'], name='create_bin_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='create_bins',
+            index=models.Index(fields=['author', '-created_at', '-id'], name='create_bin_author_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='create_bins',
+            index=models.Index(condition=models.Q(('access', 'public')), fields=['-created_at', '-id'], name='create_bin_public_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='create_bins',
+            index=models.Index(condition=models.Q(('access', 'public')), fields=['language', '-created_at', '-id'], name='create_bin_public_lang_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='create_bins',
+            index=models.Index(condition=models.Q(('access', 'public')), fields=['category', '-created_at', '-id'], name='create_bin_public_cat_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='create_bins',
+            index=models.Index(condition=models.Q(('access', 'public')), fields=['-likes_count', '-created_at', '-id'], name='create_bin_public_popular_idx'),
+        ),
+    ]
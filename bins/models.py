@@ -24,11 +24,25 @@ class Create_Bins(models.Model):
     dislikes_count = models.PositiveIntegerField(default=0, verbose_name="Кількість дизлайків")
     views_count = models.PositiveIntegerField(default=0, verbose_name="Кількість переглядів")
     hash = models.CharField(max_length=64, unique=True, blank=True, null=True, verbose_name="Hash", help_text="SHA-256 хеш вмісту для унікальності")
+    content_digest = models.CharField(max_length=64, blank=True, default="", verbose_name="Дайджест вмісту", help_text="SHA-256 контенту у сховищі (для ETag без звернення до R2)")
 
     class Meta:
         db_table = 'create_bin'
         verbose_name = "Bin"
         verbose_name_plural = "Bins"
+        indexes = [
+            # Keyset-обхід прострочених бінів reaper'ом (bins/tasks.py)
+            models.Index(fields=["expiry_at", "id"], name="create_bin_expiry_idx"),
+            # Курсорна пагінація списків (bins/pagination.py): ключ завжди закінчується на id
+            models.Index(fields=["-created_at", "-id"], name="create_bin_created_idx"),
+            models.Index(fields=["author", "-created_at", "-id"], name="create_bin_author_created_idx"),
+            # Публічні списки (PublicBinsListAPIView, PopularBinsListAPIView, пошук): часткові
+            # індекси лише по access='public' — менші за повні, і сортування береться з них
+            models.Index(fields=["-created_at", "-id"], name="create_bin_public_recent_idx", condition=models.Q(access="public")),
+            models.Index(fields=["language", "-created_at", "-id"], name="create_bin_public_lang_idx", condition=models.Q(access="public")),
+            models.Index(fields=["category", "-created_at", "-id"], name="create_bin_public_cat_idx", condition=models.Q(access="public")),
+            models.Index(fields=["-likes_count", "-created_at", "-id"], name="create_bin_public_popular_idx", condition=models.Q(access="public")),
+        ]
 
     # Повертає рядкове представлення об'єкта (назва або частина вмісту)
     def __str__(self):
@@ -43,7 +57,7 @@ class ViewBin(models.Model):
     bin = models.ForeignKey(Create_Bins, on_delete=models.CASCADE, related_name="views")  # Зв'язок з біном
     user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)  # Користувач, який переглянув
     ip_address = models.CharField(max_length=45, blank=True)  # IP-адреса переглядача
-    viewed_at = models.DateTimeField(auto_now_add=True)  # Дата перегляду
+    viewed_at = models.DateTimeField(default=timezone.now)  # Дата перегляду (з черги переглядів, а не час запису)
     user_agent = models.CharField(max_length=256, blank=True)  # User-Agent браузера
     session_key = models.CharField(max_length=40, blank=True)  # Сесія для унікальності перегляду
 
@@ -0,0 +1,224 @@
+"""
+Пагінація списків бінів.
+
+`BinsPagination` — посторінкова (PageNumberPagination): COUNT(*) по
+відфільтрованому набору і OFFSET, який дорожчає з глибиною сторінки.
+
+`KeysetPagination` — опційний курсорний режим (`?pagination=cursor` або
+`BIN_LIST_PAGINATION = "cursor"`). Курсор — закодовані значення ключа
+сортування крайнього рядка сторінки; наступна сторінка — умова
+`(created_at, id) < (...)`, яку обслуговує композитний індекс, тож глибокі
+сторінки коштують як перша, а COUNT не потрібен. Ключ завжди закінчується
+на `id`, тому він унікальний: рядки з однаковим created_at чи likes_count
+не губляться і не повторюються між сторінками.
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import F, Q
+from django.db.models.fields.tuple_lookups import Tuple, TupleGreaterThan, TupleLessThan
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+# Ключі сортування для курсорного режиму (індекси — у Create_Bins.Meta)
+RECENT_ORDERING = ("-created_at", "-id")
+POPULAR_ORDERING = ("-likes_count", "-created_at", "-id")
+SEARCH_ORDERING = ("-search_rank", "-created_at", "-id")
+COMMENTS_ORDERING = ("-created_at", "-id")
+
+
+class InvalidCursor(ValueError):
+    """Курсор не розбирається або не відповідає ключу сортування."""
+
+
+class BinsPagination(PageNumberPagination):
+    """Пагінація для списків бінів."""
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+def use_keyset(params):
+    """
+    Чи обрано курсорний режим для запиту.
+
+    Args:
+        params: query-параметри (request.GET / request.query_params)
+    """
+    if "cursor" in params:
+        return True
+    return (params.get("pagination") or getattr(settings, "BIN_LIST_PAGINATION", "page")) == "cursor"
+
+
+def _flip(name):
+    return name[1:] if name.startswith("-") else f"-{name}"
+
+
+def encode_cursor(values, reverse=False):
+    """Кодує позицію (значення ключа сортування) у непрозорий рядок для URL."""
+    payload = {"v": [value.isoformat() if isinstance(value, datetime) else value for value in values]}
+    if reverse:
+        payload["r"] = 1
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor, model, ordering):
+    """
+    Розбирає курсор назад у значення ключа сортування.
+
+    Returns:
+        tuple: (values, reverse)
+    Raises:
+        InvalidCursor: курсор пошкоджений або іншої довжини, ніж ordering
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        values = payload["v"]
+    except (binascii.Error, ValueError, TypeError, KeyError) as e:
+        raise InvalidCursor("Invalid cursor") from e
+    if not isinstance(values, list) or len(values) != len(ordering):
+        raise InvalidCursor("Invalid cursor")
+    parsed = []
+    for name, value in zip(ordering, values):
+        try:
+            field = model._meta.get_field(name.lstrip("-"))
+        except FieldDoesNotExist:
+            # Анотація (search_rank) — число з JSON як є
+            parsed.append(value)
+            continue
+        try:
+            parsed.append(field.to_python(value))
+        except ValidationError as e:
+            raise InvalidCursor("Invalid cursor") from e
+    return parsed, bool(payload.get("r"))
+
+
+def keyset_filter(queryset, ordering, values):
+    """
+    Лишає рядки строго після позиції `values` у порядку `ordering`.
+
+    Якщо всі поля сортуються в один бік, це порівняння рядків
+    `(a, b, id) < (x, y, z)` (tuple lookups Django), яке PostgreSQL віддає
+    індексу як одну межу діапазону. Для змішаних напрямків — розгорнутий
+    `a < x OR (a = x AND b < y) OR ...`. В обох випадках додається `a <= x`,
+    щоб сканування індексу починалось з курсора навіть там, де планувальник
+    не розбирає OR чи порівняння рядків (SQLite, анотації).
+    """
+    first = ordering[0].lstrip("-")
+    bound = Q(**{f"{first}__{'lte' if ordering[0].startswith('-') else 'gte'}": values[0]})
+    descending = {name.startswith("-") for name in ordering}
+    if len(descending) == 1:
+        lookup = TupleLessThan if descending.pop() else TupleGreaterThan
+        columns = Tuple(*[F(name.lstrip("-")) for name in ordering])
+        return queryset.filter(bound, lookup(columns, tuple(values)))
+    condition = Q()
+    prefix = {}
+    for name, value in zip(ordering, values):
+        field = name.lstrip("-")
+        lookup = "lt" if name.startswith("-") else "gt"
+        condition |= Q(**prefix, **{f"{field}__{lookup}": value})
+        prefix[field] = value
+    return queryset.filter(bound, condition)
+
+
+def paginate_keyset(queryset, ordering, page_size, cursor=None):
+    """
+    Повертає одну сторінку за курсором без COUNT і OFFSET.
+
+    Args:
+        queryset (QuerySet): відфільтрований набір (власне сортування замінюється на ordering)
+        ordering (tuple): ключ сортування, останнє поле — унікальне (id)
+        page_size (int): рядків на сторінці
+        cursor (str, optional): курсор з попередньої відповіді; None — перша сторінка
+
+    Returns:
+        tuple: (items, next_cursor, previous_cursor); відсутній напрямок — None
+    Raises:
+        InvalidCursor: курсор не розбирається
+    """
+    ordering = tuple(ordering)
+    reverse = False
+    if cursor:
+        values, reverse = decode_cursor(cursor, queryset.model, ordering)
+        direction = tuple(_flip(name) for name in ordering) if reverse else ordering
+        queryset = keyset_filter(queryset, direction, values)
+    else:
+        direction = ordering
+    # Зайвий рядок показує, чи є ще сторінка в цьому напрямку
+    items = list(queryset.order_by(*direction)[:page_size + 1])
+    has_more = len(items) > page_size
+    items = items[:page_size]
+    if reverse:
+        items.reverse()
+    if not items:
+        return items, None, None
+
+    def position(obj):
+        return [getattr(obj, name.lstrip("-")) for name in ordering]
+
+    if reverse:
+        next_cursor = encode_cursor(position(items[-1]))
+        previous_cursor = encode_cursor(position(items[0]), reverse=True) if has_more else None
+    else:
+        next_cursor = encode_cursor(position(items[-1])) if has_more else None
+        previous_cursor = encode_cursor(position(items[0]), reverse=True) if cursor else None
+    return items, next_cursor, previous_cursor
+
+
+class KeysetPagination(BasePagination):
+    """DRF-обгортка над `paginate_keyset`: відповідь {"next", "previous", "results"}."""
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+
+    def __init__(self, ordering=RECENT_ORDERING):
+        self.ordering = ordering
+        self.request = None
+        self.next_cursor = None
+        self.previous_cursor = None
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(size, self.max_page_size) if size > 0 else self.page_size
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        try:
+            items, self.next_cursor, self.previous_cursor = paginate_keyset(
+                queryset, self.ordering, self.get_page_size(request),
+                request.query_params.get(self.cursor_query_param),
+            )
+        except InvalidCursor:
+            raise NotFound("Invalid cursor")
+        return items
+
+    def _link(self, cursor):
+        if cursor is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            "next": self._link(self.next_cursor),
+            "previous": self._link(self.previous_cursor),
+            "results": data,
+        })
+
+
+def get_bins_paginator(request, ordering=RECENT_ORDERING):
+    """Повертає пагінатор списку бінів: курсорний, якщо його обрано, інакше посторінковий."""
+    if use_keyset(request.query_params):
+        return KeysetPagination(ordering)
+    return BinsPagination()
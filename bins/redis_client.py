@@ -0,0 +1,509 @@
+"""
+Спільний для процесу Redis-клієнт з пулом з'єднань і circuit breaker.
+
+Вибір бекенда (Upstash REST → redis-py → in-memory FakeRedis) робиться один
+раз на процес, а не на кожен виклик `get_redis_client()`. Живучість перевіряє
+фоновий потік: якщо ping не проходить, circuit "розмикається" і на час
+`REDIS_CIRCUIT_COOLDOWN` клієнтам віддається FakeRedis; після cool-down потік
+пробує ping знову і при успіху повертає основний клієнт. Запити користувачів
+ніколи не чекають на ping.
+"""
+import logging
+import os
+import threading
+import time
+
+import redis
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class FakeRedis:
+    """Мінімальна in-memory заміна Redis для локальної розробки і тестів."""
+
+    def __init__(self):
+        # Скрипти (RedisScript) емулюються під цим замком — так само атомарно, як EVAL
+        self.lock = threading.RLock()
+        self.store = {}
+        self.lists = {}
+        self.sets = {}
+        self.zsets = {}
+        self.hashes = {}
+        self.expires = {}
+
+    def _expire_if_needed(self, name):
+        deadline = self.expires.get(name)
+        if deadline is not None and deadline <= time.monotonic():
+            self.store.pop(name, None)
+            self.sets.pop(name, None)
+            self.zsets.pop(name, None)
+            self.hashes.pop(name, None)
+            self.expires.pop(name, None)
+
+    def setex(self, name, time, value):
+        return self.set(name, value, ex=time)
+
+    def get(self, name):
+        self._expire_if_needed(name)
+        return self.store.get(name)
+
+    def set(self, name, value, ex=None, px=None, nx=False):
+        self._expire_if_needed(name)
+        if nx and name in self.store:
+            return None
+        if isinstance(value, str):
+            value = value.encode("utf-8")
+        self.store[name] = value
+        self.expires.pop(name, None)
+        ttl = ex if ex is not None else (px / 1000 if px is not None else None)
+        if ttl is not None:
+            self.expires[name] = time.monotonic() + ttl
+        return True
+
+    def delete(self, *names):
+        for n in names:
+            self.store.pop(n, None)
+            self.lists.pop(n, None)
+            self.sets.pop(n, None)
+            self.zsets.pop(n, None)
+            self.hashes.pop(n, None)
+            self.expires.pop(n, None)
+
+    def mget(self, keys, *args):
+        if isinstance(keys, (str, bytes)):
+            keys = [keys]
+        return [self.get(k) for k in [*keys, *args]]
+
+    def incr(self, name, amount=1):
+        return self.incrby(name, amount)
+
+    def incrby(self, name, amount=1):
+        self._expire_if_needed(name)
+        value = int(self.store.get(name, 0)) + amount
+        self.store[name] = str(value).encode("utf-8")
+        return value
+
+    def decrby(self, name, amount=1):
+        return self.incrby(name, -amount)
+
+    def expire(self, name, seconds):
+        if name in self.store or name in self.sets or name in self.zsets or name in self.hashes:
+            self.expires[name] = time.monotonic() + seconds
+            return True
+        return False
+
+    def sadd(self, name, *values):
+        self._expire_if_needed(name)
+        members = self.sets.setdefault(name, set())
+        before = len(members)
+        members.update(v.encode("utf-8") if isinstance(v, str) else v for v in values)
+        return len(members) - before
+
+    def sismember(self, name, value):
+        self._expire_if_needed(name)
+        if isinstance(value, str):
+            value = value.encode("utf-8")
+        return value in self.sets.get(name, set())
+
+    @staticmethod
+    def _member(value):
+        return value.encode("utf-8") if isinstance(value, str) else value
+
+    def zadd(self, name, mapping, nx=False):
+        zset = self.zsets.setdefault(name, {})
+        added = 0
+        for member, score in mapping.items():
+            member = self._member(member)
+            if nx and member in zset:
+                continue
+            added += member not in zset
+            zset[member] = float(score)
+        return added
+
+    def zrem(self, name, *members):
+        zset = self.zsets.get(name, {})
+        return sum(zset.pop(self._member(m), None) is not None for m in members)
+
+    def zscore(self, name, member):
+        return self.zsets.get(name, {}).get(self._member(member))
+
+    def zcard(self, name):
+        return len(self.zsets.get(name, {}))
+
+    def zincrby(self, name, amount, value):
+        self._expire_if_needed(name)
+        zset = self.zsets.setdefault(name, {})
+        member = self._member(value)
+        zset[member] = zset.get(member, 0.0) + float(amount)
+        return zset[member]
+
+    def zrevrange(self, name, start, end, withscores=False):
+        self._expire_if_needed(name)
+        items = sorted(((score, member) for member, score in self.zsets.get(name, {}).items()), reverse=True)
+        items = items[start:None if end == -1 else end + 1]
+        return [(member, score) for score, member in items] if withscores else [member for _, member in items]
+
+    def zunionstore(self, dest, keys, aggregate=None):
+        weights = keys if isinstance(keys, dict) else {key: 1 for key in keys}
+        result = {}
+        for key, weight in weights.items():
+            self._expire_if_needed(key)
+            for member, score in self.zsets.get(key, {}).items():
+                result[member] = result.get(member, 0.0) + score * weight
+        self.delete(dest)
+        if result:
+            self.zsets[dest] = result
+        return len(result)
+
+    def zrangebyscore(self, name, min, max, start=None, num=None, withscores=False):
+        low = float("-inf") if min in ("-inf", b"-inf") else float(min)
+        high = float("inf") if max in ("+inf", b"+inf") else float(max)
+        items = sorted(
+            ((score, member) for member, score in self.zsets.get(name, {}).items() if low <= score <= high)
+        )
+        if start is not None and num is not None:
+            items = items[start:start + num]
+        return [(member, score) for score, member in items] if withscores else [member for _, member in items]
+
+    def hset(self, name, key=None, value=None, mapping=None):
+        self._expire_if_needed(name)
+        fields = dict(mapping or {})
+        if key is not None:
+            fields[key] = value
+        hash_ = self.hashes.setdefault(name, {})
+        added = sum(1 for field in fields if self._member(field) not in hash_)
+        for field, field_value in fields.items():
+            hash_[self._member(field)] = self._member(str(field_value))
+        return added
+
+    def hgetall(self, name):
+        self._expire_if_needed(name)
+        return dict(self.hashes.get(name, {}))
+
+    def hincrby(self, name, key, amount=1):
+        self._expire_if_needed(name)
+        hash_ = self.hashes.setdefault(name, {})
+        value = int(hash_.get(self._member(key), 0)) + amount
+        hash_[self._member(key)] = str(value).encode("utf-8")
+        return value
+
+    # HyperLogLog емулюється точною множиною
+    def pfadd(self, name, *values):
+        return 1 if self.sadd(name, *values) else 0
+
+    def pfcount(self, *names):
+        union = set()
+        for name in names:
+            self._expire_if_needed(name)
+            union |= self.sets.get(name, set())
+        return len(union)
+
+    def lpop(self, name, count=None):
+        lst = self.lists.get(name, [])
+        if count is not None:
+            if not lst:
+                return None
+            popped, self.lists[name] = lst[:count], lst[count:]
+            return popped
+        if lst:
+            return lst.pop(0)
+        return None
+
+    def lpush(self, name, *values):
+        lst = self.lists.setdefault(name, [])
+        for value in values:
+            lst.insert(0, self._member(value))
+        return len(lst)
+
+    def rpush(self, name, *values):
+        lst = self.lists.setdefault(name, [])
+        lst.extend(v.encode("utf-8") if isinstance(v, str) else v for v in values)
+        return len(lst)
+
+    def llen(self, name):
+        return len(self.lists.get(name, []))
+
+    def lrange(self, name, start, end):
+        lst = self.lists.get(name, [])
+        return lst[start:] if end == -1 else lst[start:end + 1]
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    # Для сумісності з деякими викликами redis
+    def ping(self):
+        return True
+
+
+class FakePipeline:
+    """Черга команд FakeRedis; `execute()` виконує їх разом під замком клієнта, як MULTI/EXEC."""
+
+    def __init__(self, client):
+        self._client = client
+        self._calls = []
+
+    def __getattr__(self, name):
+        method = getattr(self._client, name)
+
+        def queue(*args, **kwargs):
+            self._calls.append((method, args, kwargs))
+            return self
+
+        return queue
+
+    def run_script(self, emulate, keys, args):
+        """Ставить у чергу Python-еквівалент Lua-скрипта (RedisScript у конвеєрі)."""
+        self._calls.append((emulate, (self._client, keys, args), {}))
+        return self
+
+    def execute(self):
+        calls, self._calls = self._calls, []
+        with self._client.lock:
+            return [method(*args, **kwargs) for method, args, kwargs in calls]
+
+
+class _UpstashTransaction:
+    """MULTI-конвеєр Upstash з інтерфейсом redis-py (`execute()` замість `exec()`)."""
+
+    def __init__(self, transaction):
+        self._transaction = transaction
+
+    def __getattr__(self, name):
+        return getattr(self._transaction, name)
+
+    def execute(self):
+        return self._transaction.exec()
+
+
+def atomic_pipeline(client):
+    """
+    Повертає MULTI/EXEC-конвеєр клієнта: команди ставляться в чергу і застосовуються
+    разом на `execute()` — або всі, або жодна.
+    """
+    if type(client).__module__.startswith("upstash_redis"):
+        return _UpstashTransaction(client.multi())
+    return client.pipeline(transaction=True)
+
+
+def is_fallback_client(client):
+    """Чи це in-memory FakeRedis процесу (circuit розімкнутий), а не спільний Redis."""
+    return isinstance(client, FakeRedis)
+
+
+class RedisScript:
+    """
+    Lua-скрипт, що виконується атомарно на будь-якому бекенді.
+
+    redis-py — EVAL з numkeys, Upstash REST — eval(script, keys, args),
+    FakeRedis — Python-еквівалент `emulate(client, keys, args)` під замком клієнта.
+    Замість клієнта можна передати конвеєр `atomic_pipeline()` — тоді скрипт лише
+    ставиться в чергу MULTI і виконується на `execute()`.
+    """
+
+    def __init__(self, lua, emulate):
+        self.lua = lua
+        self.emulate = emulate
+
+    def __call__(self, client, keys=(), args=()):
+        keys, args = list(keys), list(args)
+        if isinstance(client, FakeRedis):
+            with client.lock:
+                return self.emulate(client, keys, args)
+        if isinstance(client, FakePipeline):
+            return client.run_script(self.emulate, keys, args)
+        if isinstance(client, _UpstashTransaction) or type(client).__module__.startswith("upstash_redis"):
+            return client.eval(self.lua, keys=keys, args=args)
+        return client.eval(self.lua, len(keys), *keys, *args)
+
+
+def _decode_value(value):
+    return value.decode("utf-8") if isinstance(value, bytes) else value
+
+
+def _renew_if_holder(client, keys, args):
+    if _decode_value(client.get(keys[0])) != args[0]:
+        return 0
+    return 1 if client.expire(keys[0], int(args[1]) / 1000) else 0
+
+
+def _delete_if_holder(client, keys, args):
+    if _decode_value(client.get(keys[0])) != args[0]:
+        return 0
+    client.delete(keys[0])
+    return 1
+
+
+# Порівняння токена і продовження/зняття — одним скриптом: між GET і PEXPIRE/DEL
+# замок міг спливти й дістатися іншому власнику
+RENEW_LOCK = RedisScript(
+    "if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('PEXPIRE', KEYS[1], ARGV[2]) end return 0",
+    _renew_if_holder,
+)
+RELEASE_LOCK = RedisScript(
+    "if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) end return 0",
+    _delete_if_holder,
+)
+
+
+class RedisClientManager:
+    """
+    Тримає обраний Redis-клієнт процесу і стан circuit breaker.
+
+    Стани:
+        closed — основний клієнт відповідає, віддаємо його
+        open — основний клієнт не відповідав; віддаємо FakeRedis, доки фоновий
+               ping після cool-down (`retry_at`) не пройде успішно
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._primary = None
+        self._backend = None
+        self._fallback = FakeRedis()
+        self._open = False
+        self._retry_at = 0.0
+        self._failures = 0
+        self._health_thread = None
+
+    # --- вибір бекенда ---
+
+    def _build_primary(self):
+        """Повертає (client, backend_name) згідно з налаштуваннями, без мережевих викликів."""
+        upstash_client = getattr(settings, "UPSTASH_REDIS_CLIENT", None)
+        if upstash_client:
+            return upstash_client, "upstash"
+
+        if getattr(settings, "UPSTASH_REDIS_REST_URL", None) and getattr(settings, "UPSTASH_REDIS_REST_TOKEN", None):
+            try:
+                from upstash_redis import Redis as UpstashRedisClient
+
+                client = UpstashRedisClient(
+                    url=settings.UPSTASH_REDIS_REST_URL,
+                    token=settings.UPSTASH_REDIS_REST_TOKEN,
+                )
+                return client, "upstash"
+            except Exception as e:
+                logger.warning("Upstash client init failed (%s), will try standard Redis: %s", type(e).__name__, e)
+
+        pool = redis.ConnectionPool(
+            host=getattr(settings, "REDIS_HOST", "localhost"),
+            port=getattr(settings, "REDIS_PORT", 6379),
+            db=getattr(settings, "REDIS_DB", 0),
+            max_connections=getattr(settings, "REDIS_MAX_CONNECTIONS", 50),
+            socket_connect_timeout=getattr(settings, "REDIS_SOCKET_CONNECT_TIMEOUT", 1),
+            socket_timeout=getattr(settings, "REDIS_SOCKET_TIMEOUT", 2),
+            socket_keepalive=True,
+            health_check_interval=30,
+        )
+        return redis.Redis(connection_pool=pool), "redis"
+
+    def _initialize(self):
+        self._primary, self._backend = self._build_primary()
+        # Єдиний синхронний ping — при першому зверненні процесу
+        if not self._ping():
+            self._trip()
+        self._start_health_thread()
+
+    def _ping(self):
+        try:
+            self._primary.ping()
+            return True
+        except Exception as e:
+            logger.warning("Redis (%s) unavailable: %s", self._backend, e)
+            return False
+
+    # --- circuit breaker ---
+
+    def _trip(self):
+        cooldown = getattr(settings, "REDIS_CIRCUIT_COOLDOWN", 30)
+        self._failures += 1
+        if not self._open:
+            logger.warning("Redis circuit opened for %ss, falling back to in-memory FakeRedis", cooldown)
+        self._open = True
+        self._retry_at = time.monotonic() + cooldown
+
+    def _close(self):
+        if self._open:
+            logger.info("Redis (%s) is back, circuit closed", self._backend)
+        self._open = False
+        self._failures = 0
+
+    def is_open(self):
+        return self._open
+
+    def _health_loop(self):
+        interval = getattr(settings, "REDIS_HEALTH_CHECK_INTERVAL", 5)
+        while self._pid == os.getpid():
+            time.sleep(interval)
+            if self._primary is None:
+                continue
+            if self._open and time.monotonic() < self._retry_at:
+                # Cool-down ще триває — основний клієнт не чіпаємо
+                continue
+            if self._ping():
+                self._close()
+            else:
+                self._trip()
+
+    def _start_health_thread(self):
+        if self._health_thread is not None and self._health_thread.is_alive():
+            return
+        self._health_thread = threading.Thread(
+            target=self._health_loop, name="redis-health-check", daemon=True
+        )
+        self._health_thread.start()
+
+    # --- публічний API ---
+
+    def get_client(self):
+        if self._primary is None or self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    # Після fork: з'єднання і потік перевірки належать батьківському процесу
+                    self._primary = None
+                    self._health_thread = None
+                    self._pid = os.getpid()
+                if self._primary is None:
+                    self._initialize()
+        if self._open:
+            return self._fallback
+        return self._primary
+
+    def reset(self):
+        with self._lock:
+            self._primary = None
+            self._backend = None
+            self._fallback = FakeRedis()
+            self._open = False
+            self._retry_at = 0.0
+            self._failures = 0
+
+    def status(self):
+        return {
+            "backend": self._backend,
+            "circuit_open": self.is_open(),
+            "failures": self._failures,
+        }
+
+
+_manager = RedisClientManager()
+
+
+def get_redis_client():
+    """
+    Повертає Redis-клієнт процесу: основний (Upstash або redis-py з пулом) або FakeRedis,
+    якщо circuit breaker розімкнутий.
+    """
+    return _manager.get_client()
+
+
+def reset_redis_client():
+    """Забуває обраний клієнт і стан circuit breaker (для тестів і зміни налаштувань)."""
+    _manager.reset()
+
+
+def get_redis_status():
+    """Повертає {"backend", "circuit_open", "failures"} для моніторингу."""
+    return _manager.status()
@@ -0,0 +1,144 @@
+"""
+Пошук бінів на боці БД з ранжуванням.
+
+PostgreSQL: триграмна схожість (`pg_trgm`) по title і tags; фільтр іде
+операторами `%>` / ILIKE, які обслуговують GIN-індекси з міграції
+0005_search_trigram_indexes. Інші СУБД (SQLite у тестах): `icontains` з
+ранжуванням через CASE — повільніше, але з тим самим контрактом.
+
+Результат — QuerySet, відсортований за релевантністю (`search_rank`), тож
+пагінація (LIMIT/OFFSET) виконується в БД і порядок зберігається до кінця.
+
+З `SEARCH_BACKEND = "memory"` кандидатів і оцінки дає in-process fuzzy-індекс
+(bins/search_index.py), а БД лише дістає top-k рядків за id.
+"""
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, FloatField, IntegerField, Q, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from rapidfuzz import fuzz
+
+from .choices import LANGUAGE_CHOICES
+from .models import Create_Bins
+
+# Мінімальна схожість для збігу мови (як у попередньому fuzzy-пошуку)
+LANGUAGE_MATCH_SCORE = 50
+
+
+def matching_languages(query):
+    """
+    Повертає коди мов, назва яких схожа на запит.
+
+    Довідник мов — кілька десятків рядків, тож fuzzy-порівняння тут дешеве
+    і не залежить від кількості бінів.
+    """
+    codes = []
+    for code, label in LANGUAGE_CHOICES:
+        if code == "none":
+            continue
+        score = max(fuzz.partial_ratio(query, label.lower()), fuzz.partial_ratio(query, code))
+        if score > LANGUAGE_MATCH_SCORE:
+            codes.append(code)
+    return codes
+
+
+def active_bins():
+    """QuerySet непрострочених бінів."""
+    return Create_Bins.objects.filter(Q(expiry_at__isnull=True) | Q(expiry_at__gt=timezone.now()))
+
+
+def _postgres_search(queryset, query, languages):
+    from django.contrib.postgres.search import TrigramWordSimilarity
+
+    language_rank = Case(
+        When(language__in=languages, then=Value(0.5)),
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+    return (
+        queryset.filter(
+            Q(title__trigram_word_similar=query)
+            | Q(tags__trigram_word_similar=query)
+            | Q(title__icontains=query)
+            | Q(language__in=languages)
+        )
+        .annotate(
+            search_rank=Greatest(
+                TrigramWordSimilarity(query, "title"),
+                TrigramWordSimilarity(query, "tags"),
+                language_rank,
+            )
+        )
+    )
+
+
+def _fallback_search(queryset, query, languages):
+    return (
+        queryset.filter(
+            Q(title__icontains=query) | Q(tags__icontains=query) | Q(language__in=languages)
+        )
+        .annotate(
+            search_rank=Case(
+                When(title__iexact=query, then=Value(4)),
+                When(title__istartswith=query, then=Value(3)),
+                When(title__icontains=query, then=Value(2)),
+                When(tags__icontains=query, then=Value(1)),
+                default=Value(0),
+                output_field=IntegerField(),
+            )
+        )
+    )
+
+
+def _memory_search(queryset, query):
+    """Пошук по fuzzy-індексу; None — індекс ще будується, шукати в БД."""
+    from .search_index import get_search_index
+
+    index = get_search_index()
+    if index is None:
+        return None
+    matches = index.search(
+        query,
+        limit=getattr(settings, "SEARCH_INDEX_TOP_K", 500),
+        min_score=LANGUAGE_MATCH_SCORE,
+        workers=getattr(settings, "SEARCH_INDEX_WORKERS", -1),
+    )
+    if not matches:
+        return queryset.none()
+    # Оцінки індексу переносимо в запит, щоб порядок пережив пагінацію
+    return queryset.filter(id__in=[pk for pk, _ in matches]).annotate(
+        search_rank=Case(
+            *[When(id=pk, then=Value(score)) for pk, score in matches],
+            default=Value(0.0),
+            output_field=FloatField(),
+        )
+    )
+
+
+def search_bins(query, queryset=None):
+    """
+    Шукає біни за назвою, тегами та мовою.
+
+    Args:
+        query (str): Пошуковий запит
+        queryset (QuerySet, optional): Базовий набір (за замовчуванням — непрострочені біни)
+
+    Returns:
+        QuerySet: Біни з анотацією `search_rank`, від найрелевантніших
+    """
+    query = (query or "").lower().strip()
+    if not query:
+        return Create_Bins.objects.none()
+    if queryset is None:
+        queryset = active_bins()
+    if getattr(settings, "SEARCH_BACKEND", "database") == "memory":
+        results = _memory_search(queryset, query)
+        if results is not None:
+            return results.order_by("-search_rank", "-created_at")
+    languages = matching_languages(query)
+    if connection.vendor == "postgresql":
+        queryset = _postgres_search(queryset, query, languages)
+    else:
+        queryset = _fallback_search(queryset, query, languages)
+    return queryset.order_by("-search_rank", "-created_at")
@@ -0,0 +1,285 @@
+"""
+In-process fuzzy-індекс бінів для `smart_search` (SEARCH_BACKEND = "memory").
+
+Нормалізовані (lowercase) назви, теги та назви мов лежать у паралельних
+списках, позиція в яких відповідає id біна. Запит оцінюється пакетно в C:
+`rapidfuzz.process.cdist` з `workers=` (якщо встановлено numpy), інакше
+`process.extract` по кожному полю. Скоринг іде по знімку списків поза
+замком, тож сигнали не чекають на пошук.
+
+Індекс будується одним `values_list` у фоновому потоці і підміняє
+попередній цілком; поки першої збірки немає, `get_search_index()` повертає
+None і пошук іде в БД. Далі індекс оновлюється сигналами
+post_save/post_delete (див. bins/signals.py), а зміни, що прийшли під час
+фонової збірки, доганяються журналом перед підміною. Зміни з інших
+процесів підхоплюються перебудуванням раз на `SEARCH_INDEX_REBUILD_INTERVAL`
+секунд — запит, що помітив застарілий індекс, лише запускає його і
+відповідає зі старого.
+"""
+import logging
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+from rapidfuzz import fuzz, process
+
+from .choices import LANGUAGE_CHOICES
+from .models import Create_Bins
+
+try:
+    import numpy
+except ImportError:  # numpy потрібен лише для cdist
+    numpy = None
+
+logger = logging.getLogger(__name__)
+
+LANGUAGE_DISPLAY = dict(LANGUAGE_CHOICES)
+
+
+def _normalize(value):
+    return (value or "").lower().strip()
+
+
+class FuzzySearchIndex:
+    """
+    Потокобезпечний індекс: id → позиція у списках titles/tags/languages/expires.
+
+    Видалення — заміною на останній елемент, тож усі операції O(1), а списки
+    лишаються щільними для пакетного скорингу.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = []
+        self._titles = []
+        self._tags = []
+        self._languages = []
+        self._expires = []  # unix-час спливання або inf
+        self._positions = {}
+        self.built_at = None
+
+    def __len__(self):
+        return len(self._ids)
+
+    @staticmethod
+    def _row(title, tags, language, expiry_at):
+        return (
+            _normalize(title),
+            _normalize(tags),
+            _normalize(LANGUAGE_DISPLAY.get(language, language)) if language != "none" else "",
+            expiry_at.timestamp() if expiry_at else math.inf,
+        )
+
+    def build(self, rows):
+        """
+        Заповнює індекс з нуля.
+
+        Args:
+            rows: ітерабельне з кортежів (id, title, tags, language, expiry_at)
+        """
+        ids, titles, tags, languages, expires = [], [], [], [], []
+        for pk, title, tag, language, expiry_at in rows:
+            row = self._row(title, tag, language, expiry_at)
+            ids.append(pk)
+            titles.append(row[0])
+            tags.append(row[1])
+            languages.append(row[2])
+            expires.append(row[3])
+        with self._lock:
+            self._ids, self._titles, self._tags = ids, titles, tags
+            self._languages, self._expires = languages, expires
+            self._positions = {pk: i for i, pk in enumerate(ids)}
+            self.built_at = time.monotonic()
+
+    def upsert(self, pk, title, tags, language, expiry_at):
+        row = self._row(title, tags, language, expiry_at)
+        with self._lock:
+            pos = self._positions.get(pk)
+            if pos is None:
+                self._positions[pk] = len(self._ids)
+                self._ids.append(pk)
+                self._titles.append(row[0])
+                self._tags.append(row[1])
+                self._languages.append(row[2])
+                self._expires.append(row[3])
+            else:
+                self._titles[pos], self._tags[pos], self._languages[pos], self._expires[pos] = row
+
+    def remove(self, pk):
+        with self._lock:
+            pos = self._positions.pop(pk, None)
+            if pos is None:
+                return
+            last = len(self._ids) - 1
+            for column in (self._ids, self._titles, self._tags, self._languages, self._expires):
+                column[pos] = column[last]
+                column.pop()
+            if pos != last:
+                self._positions[self._ids[pos]] = pos
+
+    @staticmethod
+    def _scores(columns, query, min_score, workers):
+        """Повертає список найкращих оцінок по колонках (title/tags/language) для кожної позиції."""
+        if numpy is not None:
+            matrix = [
+                process.cdist(
+                    [query], column, scorer=fuzz.partial_ratio, score_cutoff=min_score,
+                    workers=workers, dtype=numpy.float32,
+                )[0]
+                for column in columns
+            ]
+            return numpy.maximum.reduce(matrix).tolist()
+        scores = [0] * len(columns[0])
+        for column in columns:
+            for _, score, pos in process.extract(
+                query, column, scorer=fuzz.partial_ratio, score_cutoff=min_score, limit=None,
+            ):
+                if score > scores[pos]:
+                    scores[pos] = score
+        return scores
+
+    def search(self, query, limit=100, min_score=50, workers=-1):
+        """
+        Повертає до `limit` пар (id, score) непрострочених бінів, від найкращих.
+
+        Args:
+            query (str): Пошуковий запит
+            limit (int): Скільки результатів повернути
+            min_score (int): Мінімальна схожість 0..100 (поріг не включно, як раніше)
+        """
+        query = _normalize(query)
+        if not query:
+            return []
+        now = time.time()
+        # Під замком лише копіюємо списки (swap-remove переставляє позиції), скоринг — без нього
+        with self._lock:
+            ids, expiries = list(self._ids), list(self._expires)
+            columns = (list(self._titles), list(self._tags), list(self._languages))
+        if not ids:
+            return []
+        scores = self._scores(columns, query, min_score, workers)
+        matches = [
+            (score, pk)
+            for pk, score, expires in zip(ids, scores, expiries)
+            if score > min_score and expires > now
+        ]
+        matches.sort(key=lambda item: (-item[0], -item[1]))
+        return [(pk, score) for score, pk in matches[:limit]]
+
+
+_index = None
+_state_lock = threading.Lock()
+_rebuilding = False
+_journal = []  # зміни від сигналів під час фонової збірки: (pk, row | None)
+
+
+def _index_rows():
+    return (
+        Create_Bins.objects.filter(Q(expiry_at__isnull=True) | Q(expiry_at__gt=timezone.now()))
+        .values_list("id", "title", "tags", "language", "expiry_at")
+        .iterator(chunk_size=5000)
+    )
+
+
+def _swap_in(index):
+    """Доганяє журнал змін і робить `index` індексом процесу."""
+    global _index, _rebuilding
+    with _state_lock:
+        for pk, row in _journal:
+            if row is None:
+                index.remove(pk)
+            else:
+                index.upsert(pk, *row)
+        _journal.clear()
+        _index = index
+        _rebuilding = False
+
+
+def rebuild_search_index():
+    """Будує новий індекс з БД одним запитом по непрострочених бінах і підміняє ним поточний."""
+    global _rebuilding
+    with _state_lock:
+        _rebuilding = True
+    started = time.monotonic()
+    try:
+        index = FuzzySearchIndex()
+        index.build(_index_rows())
+    except Exception:
+        with _state_lock:
+            _journal.clear()
+            _rebuilding = False
+        raise
+    _swap_in(index)
+    logger.info("Search index built: %s bins in %.3fs", len(index), time.monotonic() - started)
+    return index
+
+
+def _rebuild_in_background():
+    try:
+        rebuild_search_index()
+    except Exception as e:
+        logger.warning("Search index rebuild failed: %s", e)
+    finally:
+        # Потік тримав власне з'єднання з БД
+        connection.close()
+
+
+def get_search_index(wait=False):
+    """
+    Повертає індекс процесу; відсутній або застарілий перебудовується у фоновому потоці.
+
+    Args:
+        wait (bool): якщо індексу ще немає — побудувати його в поточному потоці
+
+    Returns:
+        FuzzySearchIndex or None: None — першу збірку щойно запущено, шукати в БД
+    """
+    global _rebuilding
+    interval = getattr(settings, "SEARCH_INDEX_REBUILD_INTERVAL", 300)
+    index = _index
+    if index is None and wait:
+        return rebuild_search_index()
+    if index is None or time.monotonic() - index.built_at > interval:
+        with _state_lock:
+            start = not _rebuilding
+            _rebuilding = True
+        if start:
+            threading.Thread(target=_rebuild_in_background, name="search-index-rebuild", daemon=True).start()
+    return index
+
+
+def is_index_built():
+    return _index is not None
+
+
+def index_bin(bin):
+    """Оновлює запис біна в індексі (якщо індекс уже побудований або будується)."""
+    row = (bin.title, bin.tags, bin.language, bin.expiry_at)
+    with _state_lock:
+        if _rebuilding:
+            _journal.append((bin.pk, row))
+        index = _index
+    if index is not None:
+        index.upsert(bin.pk, *row)
+
+
+def unindex_bin(pk):
+    with _state_lock:
+        if _rebuilding:
+            _journal.append((pk, None))
+        index = _index
+    if index is not None:
+        index.remove(pk)
+
+
+def reset_search_index():
+    """Забуває індекс процесу (для тестів)."""
+    global _index, _rebuilding
+    with _state_lock:
+        _index = None
+        _rebuilding = False
+        _journal.clear()
@@ -1,27 +1,36 @@
 """
 Сервісний шар для роботи з бінами (business logic).
 Тут — функції для створення та оновлення bin, які використовують
-утиліти (`upload_to_r2`, `get_bin_size`, `delete_from_r2`, `get_expiry_map`).
+утиліти (`upload_to_r2`, `delete_from_r2`, `get_expiry_map`).
 
 Мета: винести важку логіку з view/serializer у окреме місце, щоб її
 легко тестувати й повторно використовувати.
 """
-from django.db import transaction
+from django.db import IntegrityError, transaction
+from django.db.models import F
 from django.core.exceptions import ValidationError
 
+import logging
 import uuid
 
 
 from .utils import (
     upload_to_r2,
-    get_bin_size,
     delete_from_r2,
+    delete_many_from_r2,
     get_expiry_map,
+    content_digest,
     get_bin_content,
     invalidate_bin_cache,
+    invalidate_bins_cache,
     get_redis_client,
 )
-from .models import Create_Bins
+from .models import Create_Bins, BinLike
+from .hash_lease import acquire_hash, release_unless_taken
+from . import counters, leaderboard
+from .redis_client import atomic_pipeline
+
+logger = logging.getLogger(__name__)
 
 
 class ServiceError(Exception):
@@ -29,8 +38,12 @@ class ServiceError(Exception):
     pass
 
 
+# action -> значення BinLike.is_like
+VOTE_ACTIONS = {"like": True, "dislike": False}
+
+
 def create_bin_service(user, data):
-    """Створює bin: завантажує content у R2, створює запис у БД, прив'язує hash з Redis."""
+    """Створює bin: завантажує content у R2, створює запис у БД з hash з пулу (через локальну оренду)."""
 
     content = data.get("content", "") or ""
     if not content.strip():
@@ -45,21 +58,22 @@ def create_bin_service(user, data):
     except Exception as e:
         raise ServiceError(f"Upload to R2 failed: {e}")
 
-    # 2) Отримуємо розмір (ContentLength) — fallback на довжину контенту
-    try:
-        size = get_bin_size(file_key)
-        if size is None:
-            size = len(content.encode("utf-8"))
-    except Exception:
-        size = len(content.encode("utf-8"))
+    # 2) Розмір беремо з payload, що щойно завантажили (без head_object до R2)
+    size = len(content.encode("utf-8"))
 
     # 3) Підготовка інших полів
     title = f"{user.username}/{data.get('title','')}"
     expiry = data.get("expiry", "never")
     expiry_at = get_expiry_map(expiry)
 
-    # 4) Створюємо запис у БД у транзакції
+    # 4) Хеш з локальної оренди воркера (bins/hash_lease.py) — зазвичай без звернення до Redis
+    hash_value = acquire_hash()
+
+    # 5) Створюємо запис у БД у транзакції
     try:
+        if not hash_value:
+            # Немає хеша в пулі — це критична ситуація для вашого flow
+            raise ServiceError("No hash available in pool")
         with transaction.atomic():
             bin_obj = Create_Bins.objects.create(
                 file_url=file_url,
@@ -73,26 +87,14 @@ def create_bin_service(user, data):
                 tags=data.get("tags", ""),
                 author=user,
                 size_bin=size,
+                content_digest=content_digest(content),
+                hash=hash_value,
             )
-
-            # Робота з Redis: беремо hash з пулу
-            try:
-                redis_client = get_redis_client()
-                hash_value = redis_client.lpop("my_unique_hash_pool")
-                if hash_value:
-                    hash_value_str = hash_value.decode("utf-8")
-                    bin_obj.hash = hash_value_str
-                    bin_obj.save(update_fields=["hash"])  # зберігаємо тільки hash
-                else:
-                    # Немає хеша в пулі — це критична ситуація для вашого flow
-                    raise ServiceError("No hash available in pool")
-            except Exception as exc:
-                # Якщо робота з Redis впала — завертаємо причину в ServiceError, щоб API повернуло коректний код
-                raise ServiceError(f"Redis error: {exc}")
-
             return bin_obj
 
     except Exception as e:
+        # Хеш, уже зайнятий іншим біном (IntegrityError по hash), у чергу не повертається
+        release_unless_taken(hash_value, e)
         # У випадку помилки після upload — намагаємось видалити файл з R2
         try:
             delete_from_r2(file_key)
@@ -131,10 +133,8 @@ def update_bin_service(bin_obj, user, data):
                 # Оновлюємо поля біну
                 bin_obj.file_key = file_key
                 bin_obj.file_url = file_url
-                try:
-                    bin_obj.size_bin = get_bin_size(file_key) or len(str(content).encode("utf-8"))
-                except Exception:
-                    bin_obj.size_bin = len(str(content).encode("utf-8"))
+                bin_obj.size_bin = len(str(content).encode("utf-8"))
+                bin_obj.content_digest = content_digest(str(content))
 
             # Інші оновлювані поля (title, tags, expiry, access, language, category)
             title = data.get("title")
@@ -146,7 +146,6 @@ def update_bin_service(bin_obj, user, data):
                     setattr(bin_obj, field, data.get(field))
 
             bin_obj.save()
-            return bin_obj
 
     except Exception as e:
         # Якщо щось не так — не видаляємо файл тут, оскільки ми перезаписували існуючий
@@ -154,6 +153,10 @@ def update_bin_service(bin_obj, user, data):
             raise
         raise ServiceError(f"Failed to update bin: {e}")
 
+    # Доступ чи термін могли змінитися — бін лишається в `popular` лише публічним і непростроченим
+    leaderboard.sync_bin(bin_obj)
+    return bin_obj
+
 
 def get_bin_service(bin_obj, user):
     """Повертає метадані та контент біна (читання)."""
@@ -185,6 +188,7 @@ def delete_bin_service(bin_obj, user):
 
     file_key = bin_obj.file_key
     bin_hash = bin_obj.hash
+    bin_pk = bin_obj.pk
 
     # Спершу намагаємось видалити з R2 (зовнішній ресурс)
     if file_key:
@@ -205,7 +209,147 @@ def delete_bin_service(bin_obj, user):
             invalidate_bin_cache(bin_hash)
         except Exception:
             pass
+    leaderboard.remove_from_leaderboards(bin_pk)
 
     return True
 
 
+
+
+def bulk_delete_bins_service(bin_ids, user):
+    """
+    Видаляє набір бінів пакетно.
+
+    Один `in_bulk` на всі id, перевірка прав у пам'яті, видалення файлів з R2
+    пакетами DeleteObjects, один DELETE ... WHERE id IN для бінів, файли яких
+    видалено, і одна інвалідація кешу на всі хеші.
+
+    Args:
+        bin_ids (list[int]): id бінів у порядку запиту; повтори відкидаються
+        user (User): користувач, що видаляє (автор або адмін)
+
+    Returns:
+        list[dict]: результат для кожного унікального id у порядку першої появи в запиті:
+            {"bin_id", "status": "deleted" | "not_found" | "forbidden" | "error", "detail"?}
+    """
+    bin_ids = list(dict.fromkeys(bin_ids))
+    bins = Create_Bins.objects.only("id", "author_id", "file_key", "hash").in_bulk(bin_ids)
+
+    results = {}
+    allowed = []
+    for bin_id in bin_ids:
+        bin_obj = bins.get(bin_id)
+        if bin_obj is None:
+            results[bin_id] = {"bin_id": bin_id, "status": "not_found"}
+        elif bin_obj.author_id != user.pk and not user.is_staff:
+            results[bin_id] = {"bin_id": bin_id, "status": "forbidden"}
+        else:
+            allowed.append(bin_obj)
+
+    # Спершу зовнішній ресурс: бін без видаленого файлу лишається в БД
+    file_results = delete_many_from_r2([b.file_key for b in allowed if b.file_key])
+    to_delete = []
+    for bin_obj in allowed:
+        if bin_obj.file_key and not file_results.get(bin_obj.file_key, False):
+            results[bin_obj.pk] = {"bin_id": bin_obj.pk, "status": "error", "detail": "Failed to delete file from R2"}
+        else:
+            to_delete.append(bin_obj)
+
+    if to_delete:
+        try:
+            with transaction.atomic():
+                Create_Bins.objects.filter(pk__in=[b.pk for b in to_delete]).delete()
+        except Exception as exc:
+            for bin_obj in to_delete:
+                results[bin_obj.pk] = {"bin_id": bin_obj.pk, "status": "error", "detail": f"Failed to delete bin: {exc}"}
+            to_delete = []
+        for bin_obj in to_delete:
+            results[bin_obj.pk] = {"bin_id": bin_obj.pk, "status": "deleted"}
+
+    try:
+        invalidate_bins_cache([b.hash for b in to_delete])
+    except Exception:
+        pass
+    leaderboard.remove_from_leaderboards(*[b.pk for b in to_delete])
+
+    return [results[bin_id] for bin_id in bin_ids]
+
+
+def vote_bin_service(bin_id, user, action):
+    """
+    Ставить лайк/дизлайк користувача біну і повертає актуальні лічильники.
+
+    Голос (BinLike, unique на bin+user) і лічильники змінюються в одній транзакції:
+    рядок голосу блокується (SELECT ... FOR UPDATE), лічильники оновлюються
+    відносно значення в БД через F(), тож паралельні голоси не губляться.
+
+    Args:
+        bin_id (int): id біна
+        user (User): користувач, що голосує
+        action (str): "like" або "dislike"
+
+    Returns:
+        dict: {"likes": int, "dislikes": int}
+    Raises:
+        ValidationError: невідома дія
+    """
+    if action not in VOTE_ACTIONS:
+        raise ValidationError(f"Unknown vote action '{action}'")
+    is_like = VOTE_ACTIONS[action]
+
+    with transaction.atomic():
+        previous = (
+            BinLike.objects.select_for_update()
+            .filter(bin_id=bin_id, user=user)
+            .values_list("is_like", flat=True)
+            .first()
+        )
+        if previous is None:
+            try:
+                with transaction.atomic():
+                    BinLike.objects.create(bin_id=bin_id, user=user, is_like=is_like)
+            except IntegrityError:
+                # Паралельний запит того ж користувача встиг вставити голос — беремо його під замок
+                previous = (
+                    BinLike.objects.select_for_update()
+                    .filter(bin_id=bin_id, user=user)
+                    .values_list("is_like", flat=True)
+                    .get()
+                )
+                if previous != is_like:
+                    BinLike.objects.filter(bin_id=bin_id, user=user).update(is_like=is_like)
+        elif previous != is_like:
+            BinLike.objects.filter(bin_id=bin_id, user=user).update(is_like=is_like)
+
+        if previous != is_like:
+            deltas = {"likes_count": F("likes_count") + 1} if is_like else {"dislikes_count": F("dislikes_count") + 1}
+            if previous is not None:
+                # Перемикання голосу: знімаємо протилежний
+                if is_like:
+                    deltas["dislikes_count"] = F("dislikes_count") - 1
+                else:
+                    deltas["likes_count"] = F("likes_count") - 1
+            Create_Bins.objects.filter(pk=bin_id).update(**deltas)
+
+        likes, dislikes, access, expiry_at = (
+            Create_Bins.objects.filter(pk=bin_id)
+            .values_list("likes_count", "dislikes_count", "access", "expiry_at")
+            .get()
+        )
+
+        if previous != is_like:
+            # Лідерборди (bins/leaderboard.py) і лічильники сторінки перегляду (bins/counters.py)
+            # оновлюються одним MULTI ще під блокуванням рядка біна: паралельні голоси пишуть
+            # у Redis у порядку комітів, тож старіше значення likes не перезапише новіше
+            pipe = atomic_pipeline(get_redis_client())
+            counters.set_counters(bin_id, pipeline=pipe, likes=likes, dislikes=dislikes)
+            leaderboard.update_popular(bin_id, likes, leaderboard.is_listed(access, expiry_at), pipeline=pipe)
+            if is_like or previous is not None:
+                # Новий лайк додає активність у trending, зміна лайка на дизлайк — знімає
+                leaderboard.record_activity(bin_id, "like", 1 if is_like else -1, pipeline=pipe)
+            try:
+                pipe.execute()
+            except Exception as e:
+                logger.warning("Failed to update leaderboards for vote on bin %s: %s", bin_id, e)
+
+    return {"likes": likes, "dislikes": dislikes}
@@ -0,0 +1,26 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .expiry_index import schedule_expiry
+from .models import Create_Bins
+from .search_index import index_bin, unindex_bin
+
+
+# Тримаємо in-memory пошуковий індекс процесу в актуальному стані
+@receiver(post_save, sender=Create_Bins)
+def update_search_index(sender, instance, **kwargs):
+    index_bin(instance)
+
+
+@receiver(post_delete, sender=Create_Bins)
+def remove_from_search_index(sender, instance, **kwargs):
+    unindex_bin(instance.pk)
+
+
+# Розклад спливання в Redis ZSET (bins/expiry_index.py). Видалені біни з індексу
+# прибирає reaper пачкою, коли настає їхній час, — без окремого ZREM на кожен DELETE
+@receiver(post_save, sender=Create_Bins)
+def update_expiry_index(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is not None and "expiry_at" not in update_fields:
+        return
+    schedule_expiry(instance.pk, instance.expiry_at)
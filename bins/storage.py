@@ -0,0 +1,697 @@
+"""
+Доступ до об'єктного сховища Cloudflare R2 (S3-сумісний API).
+
+Тут — процесний реєстр boto3-клієнтів. Побудова клієнта (завантаження моделей
+botocore, resolve endpoint, ланцюжок облікових даних) коштує дорожче за сам
+запит до R2, тому клієнт створюється один раз на процес і далі
+перевикористовується всіма потоками. Налаштування пулу з'єднань, ретраїв і
+таймаутів беруться з `R2_*` параметрів у `app/settings.py`.
+
+Також тут ведеться облік мережевих звернень до сховища у межах одного запиту
+(`count_round_trip` / `get_round_trips`) — middleware
+`bins.middleware.StorageRoundTripsMiddleware` віддає його у заголовку відповіді.
+
+Над клієнтом — абстракція `ContentStore` (put/get/get_range/delete/exists/size
+та пакетні варіанти) з двома бекендами: `R2ContentStore` і `LocalContentStore`
+(локальний диск, читання через mmap). Бекенд обирається параметром
+`CONTENT_STORE_BACKEND` у settings, екземпляр повертає `get_content_store()`.
+"""
+import abc
+import contextvars
+import logging
+import mmap
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Коди помилок S3/R2, які означають "об'єкта немає"
+NOT_FOUND_CODES = ("404", "NoSuchKey", "NotFound")
+
+# Кількість HTTP-звернень до сховища в поточному запиті (включно з ретраями)
+_round_trips = contextvars.ContextVar("storage_round_trips", default=0)
+
+
+def is_not_found_error(exc):
+    """Повертає True, якщо помилка boto3 означає відсутній об'єкт."""
+    if not isinstance(exc, ClientError):
+        return False
+    code = exc.response.get("Error", {}).get("Code", "")
+    return code in NOT_FOUND_CODES
+
+
+class RangeNotSatisfiable(Exception):
+    """Діапазон починається за кінцем об'єкта (S3/R2 `InvalidRange`, HTTP 416) — однаково для всіх бекендів."""
+
+
+def is_invalid_range_error(exc):
+    """Повертає True, якщо помилка boto3 означає незадовольняльний діапазон."""
+    if not isinstance(exc, ClientError):
+        return False
+    code = exc.response.get("Error", {}).get("Code", "")
+    status = exc.response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+    return code == "InvalidRange" or status == 416
+
+
+def count_round_trip(**kwargs):
+    """Збільшує лічильник звернень до сховища (використовується як хук `before-send`)."""
+    _round_trips.set(_round_trips.get() + 1)
+
+
+def get_round_trips():
+    """Повертає кількість звернень до сховища з моменту останнього `reset_round_trips()`."""
+    return _round_trips.get()
+
+
+def reset_round_trips():
+    """Обнуляє лічильник звернень до сховища (на початку кожного запиту)."""
+    _round_trips.set(0)
+
+
+class S3ClientRegistry:
+    """
+    Потокобезпечний реєстр boto3 S3-клієнтів (один клієнт на набір облікових даних у процесі).
+
+    Клієнти boto3 потокобезпечні, а от їх створення через дефолтну сесію — ні,
+    тому створення відбувається під локом. Після fork (gunicorn --preload)
+    реєстр очищається, щоб воркери не ділили сокети батьківського процесу.
+
+    Лічильники:
+        created — скільки клієнтів створено
+        reused — скільки разів віддано вже готовий клієнт
+        in_flight / peak_in_flight — запити до R2, що виконуються зараз / максимум
+        pool_saturated — скільки викликів стартувало, коли всі з'єднання пулу були зайняті
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients = {}
+        self._pid = os.getpid()
+        self._stats = {
+            "created": 0,
+            "reused": 0,
+            "in_flight": 0,
+            "peak_in_flight": 0,
+            "pool_saturated": 0,
+        }
+
+    def _client_key(self):
+        return (
+            settings.AWS_S3_ENDPOINT_URL,
+            settings.AWS_ACCESS_KEY_ID,
+            settings.AWS_S3_REGION_NAME,
+        )
+
+    def _build_config(self):
+        return Config(
+            max_pool_connections=getattr(settings, "R2_MAX_POOL_CONNECTIONS", 32),
+            connect_timeout=getattr(settings, "R2_CONNECT_TIMEOUT", 2),
+            read_timeout=getattr(settings, "R2_READ_TIMEOUT", 10),
+            retries={
+                "max_attempts": getattr(settings, "R2_MAX_ATTEMPTS", 3),
+                "mode": getattr(settings, "R2_RETRY_MODE", "standard"),
+            },
+            tcp_keepalive=getattr(settings, "R2_TCP_KEEPALIVE", True),
+        )
+
+    def _build_client(self):
+        client = boto3.client(
+            "s3",
+            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+            endpoint_url=settings.AWS_S3_ENDPOINT_URL,
+            region_name=settings.AWS_S3_REGION_NAME,
+            config=self._build_config(),
+        )
+        # Лічильники зайнятості пулу — через хуки подій botocore
+        events = getattr(getattr(client, "meta", None), "events", None)
+        if events is not None:
+            try:
+                events.register("before-call.s3", self._on_before_call)
+                events.register("after-call.s3", self._on_after_call)
+                events.register("after-call-error.s3", self._on_after_call)
+                events.register("before-send.s3", count_round_trip)
+            except Exception:
+                logger.debug("Could not register S3 pool counters", exc_info=True)
+        return client
+
+    def _on_before_call(self, **kwargs):
+        max_pool = getattr(settings, "R2_MAX_POOL_CONNECTIONS", 32)
+        with self._lock:
+            self._stats["in_flight"] += 1
+            in_flight = self._stats["in_flight"]
+            if in_flight > self._stats["peak_in_flight"]:
+                self._stats["peak_in_flight"] = in_flight
+            if in_flight > max_pool:
+                self._stats["pool_saturated"] += 1
+        if in_flight > max_pool:
+            logger.warning(
+                "R2 connection pool saturated (%s in flight, max %s)", in_flight, max_pool
+            )
+
+    def _on_after_call(self, **kwargs):
+        with self._lock:
+            if self._stats["in_flight"] > 0:
+                self._stats["in_flight"] -= 1
+
+    def get_client(self):
+        """Повертає клієнт для поточних облікових даних, створюючи його лише за першого виклику."""
+        key = self._client_key()
+        with self._lock:
+            if self._pid != os.getpid():
+                # Ми у дочірньому процесі після fork — старі з'єднання не наші
+                self._clients.clear()
+                self._pid = os.getpid()
+            client = self._clients.get(key)
+            if client is not None:
+                self._stats["reused"] += 1
+                return client
+            client = self._build_client()
+            self._clients[key] = client
+            self._stats["created"] += 1
+            return client
+
+    def reset(self):
+        """Забуває всі створені клієнти (для тестів та зміни облікових даних)."""
+        with self._lock:
+            self._clients.clear()
+            self._pid = os.getpid()
+
+    def stats(self):
+        """Повертає копію лічильників реєстру."""
+        with self._lock:
+            return dict(self._stats)
+
+
+_registry = S3ClientRegistry()
+
+
+def get_s3_client():
+    """
+    Повертає спільний для процесу boto3 S3 клієнт для роботи з Cloudflare R2.
+
+    Returns:
+        boto3.client: S3-сумісний клієнт з налаштованим пулом з'єднань
+    """
+    return _registry.get_client()
+
+
+def reset_s3_clients():
+    """Скидає реєстр клієнтів — наступний виклик `get_s3_client()` створить новий клієнт."""
+    _registry.reset()
+
+
+def get_s3_client_stats():
+    """
+    Повертає лічильники перевикористання клієнта та зайнятості пулу з'єднань.
+
+    Returns:
+        dict: created, reused, in_flight, peak_in_flight, pool_saturated
+    """
+    return _registry.stats()
+
+
+class ContentStore(abc.ABC):
+    """
+    Базовий інтерфейс сховища контенту бінів: ключ (наприклад, 'bins/bin_abc.txt') → байти.
+
+    Відсутній об'єкт — це не помилка: get/get_range/size повертають None,
+    exists — False, delete — True (ідемпотентно). Діапазон, що починається за
+    кінцем об'єкта, — `RangeNotSatisfiable` у кожного бекенда. Інші збої
+    піднімаються як винятки.
+    Кожна операція враховується у `stats()` (кількість і сумарний час), щоб
+    латентність сховища можна було міряти окремо від решти запиту.
+    """
+
+    name = "base"
+
+    def __init__(self):
+        self._stats_lock = threading.Lock()
+        self._op_stats = {}
+
+    def _record(self, op, started):
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._stats_lock:
+            entry = self._op_stats.setdefault(op, {"count": 0, "total_ms": 0.0})
+            entry["count"] += 1
+            entry["total_ms"] += elapsed_ms
+
+    def stats(self):
+        """Повертає {операція: {"count": n, "total_ms": t}}."""
+        with self._stats_lock:
+            return {op: dict(entry) for op, entry in self._op_stats.items()}
+
+    @staticmethod
+    def _to_bytes(data):
+        if isinstance(data, str):
+            return data.encode("utf-8")
+        return bytes(data)
+
+    @abc.abstractmethod
+    def url_for(self, key):
+        """Повертає URL (або псевдо-URL), що зберігається у `Create_Bins.file_url`."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def put(self, key, data):
+        """Записує data (str або bytes) під ключем key. Повертає розмір у байтах."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get(self, key):
+        """Повертає вміст об'єкта як bytes або None, якщо об'єкта немає."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get_range(self, key, start, end=None):
+        """
+        Повертає байти [start, end] (end включно, як у HTTP Range) або None.
+
+        Raises:
+            RangeNotSatisfiable: start за кінцем об'єкта
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def open(self, key):
+        """
+        Відкриває об'єкт для потокового читання без буферизації всього вмісту.
+
+        Returns:
+            tuple: (file-like з read(n)/close(), size) або (None, None), якщо об'єкта немає
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def open_range(self, key, start, end):
+        """
+        Відкриває для потокового читання байти [start, end] (end включно).
+
+        Returns:
+            tuple: (file-like, довжина діапазону) або (None, None), якщо об'єкта немає
+        Raises:
+            RangeNotSatisfiable: start за кінцем об'єкта
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def delete(self, key):
+        """Видаляє об'єкт. Повертає True, якщо після виклику об'єкта немає."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def exists(self, key):
+        """Повертає True, якщо об'єкт існує."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def size(self, key):
+        """Повертає розмір об'єкта у байтах або None, якщо об'єкта немає."""
+        raise NotImplementedError
+
+    def put_many(self, items):
+        """Записує {key: data}. Повертає {key: size}."""
+        return {key: self.put(key, data) for key, data in items.items()}
+
+    def get_many(self, keys):
+        """Повертає {key: bytes або None}."""
+        return {key: self.get(key) for key in keys}
+
+    def delete_many(self, keys):
+        """Видаляє набір ключів. Повертає {key: True/False}."""
+        results = {}
+        for key in keys:
+            try:
+                results[key] = self.delete(key)
+            except Exception as e:
+                logger.warning("Failed to delete %s from %s store: %s", key, self.name, e)
+                results[key] = False
+        return results
+
+
+class R2ContentStore(ContentStore):
+    """Бекенд Cloudflare R2 через спільний boto3-клієнт (`get_s3_client`)."""
+
+    name = "r2"
+    # Обмеження S3 API DeleteObjects на один запит
+    delete_batch_size = 1000
+
+    @property
+    def bucket(self):
+        return settings.AWS_STORAGE_BUCKET_NAME
+
+    def url_for(self, key):
+        return f"https://{settings.AWS_S3_CUSTOM_DOMAIN}/{key}"
+
+    def put(self, key, data):
+        started = time.perf_counter()
+        body = self._to_bytes(data)
+        try:
+            get_s3_client().put_object(
+                Bucket=self.bucket,
+                Key=key,
+                Body=body,
+                ContentType="text/plain",
+            )
+        finally:
+            self._record("put", started)
+        return len(body)
+
+    def get(self, key):
+        started = time.perf_counter()
+        try:
+            obj = get_s3_client().get_object(Bucket=self.bucket, Key=key)
+            return obj["Body"].read()
+        except ClientError as e:
+            if is_not_found_error(e):
+                return None
+            raise
+        finally:
+            self._record("get", started)
+
+    def get_range(self, key, start, end=None):
+        started = time.perf_counter()
+        byte_range = f"bytes={start}-{'' if end is None else end}"
+        try:
+            obj = get_s3_client().get_object(Bucket=self.bucket, Key=key, Range=byte_range)
+            return obj["Body"].read()
+        except ClientError as e:
+            if is_not_found_error(e):
+                return None
+            if is_invalid_range_error(e):
+                raise RangeNotSatisfiable(f"{key}: {byte_range}") from e
+            raise
+        finally:
+            self._record("get_range", started)
+
+    def open(self, key):
+        started = time.perf_counter()
+        try:
+            obj = get_s3_client().get_object(Bucket=self.bucket, Key=key)
+            return obj["Body"], int(obj["ContentLength"])
+        except ClientError as e:
+            if is_not_found_error(e):
+                return None, None
+            raise
+        finally:
+            self._record("open", started)
+
+    def open_range(self, key, start, end):
+        started = time.perf_counter()
+        try:
+            obj = get_s3_client().get_object(Bucket=self.bucket, Key=key, Range=f"bytes={start}-{end}")
+            return obj["Body"], int(obj["ContentLength"])
+        except ClientError as e:
+            if is_not_found_error(e):
+                return None, None
+            if is_invalid_range_error(e):
+                raise RangeNotSatisfiable(f"{key}: bytes={start}-{end}") from e
+            raise
+        finally:
+            self._record("open_range", started)
+
+    def delete(self, key):
+        started = time.perf_counter()
+        try:
+            get_s3_client().delete_object(Bucket=self.bucket, Key=key)
+            return True
+        except ClientError as e:
+            if is_not_found_error(e):
+                return True
+            raise
+        finally:
+            self._record("delete", started)
+
+    def exists(self, key):
+        return self.size(key) is not None
+
+    def size(self, key):
+        started = time.perf_counter()
+        try:
+            head = get_s3_client().head_object(Bucket=self.bucket, Key=key)
+            return int(head["ContentLength"])
+        except ClientError as e:
+            if is_not_found_error(e):
+                return None
+            raise
+        finally:
+            self._record("size", started)
+
+    def _max_workers(self, count):
+        return max(1, min(count, getattr(settings, "R2_MAX_POOL_CONNECTIONS", 32)))
+
+    def put_many(self, items):
+        if not items:
+            return {}
+        keys = list(items)
+        with ThreadPoolExecutor(max_workers=self._max_workers(len(keys))) as pool:
+            sizes = pool.map(lambda key: self.put(key, items[key]), keys)
+            return dict(zip(keys, sizes))
+
+    def get_many(self, keys):
+        keys = list(keys)
+        if not keys:
+            return {}
+        with ThreadPoolExecutor(max_workers=self._max_workers(len(keys))) as pool:
+            return dict(zip(keys, pool.map(self.get, keys)))
+
+    def delete_many(self, keys):
+        """Видаляє ключі пакетами через DeleteObjects (до 1000 ключів на запит)."""
+        keys = [key for key in dict.fromkeys(keys) if key]
+        results = {}
+        for offset in range(0, len(keys), self.delete_batch_size):
+            batch = keys[offset:offset + self.delete_batch_size]
+            started = time.perf_counter()
+            try:
+                response = get_s3_client().delete_objects(
+                    Bucket=self.bucket,
+                    Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True},
+                )
+            except Exception as e:
+                logger.warning("R2 delete_objects failed for %s keys: %s", len(batch), e)
+                results.update({key: False for key in batch})
+                continue
+            finally:
+                self._record("delete_many", started)
+            failed = {
+                err.get("Key")
+                for err in response.get("Errors", [])
+                if err.get("Code") not in NOT_FOUND_CODES
+            }
+            results.update({key: key not in failed for key in batch})
+        return results
+
+
+class LocalContentStore(ContentStore):
+    """
+    Бекенд на локальному диску: файли під `CONTENT_STORE_LOCAL_ROOT`, читання через mmap.
+
+    Запис атомарний (тимчасовий файл + os.replace), тож читач ніколи не бачить
+    наполовину записаний бін. Підходить для гарячого tier на ноді, тестів і бенчмарків.
+    """
+
+    name = "local"
+
+    def __init__(self, root=None):
+        super().__init__()
+        self.root = Path(root or settings.CONTENT_STORE_LOCAL_ROOT).resolve()
+
+    def path_for(self, key):
+        """Повертає абсолютний шлях для ключа, не дозволяючи вийти за межі root."""
+        path = (self.root / key).resolve()
+        if path != self.root and self.root not in path.parents:
+            raise ValueError(f"Invalid content key: {key}")
+        return path
+
+    def url_for(self, key):
+        return f"local://{key}"
+
+    def put(self, key, data):
+        started = time.perf_counter()
+        body = self._to_bytes(data)
+        path = self.path_for(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+            try:
+                with os.fdopen(fd, "wb") as fh:
+                    fh.write(body)
+                os.replace(tmp_path, path)
+            except BaseException:
+                try:
+                    os.unlink(tmp_path)
+                except OSError:
+                    pass
+                raise
+        finally:
+            self._record("put", started)
+        return len(body)
+
+    def _read(self, key, start=0, end=None, ranged=False):
+        path = self.path_for(key)
+        try:
+            with open(path, "rb") as fh:
+                size = os.fstat(fh.fileno()).st_size
+                if ranged and start >= size:
+                    # Як R2: діапазон за кінцем об'єкта (і будь-який діапазон порожнього) — InvalidRange
+                    raise RangeNotSatisfiable(f"{key}: bytes={start}-{'' if end is None else end}")
+                if size == 0:
+                    # mmap не працює з порожніми файлами
+                    return b""
+                stop = size if end is None else min(end + 1, size)
+                with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    return mm[start:stop]
+        except FileNotFoundError:
+            return None
+
+    def get(self, key):
+        started = time.perf_counter()
+        try:
+            return self._read(key)
+        finally:
+            self._record("get", started)
+
+    def get_range(self, key, start, end=None):
+        started = time.perf_counter()
+        try:
+            return self._read(key, start, end, ranged=True)
+        finally:
+            self._record("get_range", started)
+
+    def open(self, key):
+        started = time.perf_counter()
+        try:
+            fh = open(self.path_for(key), "rb")
+            return fh, os.fstat(fh.fileno()).st_size
+        except FileNotFoundError:
+            return None, None
+        finally:
+            self._record("open", started)
+
+    def open_range(self, key, start, end):
+        started = time.perf_counter()
+        try:
+            fh = open(self.path_for(key), "rb")
+        except FileNotFoundError:
+            self._record("open_range", started)
+            return None, None
+        size = os.fstat(fh.fileno()).st_size
+        if start >= size:
+            fh.close()
+            self._record("open_range", started)
+            raise RangeNotSatisfiable(f"{key}: bytes={start}-{end}")
+        length = min(end + 1, size) - start
+        fh.seek(start)
+        self._record("open_range", started)
+        return BoundedReader(fh, length), length
+
+    def delete(self, key):
+        started = time.perf_counter()
+        try:
+            self.path_for(key).unlink()
+        except FileNotFoundError:
+            pass
+        finally:
+            self._record("delete", started)
+        return True
+
+    def exists(self, key):
+        return self.path_for(key).is_file()
+
+    def size(self, key):
+        started = time.perf_counter()
+        try:
+            return self.path_for(key).stat().st_size
+        except FileNotFoundError:
+            return None
+        finally:
+            self._record("size", started)
+
+
+class BoundedReader:
+    """Обгортка над файлом, що віддає не більше `length` байт з поточної позиції."""
+
+    def __init__(self, fh, length):
+        self._fh = fh
+        self._remaining = length
+
+    def read(self, size=-1):
+        if self._remaining <= 0:
+            return b""
+        if size is None or size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._fh.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def close(self):
+        self._fh.close()
+
+    @property
+    def closed(self):
+        return self._fh.closed
+
+
+def iter_chunks(body, chunk_size=None):
+    """
+    Генератор, що читає body шматками по chunk_size байт і закриває його в кінці.
+
+    Django викликає close() генератора після відправки відповіді (або обриву
+    з'єднання), тож з'єднання з R2 повертається у пул навіть при неповному читанні.
+    """
+    chunk_size = chunk_size or getattr(settings, "CONTENT_STREAM_CHUNK_SIZE", 64 * 1024)
+    try:
+        while True:
+            chunk = body.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        body.close()
+
+
+CONTENT_STORE_BACKENDS = {
+    "r2": R2ContentStore,
+    "local": LocalContentStore,
+}
+
+_store_lock = threading.Lock()
+_store = None
+
+
+def get_content_store():
+    """
+    Повертає екземпляр сховища контенту, обраний `CONTENT_STORE_BACKEND` ('r2' або 'local').
+
+    Returns:
+        ContentStore: спільний для процесу екземпляр бекенда
+    """
+    global _store
+    backend = getattr(settings, "CONTENT_STORE_BACKEND", "r2")
+    store = _store
+    if store is not None and store.name == backend:
+        return store
+    with _store_lock:
+        if _store is None or _store.name != backend:
+            try:
+                store_class = CONTENT_STORE_BACKENDS[backend]
+            except KeyError:
+                raise ValueError(f"Unknown CONTENT_STORE_BACKEND: {backend}")
+            _store = store_class()
+        return _store
+
+
+def reset_content_store():
+    """Скидає закешований екземпляр сховища (для тестів і зміни налаштувань)."""
+    global _store
+    with _store_lock:
+        _store = None
@@ -1,17 +1,235 @@
-from bins.models import Create_Bins
-from bins.utils import delete_from_r2
+"""
+Фонові задачі бінів.
+
+`delete_expired_bins()` — reaper прострочених бінів. Йде по них пачками
+(keyset-пагінація по `(expiry_at, id)` з індексом `create_bin_expiry_idx`),
+файли кожної пачки видаляє з R2 пакетним DeleteObjects, рядки — одним
+DELETE ... WHERE id IN, кеш — однією інвалідацією на пачку. Після кожної
+пачки в Redis пишеться checkpoint, тож перерваний прохід продовжується з
+того ж місця; повний прохід checkpoint прибирає.
+
+З `source="index"` (за замовчуванням, `BIN_REAPER_SOURCE`) кандидати беруться
+не скануванням таблиці, а з Redis ZSET спливань (bins/expiry_index.py):
+ZRANGEBYSCORE пачками, після видалення — ZREM. Скан лишається для бінів,
+які ще не потрапили в індекс (`--source scan` або `--backfill-index`).
+
+`ReaperLeaderLock` — Redis-замок, через який з кількох реплік воркера
+(`delete_expired_bins --daemon`) прибирає лише одна.
+"""
+import json
+import logging
+import time
+import uuid
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from bins import expiry_index, leaderboard
+from bins.models import Create_Bins
+from bins.redis_client import RELEASE_LOCK, RENEW_LOCK
+from bins.utils import delete_many_from_r2, get_redis_client, invalidate_bins_cache
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_KEY = "bin_reaper:checkpoint"
+LEADER_KEY = "bin_reaper:leader"
+
+
+class ReaperLeaderLock:
+    """
+    Лідерство через Redis `SET NX PX` з токеном репліки.
+
+    Лідер продовжує замок на кожному циклі; якщо репліка зникла, замок
+    спливає через `ttl` і його бере інша. Продовження і зняття перевіряють
+    токен атомарно (Lua), тож репліка ніколи не чіпає чужий замок.
+    """
+
+    def __init__(self, redis_client, ttl, key=LEADER_KEY):
+        self.redis_client = redis_client
+        self.ttl_ms = int(ttl * 1000)
+        self.key = key
+        self.token = uuid.uuid4().hex
+
+    def acquire(self, redis_client=None):
+        """
+        Бере або продовжує лідерство. Повертає True, якщо ця репліка — лідер.
+
+        Args:
+            redis_client (optional): свіжий клієнт процесу (get_redis_client() на цьому циклі)
+        """
+        if redis_client is not None:
+            self.redis_client = redis_client
+        try:
+            if self.redis_client.set(self.key, self.token, px=self.ttl_ms, nx=True):
+                return True
+            return bool(RENEW_LOCK(self.redis_client, [self.key], [self.token, self.ttl_ms]))
+        except Exception as e:
+            logger.warning("Leader election for %s failed: %s", self.key, e)
+            return False
+
+    def release(self):
+        try:
+            RELEASE_LOCK(self.redis_client, [self.key], [self.token])
+        except Exception as e:
+            logger.warning("Failed to release %s: %s", self.key, e)
+
 
+def _load_checkpoint(redis_client):
+    try:
+        raw = redis_client.get(CHECKPOINT_KEY)
+        if not raw:
+            return None
+        data = json.loads(raw)
+        return parse_datetime(data["expiry_at"]), data["id"]
+    except Exception as e:
+        logger.warning("Ignoring reaper checkpoint: %s", e)
+        return None
 
-def delete_expired_bins():
-    """Helper that immediately deletes expired bins (callable from tests).
 
-    Note: previously this project used `django-background-tasks` and a
-    scheduled wrapper. That dependency was removed and scheduling should be
-    handled by an external scheduler or a management command if needed.
+def _save_checkpoint(redis_client, expiry_at, pk):
+    try:
+        redis_client.set(CHECKPOINT_KEY, json.dumps({"expiry_at": expiry_at.isoformat(), "id": pk}))
+    except Exception as e:
+        logger.warning("Failed to save reaper checkpoint: %s", e)
+
+
+def _clear_checkpoint(redis_client):
+    try:
+        redis_client.delete(CHECKPOINT_KEY)
+    except Exception as e:
+        logger.warning("Failed to clear reaper checkpoint: %s", e)
+
+
+def _reap_chunk(rows):
+    """
+    Видаляє одну пачку бінів: файли → рядки → кеш.
+
+    Returns:
+        tuple: (deleted, failed)
     """
+    file_results = delete_many_from_r2([file_key for _, file_key, _, _ in rows if file_key])
+    # Бін, файл якого не видалився, лишаємо — його підбере наступний повний прохід
+    ok = [(pk, hash) for pk, file_key, hash, _ in rows if not file_key or file_results.get(file_key, False)]
+    if ok:
+        with transaction.atomic():
+            Create_Bins.objects.filter(pk__in=[pk for pk, _ in ok]).delete()
+        try:
+            invalidate_bins_cache([hash for _, hash in ok])
+        except Exception as e:
+            logger.warning("Failed to invalidate cache for reaped bins: %s", e)
+        expiry_index.unschedule(*[pk for pk, _ in ok])
+        leaderboard.remove_from_leaderboards(*[pk for pk, _ in ok])
+    return len(ok), len(rows) - len(ok)
+
+
+def _finish(stats, started):
+    stats["elapsed"] = round(time.monotonic() - started, 3)
+    stats["bins_per_sec"] = round(stats["deleted"] / stats["elapsed"], 1) if stats["elapsed"] else 0.0
+    logger.info(
+        "Reaper (%s): %s deleted, %s failed, %s chunks in %.3fs (%.1f bins/s)%s",
+        stats["source"], stats["deleted"], stats["failed"], stats["chunks"], stats["elapsed"],
+        stats["bins_per_sec"], "" if stats["completed"] else ", stopped early",
+    )
+    return stats
+
+
+def _reap_from_index(chunk_size, max_chunks, time_budget, stop_event):
+    """Прибирає біни, чий час минув за Redis ZSET, без сканування таблиці."""
+    started = time.monotonic()
     now = timezone.now()
-    expired_bins = Create_Bins.objects.filter(expiry_at__isnull=False, expiry_at__lt=now)
-    for bin in expired_bins:
-        delete_from_r2(bin.file_key)
-        bin.delete()
\ No newline at end of file
+    stats = {"source": "index", "scanned": 0, "deleted": 0, "failed": 0, "chunks": 0, "completed": False}
+    # Біни з невдалим видаленням файлу лишаються в індексі — пропускаємо їх зсувом
+    offset = 0
+    while max_chunks is None or stats["chunks"] < max_chunks:
+        if stop_event is not None and stop_event.is_set():
+            break
+        if time_budget is not None and time.monotonic() - started >= time_budget:
+            break
+        due = expiry_index.due_bin_ids(chunk_size, offset=offset, now=now.timestamp())
+        if not due:
+            stats["completed"] = True
+            break
+        rows = list(
+            Create_Bins.objects.filter(pk__in=due, expiry_at__lt=now)
+            .values_list("id", "file_key", "hash", "expiry_at")
+        )
+        # Члени без відповідного простроченого рядка (видалені або з новим терміном) — прибираємо
+        found = {row[0] for row in rows}
+        stale = [pk for pk in due if pk not in found]
+        if stale:
+            expiry_index.unschedule(*stale)
+        deleted, failed = _reap_chunk(rows) if rows else (0, 0)
+        offset += failed
+        stats["chunks"] += 1
+        stats["scanned"] += len(due)
+        stats["deleted"] += deleted
+        stats["failed"] += failed
+        if len(due) < chunk_size:
+            stats["completed"] = True
+            break
+    return _finish(stats, started)
+
+
+def delete_expired_bins(chunk_size=None, max_chunks=None, resume=True, time_budget=None, stop_event=None, source=None):
+    """
+    Видаляє прострочені біни пачками.
+
+    Args:
+        source (str, optional): "index" — кандидати з Redis ZSET спливань, "scan" — keyset
+            по таблиці (за замовчуванням BIN_REAPER_SOURCE)
+        chunk_size (int, optional): бінів у пачці (за замовчуванням BIN_REAPER_CHUNK_SIZE)
+        max_chunks (int, optional): обмеження кількості пачок за виклик
+        resume (bool): продовжити з checkpoint попереднього перерваного проходу
+        time_budget (float, optional): секунд на виклик; після вичерпання прохід
+            зупиняється між пачками і продовжиться з checkpoint
+        stop_event (threading.Event, optional): зовнішній сигнал зупинитися між пачками
+
+    Returns:
+        dict: {"source", "scanned", "deleted", "failed", "chunks", "elapsed", "bins_per_sec", "completed"}
+    """
+    chunk_size = chunk_size or getattr(settings, "BIN_REAPER_CHUNK_SIZE", 500)
+    source = source or getattr(settings, "BIN_REAPER_SOURCE", "index")
+    if source == "index":
+        return _reap_from_index(chunk_size, max_chunks, time_budget, stop_event)
+    if source != "scan":
+        raise ValueError(f"Unknown reaper source: {source}")
+    redis_client = get_redis_client()
+    now = timezone.now()
+    cursor = _load_checkpoint(redis_client) if resume else None
+    started = time.monotonic()
+    stats = {"source": "scan", "scanned": 0, "deleted": 0, "failed": 0, "chunks": 0, "completed": False}
+
+    base = Create_Bins.objects.filter(expiry_at__isnull=False, expiry_at__lt=now).order_by("expiry_at", "id")
+    while max_chunks is None or stats["chunks"] < max_chunks:
+        if stop_event is not None and stop_event.is_set():
+            break
+        if time_budget is not None and time.monotonic() - started >= time_budget:
+            break
+        queryset = base
+        if cursor is not None:
+            last_expiry, last_id = cursor
+            queryset = queryset.filter(
+                Q(expiry_at__gt=last_expiry) | Q(expiry_at=last_expiry, id__gt=last_id)
+            )
+        rows = list(queryset.values_list("id", "file_key", "hash", "expiry_at")[:chunk_size])
+        if not rows:
+            stats["completed"] = True
+            break
+        deleted, failed = _reap_chunk(rows)
+        stats["chunks"] += 1
+        stats["scanned"] += len(rows)
+        stats["deleted"] += deleted
+        stats["failed"] += failed
+        last = rows[-1]
+        cursor = (last[3], last[0])
+        _save_checkpoint(redis_client, *cursor)
+        if len(rows) < chunk_size:
+            stats["completed"] = True
+            break
+
+    if stats["completed"]:
+        _clear_checkpoint(redis_client)
+    return _finish(stats, started)
@@ -1,4 +1,4 @@
-from django.test import TestCase, Client
+from django.test import TestCase, Client, override_settings
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from unittest.mock import patch, MagicMock
@@ -8,6 +8,9 @@ from django.utils import timezone
 from datetime import timedelta
 import json
 import redis
+from bins.storage import get_s3_client, get_s3_client_stats, reset_s3_clients
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
 class CreateBinErrorTest(TestCase):
     def setUp(self):
@@ -16,6 +19,8 @@ class CreateBinErrorTest(TestCase):
             username="testuser", password="testpass"
         )
         self.client.login(username="testuser", password="testpass")
+        # Клієнт R2 кешується на процес — скидаємо, щоб підхопився мок boto3.client
+        reset_s3_clients()
 
     @patch("boto3.client")
     def test_create_bin_error_message(self, mock_boto):
@@ -153,6 +158,9 @@ class CreateBinSuccessTest(TestCase):
 class ViewBinTest(TestCase):
     """Тест перегляду біна"""
     def setUp(self):
+        from bins.redis_client import reset_redis_client
+        # Свіжий FakeRedis: черга переглядів не має містити записи інших тестів
+        reset_redis_client()
         User = get_user_model()
         self.user = User.objects.create_user(username="testuser", password="testpass")
         self.bin = Create_Bins.objects.create(
@@ -178,10 +186,16 @@ class ViewBinTest(TestCase):
         self.assertContains(response, "Public Bin")
 
     def test_view_count_increments(self):
+        from bins.view_tracking import flush_pending_views
         initial_count = self.bin.views_count
+        response = self.client.get(reverse("bins:view_bin", args=[self.bin.hash]))
+        # Поки перегляд у черзі, він уже видно на сторінці
+        self.assertEqual(response.context["bin"].views_count, initial_count + 1)
         self.client.get(reverse("bins:view_bin", args=[self.bin.hash]))
+        flush_pending_views()
         self.bin.refresh_from_db()
         self.assertEqual(self.bin.views_count, initial_count + 1)
+        self.assertEqual(self.bin.views.count(), 1)
 
 
 class EditBinTest(TestCase):
@@ -308,6 +322,28 @@ class LikeDislikeTest(TestCase):
         self.assertEqual(data["likes"], 0)
         self.assertEqual(data["dislikes"], 1)
 
+    def test_vote_service_is_idempotent_and_uses_f_updates(self):
+        from bins.services import vote_bin_service
+        other = get_user_model().objects.create_user(username="other", password="pass")
+        self.assertEqual(vote_bin_service(self.bin.pk, self.user, "like"), {"likes": 1, "dislikes": 0})
+        self.assertEqual(vote_bin_service(self.bin.pk, self.user, "like"), {"likes": 1, "dislikes": 0})
+        self.assertEqual(vote_bin_service(self.bin.pk, other, "dislike"), {"likes": 1, "dislikes": 1})
+        # Лічильник змінився "за спиною" — F() не перезаписує його застарілим значенням
+        Create_Bins.objects.filter(pk=self.bin.pk).update(likes_count=10)
+        with self.assertNumQueries(6):
+            # SAVEPOINT, SELECT голосу, UPDATE голосу, UPDATE лічильників, SELECT лічильників, RELEASE
+            counts = vote_bin_service(self.bin.pk, other, "like")
+        self.assertEqual(counts, {"likes": 11, "dislikes": 0})
+        self.assertEqual(BinLike.objects.filter(bin=self.bin).count(), 2)
+
+    def test_unknown_action(self):
+        self.client.login(username="testuser", password="pass")
+        response = self.client.post(
+            reverse("bins:bin_likes_dislikes", args=[self.bin.hash]),
+            {"action": "love"}
+        )
+        self.assertEqual(response.status_code, 400)
+
 
 class UserBinsListTest(TestCase):
     """Тест списку бінів користувача"""
@@ -425,3 +461,1402 @@ class CacheInvalidationTest(TestCase):
         # Перевіряємо відсутність кешу
         self.assertIsNone(redis_client.get(meta_key))
 
+
+class S3ClientRegistryTest(TestCase):
+    """Тест перевикористання boto3-клієнта для R2"""
+    def setUp(self):
+        reset_s3_clients()
+
+    def tearDown(self):
+        reset_s3_clients()
+
+    @patch("boto3.client")
+    def test_client_is_built_once_per_process(self, mock_boto):
+        before = get_s3_client_stats()
+        first = get_s3_client()
+        second = get_s3_client()
+
+        self.assertIs(first, second)
+        self.assertEqual(mock_boto.call_count, 1)
+        config = mock_boto.call_args.kwargs["config"]
+        self.assertEqual(config.max_pool_connections, 32)
+        after = get_s3_client_stats()
+        self.assertEqual(after["created"] - before["created"], 1)
+        self.assertEqual(after["reused"] - before["reused"], 1)
+
+
+class R2SingleRequestTest(TestCase):
+    """Тест: операції з R2 роблять одне звернення, без HEAD перед GET/DELETE"""
+    def _not_found(self):
+        from botocore.exceptions import ClientError
+        return ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+
+    @patch("bins.storage.get_s3_client")
+    def test_get_content_single_get(self, mock_client):
+        from bins.utils import get_bin_content
+        s3 = mock_client.return_value
+        s3.get_object.return_value = {"Body": MagicMock(read=lambda: b"hello")}
+
+        self.assertEqual(get_bin_content("bins/a.txt"), "hello")
+        s3.head_object.assert_not_called()
+        s3.get_object.assert_called_once()
+
+    @patch("bins.storage.get_s3_client")
+    def test_missing_content_returns_default(self, mock_client):
+        from bins.utils import get_bin_content
+        mock_client.return_value.get_object.side_effect = self._not_found()
+
+        self.assertEqual(get_bin_content("bins/missing.txt", default="nope"), "nope")
+
+    @patch("bins.storage.get_s3_client")
+    def test_delete_is_idempotent(self, mock_client):
+        from bins.utils import delete_from_r2
+        s3 = mock_client.return_value
+
+        self.assertTrue(delete_from_r2("bins/missing.txt"))
+        s3.head_object.assert_not_called()
+        s3.delete_object.assert_called_once()
+
+    def test_round_trips_header(self):
+        response = self.client.get(reverse("bins:api_bin_raw_hash", args=["nohash"]))
+        self.assertEqual(response["X-Storage-Round-Trips"], "0")
+
+
+class LocalContentStoreTest(TestCase):
+    """Тест локального (mmap) бекенда сховища контенту"""
+    def setUp(self):
+        import tempfile
+        from bins.storage import LocalContentStore
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = LocalContentStore(root=self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_put_get_range_delete(self):
+        self.assertEqual(self.store.put("bins/a.txt", "привіт, світ"), len("привіт, світ".encode("utf-8")))
+        self.assertEqual(self.store.get("bins/a.txt").decode("utf-8"), "привіт, світ")
+        self.assertEqual(self.store.get_range("bins/a.txt", 0, 1), "п".encode("utf-8"))
+        self.assertTrue(self.store.exists("bins/a.txt"))
+
+        self.assertTrue(self.store.delete("bins/a.txt"))
+        self.assertIsNone(self.store.get("bins/a.txt"))
+        self.assertIsNone(self.store.size("bins/a.txt"))
+        self.assertTrue(self.store.delete("bins/a.txt"))
+
+    def test_range_past_end_is_unsatisfiable(self):
+        from bins.storage import ContentStore, RangeNotSatisfiable
+        self.store.put("bins/r.txt", b"0123")
+        self.assertEqual(self.store.get_range("bins/r.txt", 2), b"23")
+        with self.assertRaises(RangeNotSatisfiable):
+            self.store.get_range("bins/r.txt", 4)
+        with self.assertRaises(RangeNotSatisfiable):
+            self.store.open_range("bins/r.txt", 10, 20)
+        self.assertIsNone(self.store.get_range("bins/none.txt", 0))
+        # Інтерфейс абстрактний: неповний бекенд не створюється
+        with self.assertRaises(TypeError):
+            ContentStore()
+
+    def test_empty_file_and_batches(self):
+        self.store.put_many({"bins/empty.txt": "", "bins/b.txt": b"b"})
+        self.assertEqual(self.store.get_many(["bins/empty.txt", "bins/b.txt", "bins/none.txt"]),
+                         {"bins/empty.txt": b"", "bins/b.txt": b"b", "bins/none.txt": None})
+        self.assertEqual(self.store.delete_many(["bins/b.txt"]), {"bins/b.txt": True})
+
+    def test_key_cannot_escape_root(self):
+        with self.assertRaises(ValueError):
+            self.store.put("../outside.txt", "x")
+
+    def test_selected_via_settings(self):
+        from django.test import override_settings
+        from bins.storage import get_content_store, reset_content_store
+        from bins.utils import upload_to_r2, get_bin_content
+        with override_settings(CONTENT_STORE_BACKEND="local", CONTENT_STORE_LOCAL_ROOT=self.tmp.name):
+            reset_content_store()
+            try:
+                self.assertEqual(get_content_store().name, "local")
+                self.assertEqual(upload_to_r2("bins/c.txt", "content"), "local://bins/c.txt")
+                self.assertEqual(get_bin_content("bins/c.txt"), "content")
+            finally:
+                reset_content_store()
+
+
+class R2ContentStoreBatchTest(TestCase):
+    """Тест пакетного видалення з R2 через DeleteObjects"""
+    @patch("bins.storage.get_s3_client")
+    def test_delete_many_batches_by_1000(self, mock_client):
+        from bins.storage import R2ContentStore
+        s3 = mock_client.return_value
+        s3.delete_objects.return_value = {"Errors": [{"Key": "k5", "Code": "InternalError"}]}
+
+        results = R2ContentStore().delete_many([f"k{i}" for i in range(1500)])
+
+        self.assertEqual(s3.delete_objects.call_count, 2)
+        self.assertFalse(results["k5"])
+        self.assertTrue(results["k1499"])
+
+
+
+class R2ContentStoreRangeTest(TestCase):
+    """Тест незадовольняльного діапазону в R2-бекенді"""
+    @patch("bins.storage.get_s3_client")
+    def test_invalid_range_maps_to_same_error_as_local(self, mock_client):
+        from botocore.exceptions import ClientError
+        from bins.storage import R2ContentStore, RangeNotSatisfiable
+        mock_client.return_value.get_object.side_effect = ClientError(
+            {"Error": {"Code": "InvalidRange"}, "ResponseMetadata": {"HTTPStatusCode": 416}}, "GetObject"
+        )
+        with self.assertRaises(RangeNotSatisfiable):
+            R2ContentStore().get_range("bins/r.txt", 10)
+        with self.assertRaises(RangeNotSatisfiable):
+            R2ContentStore().open_range("bins/r.txt", 10, 20)
+
+class RawContentStreamingTest(TestCase):
+    """Тест потокової віддачі raw-контенту"""
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(username="rawuser", password="pass")
+        self.bin = Create_Bins.objects.create(
+            title="Raw",
+            author=self.user,
+            hash="rawhash",
+            file_key="bins/raw.txt",
+            file_url="https://example.com/bins/raw.txt",
+        )
+
+    @patch("bins.storage.get_s3_client")
+    def test_r2_body_is_streamed(self, mock_client):
+        import io
+        payload = "рядок\n".encode("utf-8") * 1000
+        body = io.BytesIO(payload)
+        mock_client.return_value.get_object.return_value = {
+            "Body": body, "ContentLength": len(payload),
+        }
+
+        response = self.client.get(reverse("bins:api_bin_raw_hash", args=[self.bin.hash]))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Length"], str(len(payload)))
+        self.assertEqual(b"".join(response.streaming_content), payload)
+        self.assertTrue(body.closed)
+
+    def test_local_backend_uses_file_response(self):
+        import tempfile
+        from django.http import FileResponse
+        from django.test import override_settings
+        from bins.storage import get_content_store, reset_content_store
+        with tempfile.TemporaryDirectory() as root, \
+                override_settings(CONTENT_STORE_BACKEND="local", CONTENT_STORE_LOCAL_ROOT=root):
+            reset_content_store()
+            try:
+                get_content_store().put(self.bin.file_key, "local content")
+                response = self.client.get(reverse("bins:api_bin_raw_pk", args=[self.bin.pk]))
+                self.assertIsInstance(response, FileResponse)
+                self.assertEqual(response["Content-Length"], "13")
+                self.assertEqual(b"".join(response.streaming_content), b"local content")
+                response.close()
+            finally:
+                reset_content_store()
+
+
+class RawConditionalRangeTest(TestCase):
+    """Тест ETag / If-None-Match та Range для raw-ендпойнтів"""
+    def setUp(self):
+        from bins.utils import content_digest
+        User = get_user_model()
+        self.user = User.objects.create_user(username="rangeuser", password="pass")
+        self.content = b"0123456789"
+        self.bin = Create_Bins.objects.create(
+            title="Range",
+            author=self.user,
+            hash="rangehash",
+            file_key="bins/range.txt",
+            file_url="https://example.com/bins/range.txt",
+            size_bin=len(self.content),
+            content_digest=content_digest(self.content),
+        )
+        self.url = reverse("bins:api_bin_raw_hash", args=[self.bin.hash])
+
+    @patch("bins.storage.get_s3_client")
+    def test_if_none_match_returns_304_without_storage(self, mock_client):
+        from bins.utils import get_bin_etag
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=get_bin_etag(self.bin))
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], get_bin_etag(self.bin))
+        mock_client.return_value.get_object.assert_not_called()
+
+    @patch("bins.storage.get_s3_client")
+    def test_if_modified_since_returns_304_without_storage(self, mock_client):
+        from django.utils.http import http_date
+        # updated_at має мікросекунди, а заголовок — цілі секунди: той самий момент має давати 304
+        since = http_date(int(self.bin.updated_at.timestamp()))
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=since)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["Last-Modified"], since)
+        mock_client.return_value.get_object.assert_not_called()
+
+    @patch("bins.storage.get_s3_client")
+    def test_range_issues_ranged_get(self, mock_client):
+        import io
+        s3 = mock_client.return_value
+        s3.get_object.return_value = {"Body": io.BytesIO(self.content[2:5]), "ContentLength": 3}
+
+        response = self.client.get(self.url, HTTP_RANGE="bytes=2-4")
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], "bytes 2-4/10")
+        self.assertEqual(b"".join(response.streaming_content), b"234")
+        self.assertEqual(s3.get_object.call_args.kwargs["Range"], "bytes=2-4")
+
+    def test_unsatisfiable_range(self):
+        response = self.client.get(self.url, HTTP_RANGE="bytes=50-")
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response["Content-Range"], "bytes */10")
+
+    def test_parse_byte_range(self):
+        from bins.viewsapi import parse_byte_range
+        self.assertEqual(parse_byte_range("bytes=-3", 10), (7, 9))
+        self.assertEqual(parse_byte_range("bytes=5-", 10), (5, 9))
+        self.assertIsNone(parse_byte_range("bytes=0-1,4-5", 10))
+        self.assertIsNone(parse_byte_range("items=0-1", 10))
+
+
+class LocalLRUCacheTest(TestCase):
+    """Тест локального рівня кешу (LRU за байтами)"""
+    def test_evicts_least_recently_used_by_bytes(self):
+        from bins.cache import LocalLRUCache, ENTRY_OVERHEAD_BYTES
+        lru = LocalLRUCache(max_bytes=2 * (ENTRY_OVERHEAD_BYTES + 2 + 100), default_ttl=60)
+        lru.set("k1", b"x" * 100)
+        lru.set("k2", b"y" * 100)
+        self.assertEqual(lru.get("k1"), b"x" * 100)  # k1 стає свіжішим за k2
+        lru.set("k3", b"z" * 100)
+
+        self.assertIsNone(lru.get("k2"))
+        self.assertIsNotNone(lru.get("k1"))
+        stats = lru.stats()
+        self.assertEqual(stats["evictions"], 1)
+        self.assertEqual(stats["hits"], 2)
+        self.assertEqual(stats["misses"], 1)
+
+    def test_ttl_expiry(self):
+        from bins.cache import LocalLRUCache
+        lru = LocalLRUCache(max_bytes=10_000, default_ttl=60)
+        lru.set("k", "v", ttl=0)
+        self.assertIsNone(lru.get("k"))
+        self.assertEqual(lru.stats()["expirations"], 1)
+
+    @patch("bins.cache._get_redis")
+    def test_local_tier_served_without_redis(self, mock_redis):
+        from bins.cache import cache_get, clear_local_cache, invalidate_bin
+        clear_local_cache()
+        mock_redis.return_value.get.return_value = b"content"
+
+        self.assertEqual(cache_get("bin_content:lruhash"), b"content")
+        self.assertEqual(cache_get("bin_content:lruhash"), b"content")
+        self.assertEqual(mock_redis.return_value.get.call_count, 1)
+
+        invalidate_bin("lruhash")
+        mock_redis.return_value.publish.assert_called_once()
+        mock_redis.return_value.get.return_value = None
+        self.assertIsNone(cache_get("bin_content:lruhash"))
+
+
+class _IdlePubSubServer:
+    """Мінімальний RESP-сервер: підтверджує SUBSCRIBE і мовчить, доки тест не опублікує повідомлення."""
+    def __init__(self):
+        import socket
+        import threading
+        self.listener = socket.socket()
+        self.listener.bind(("127.0.0.1", 0))
+        self.listener.listen()
+        self.port = self.listener.getsockname()[1]
+        self.connections = []
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self):
+        import threading
+        while True:
+            try:
+                conn, _ = self.listener.accept()
+            except OSError:
+                return
+            self.connections.append(conn)
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _handle(self, conn):
+        reader = conn.makefile("rb")
+        try:
+            while True:
+                line = reader.readline()
+                if not line:
+                    return
+                args = []
+                for _ in range(int(line[1:])):
+                    length = int(reader.readline()[1:])
+                    args.append(reader.read(length + 2)[:-2])
+                if args[0].upper() == b"SUBSCRIBE":
+                    channel = args[1]
+                    conn.sendall(b"*3\r\n$9\r\nsubscribe\r\n$%d\r\n%s\r\n:1\r\n" % (len(channel), channel))
+                else:
+                    conn.sendall(b"+OK\r\n")
+        except OSError:
+            return
+
+    def publish(self, channel, data):
+        for conn in self.connections:
+            conn.sendall(b"*3\r\n$7\r\nmessage\r\n$%d\r\n%s\r\n$%d\r\n%s\r\n" % (
+                len(channel), channel, len(data), data))
+
+    def close(self):
+        self.listener.close()
+        for conn in self.connections:
+            conn.close()
+
+
+class InvalidationSubscriberTest(TestCase):
+    """Тест підписника інвалідації на тихому каналі"""
+    @patch("bins.cache.SUBSCRIBER_POLL_TIMEOUT", 0.1)
+    def test_idle_subscriber_keeps_local_entries(self):
+        import time
+        from bins.cache import InvalidationSubscriber, LocalLRUCache
+        server = _IdlePubSubServer()
+        self.addCleanup(server.close)
+        # socket_timeout як у спільного пулу, лише коротший — тиша довша за нього
+        client = redis.Redis(port=server.port, socket_timeout=0.3)
+        lru = LocalLRUCache(max_bytes=10_000, default_ttl=60)
+        lru.set("bin_content:idle", b"kept")
+        lru.set("bin_content:gone", b"dropped")
+        subscriber = InvalidationSubscriber(client, "bin_cache_invalidate", lru)
+        subscriber.start()
+        self.addCleanup(subscriber.join, 2)
+        self.addCleanup(subscriber.stop)
+
+        time.sleep(1.2)
+        self.assertEqual(lru.get("bin_content:idle"), b"kept")
+        self.assertEqual(len(server.connections), 1)  # без перепідключень
+
+        server.publish(b"bin_cache_invalidate", b"gone")
+        deadline = time.monotonic() + 2
+        while lru.get("bin_content:gone") is not None and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertIsNone(lru.get("bin_content:gone"))
+        self.assertEqual(lru.get("bin_content:idle"), b"kept")
+
+
+class RedisClientManagerTest(TestCase):
+    """Тест кешування вибору Redis-клієнта та circuit breaker"""
+    def setUp(self):
+        from bins.redis_client import reset_redis_client
+        reset_redis_client()
+
+    def tearDown(self):
+        from bins.redis_client import reset_redis_client
+        reset_redis_client()
+
+    @patch("bins.redis_client.RedisClientManager._start_health_thread")
+    @patch("bins.redis_client.redis.Redis")
+    def test_client_and_ping_are_not_repeated(self, mock_redis, mock_thread):
+        first = get_redis_client()
+        second = get_redis_client()
+
+        self.assertIs(first, second)
+        self.assertIs(first, mock_redis.return_value)
+        self.assertEqual(mock_redis.call_count, 1)
+        self.assertEqual(mock_redis.return_value.ping.call_count, 1)
+
+    @patch("bins.redis_client.RedisClientManager._start_health_thread")
+    @patch("bins.redis_client.redis.Redis")
+    def test_circuit_opens_and_closes(self, mock_redis, mock_thread):
+        from bins.redis_client import FakeRedis, get_redis_status, _manager
+        mock_redis.return_value.ping.side_effect = redis.ConnectionError("down")
+
+        self.assertIsInstance(get_redis_client(), FakeRedis)
+        self.assertTrue(get_redis_status()["circuit_open"])
+
+        # Фоновий ping після cool-down: Redis повернувся
+        mock_redis.return_value.ping.side_effect = None
+        self.assertTrue(_manager._ping())
+        _manager._close()
+        self.assertIs(get_redis_client(), mock_redis.return_value)
+
+
+class CachePolicyTest(TestCase):
+    """Тест політики кешування: допуск за частотою, single-flight, раннє оновлення"""
+    def setUp(self):
+        from bins.cache import clear_local_cache
+        from bins.cache_policy import reset_policy
+        from bins.redis_client import FakeRedis
+        clear_local_cache()
+        reset_policy()
+        self.redis = FakeRedis()
+        patcher = patch("bins.cache._get_redis", return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_sketch_ages_out_old_popularity(self):
+        from bins.cache_policy import FrequencySketch
+        sketch = FrequencySketch(window=8)
+        for _ in range(4):
+            sketch.increment("hot")
+        self.assertEqual(sketch.estimate("hot"), 4)
+        for i in range(4):
+            sketch.increment(f"other{i}")
+        # Після 8 інкрементів лічильники поділено навпіл
+        self.assertEqual(sketch.estimate("hot"), 2)
+
+    def test_cold_bin_is_not_cached(self):
+        from bins.cache_policy import get_bin_content_cached
+        bin = MagicMock(hash="coldhash")
+        fetch = MagicMock(return_value="content")
+        with self.settings(BIN_CACHE_ADMISSION_THRESHOLD=3):
+            self.assertEqual(get_bin_content_cached(bin, fetch), "content")
+        self.assertIsNone(self.redis.get("bin_content:coldhash"))
+
+    def test_single_flight_fetches_once(self):
+        import threading
+        import time
+        from bins.cache_policy import get_bin_content_cached, record_access
+        bin = MagicMock(hash="hothash")
+        record_access("hothash")
+        fetch_calls = []
+
+        def slow_fetch(b):
+            fetch_calls.append(b.hash)
+            time.sleep(0.05)
+            return "content"
+
+        results = []
+        with self.settings(BIN_CACHE_ADMISSION_THRESHOLD=1):
+            threads = [
+                threading.Thread(target=lambda: results.append(get_bin_content_cached(bin, slow_fetch)))
+                for _ in range(8)
+            ]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        self.assertEqual(results, ["content"] * 8)
+        self.assertEqual(len(fetch_calls), 1)
+        self.assertIsNone(self.redis.get("bin_content_lock:hothash"))
+
+    @patch("bins.storage.get_s3_client")
+    def test_storage_error_is_not_cached(self, mock_client):
+        from bins.cache import cache_get
+        from bins.cache_policy import get_bin_content_cached, record_access
+        from bins.utils import get_bin_content
+        mock_client.return_value.get_object.side_effect = RuntimeError("R2 down")
+        bin = MagicMock(hash="errhash", file_key="bins/err.txt", file_url="https://example.com/bins/err.txt")
+        record_access("errhash")
+        with self.settings(BIN_CACHE_ADMISSION_THRESHOLD=1):
+            content = get_bin_content_cached(bin, lambda b: get_bin_content(b, default=None))
+
+        self.assertIsNone(content)
+        self.assertIsNone(cache_get("bin_content:errhash"))
+
+    def test_local_locks_are_striped(self):
+        from bins.cache_policy import LOCAL_LOCK_STRIPES, _local_lock, _local_locks
+        locks = {id(_local_lock(f"hash{i}")) for i in range(10 * LOCAL_LOCK_STRIPES)}
+        # Скільки б хешів не пройшло, замків — фіксована кількість
+        self.assertLessEqual(len(locks), LOCAL_LOCK_STRIPES)
+        self.assertEqual(len(_local_locks), LOCAL_LOCK_STRIPES)
+        self.assertIs(_local_lock("hash1"), _local_lock("hash1"))
+
+    def test_early_refresh(self):
+        import time
+        from bins.cache import cache_get_entry, cache_set
+        from bins.cache_policy import should_refresh_early
+        cache_set("bin_content:xf", "v", 60, delta=0.5)
+        value, expires_at, delta = cache_get_entry("bin_content:xf")
+        self.assertEqual(value, b"v")
+        self.assertEqual(delta, 0.5)
+        self.assertFalse(should_refresh_early(expires_at, delta, now=time.time()))
+        self.assertTrue(should_refresh_early(expires_at, delta, now=expires_at))
+        self.assertFalse(should_refresh_early(None, None))
+
+
+class SmartSearchTest(TestCase):
+    """Тест пошуку з ранжуванням у БД (SQLite-гілка bins/search.py)"""
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(username="searchuser", password="testpass")
+
+        def make(title, **kwargs):
+            return Create_Bins.objects.create(title=title, author=self.user, hash=f"s_{title}", **kwargs)
+
+        self.tagged = make("Notes", tags="django,orm")
+        self.contains = make("My django tricks")
+        self.prefix = make("Django cheatsheet")
+        self.exact = make("django")
+        self.ruby = make("Scripts", language="ruby")
+        self.expired = make("django old", expiry_at=timezone.now() - timedelta(days=1))
+        self.private = make("Private notes", tags="django", access="private")
+
+    def test_results_ranked_by_relevance(self):
+        from bins.utils import smart_search
+        results = list(smart_search("Django"))
+        self.assertEqual(results[:3], [self.exact, self.prefix, self.contains])
+        self.assertIn(self.tagged, results)
+        self.assertNotIn(self.expired, results)
+        self.assertNotIn(self.ruby, results)
+
+    def test_language_match(self):
+        from bins.utils import smart_search
+        self.assertEqual(list(smart_search("ruby")), [self.ruby])
+
+    def test_api_keeps_rank_order_and_paginates(self):
+        response = self.client.get(reverse("bins:api_search_bins"), {"q": "django"})
+        self.assertEqual(response.status_code, 200)
+        titles = [item["title"] for item in response.json()["results"]]
+        self.assertEqual(titles[:3], ["django", "Django cheatsheet", "My django tricks"])
+        self.assertNotIn("Private notes", titles)
+
+
+class FuzzySearchIndexTest(TestCase):
+    """Тест in-memory пошукового індексу (SEARCH_BACKEND = "memory")"""
+    def setUp(self):
+        from bins.search_index import reset_search_index
+        reset_search_index()
+        self.addCleanup(reset_search_index)
+        User = get_user_model()
+        self.user = User.objects.create_user(username="indexuser", password="testpass")
+        self.bin = Create_Bins.objects.create(title="Redis cheatsheet", author=self.user, hash="idx1")
+        self.other = Create_Bins.objects.create(title="Bookmarks", tags="redis", author=self.user, hash="idx2")
+        Create_Bins.objects.create(
+            title="Redis expired", author=self.user, hash="idx3", expiry_at=timezone.now() - timedelta(days=1)
+        )
+
+    def test_index_search_and_signals(self):
+        from bins.search_index import get_search_index
+        index = get_search_index(wait=True)
+        self.assertEqual(len(index), 2)
+        self.assertEqual([pk for pk, _ in index.search("redis")], [self.other.pk, self.bin.pk])
+
+        # post_save оновлює індекс без перебудови
+        new = Create_Bins.objects.create(title="Python tips", author=self.user, hash="idx4")
+        self.assertEqual([pk for pk, _ in index.search("python tips")], [new.pk])
+        self.other.tags = ""
+        self.other.save()
+        self.assertEqual([pk for pk, _ in index.search("redis")], [self.bin.pk])
+
+        # post_delete прибирає запис
+        self.bin.delete()
+        self.assertEqual(index.search("redis"), [])
+        self.assertEqual(len(index), 2)
+
+    def test_smart_search_memory_backend(self):
+        from bins.search_index import get_search_index
+        from bins.utils import smart_search
+        get_search_index(wait=True)
+        with self.settings(SEARCH_BACKEND="memory"):
+            results = list(smart_search("cheatsheet"))
+        self.assertEqual(results, [self.bin])
+
+    def test_stale_index_is_rebuilt_in_background(self):
+        from bins import search_index
+        old = search_index.get_search_index(wait=True)
+        # Рядки, які фонова збірка прочитала до того, як бін видалили
+        rows = list(search_index._index_rows())
+        started = []
+        with self.settings(SEARCH_INDEX_REBUILD_INTERVAL=0), \
+                patch.object(search_index.threading, "Thread") as thread:
+            thread.return_value.start.side_effect = lambda: started.append(thread.call_args.kwargs["target"])
+            # Застарілий індекс віддається одразу, збірка лише запускається
+            self.assertIs(search_index.get_search_index(), old)
+            self.assertIs(search_index.get_search_index(), old)
+        self.assertEqual(len(started), 1)
+
+        self.bin.delete()
+        with patch.object(search_index, "_index_rows", return_value=rows), \
+                patch.object(search_index.connection, "close"):
+            started[0]()
+        index = search_index.get_search_index()
+        self.assertIsNot(index, old)
+        # Видалення під час збірки догнано журналом
+        self.assertEqual([pk for pk, _ in index.search("redis")], [self.other.pk])
+
+
+class ViewTrackingTest(TestCase):
+    """Тест буферизованого підрахунку переглядів"""
+    def setUp(self):
+        from bins.redis_client import FakeRedis
+        self.redis = FakeRedis()
+        patcher = patch("bins.view_tracking._get_redis", return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        User = get_user_model()
+        self.user = User.objects.create_user(username="viewer", password="testpass")
+        self.bin = Create_Bins.objects.create(title="Viewed", author=self.user, hash="viewedhash")
+
+    def test_dedup_by_session_and_user(self):
+        from bins.view_tracking import record_view, get_pending_views
+        self.assertTrue(record_view(self.bin.pk, "s1"))
+        self.assertFalse(record_view(self.bin.pk, "s1"))
+        self.assertTrue(record_view(self.bin.pk, "s2", user_id=self.user.pk))
+        # Той самий користувач з іншої сесії — не новий перегляд
+        self.assertFalse(record_view(self.bin.pk, "s3", user_id=self.user.pk))
+        self.assertEqual(get_pending_views(self.bin.pk), 2)
+
+    def test_flush_bulk_writes_views(self):
+        from bins.view_tracking import record_view, flush_pending_views, get_pending_views
+        for i in range(5):
+            record_view(self.bin.pk, f"session{i}")
+        record_view(999999, "orphan")
+
+        with self.assertNumQueries(5):
+            # SELECT id, SAVEPOINT, один bulk INSERT, один UPDATE ... F() на бін, RELEASE
+            stats = flush_pending_views(batch_size=100)
+        self.assertEqual(stats, {"views": 5, "rows": 5, "bins": 1, "dropped": 1})
+        self.bin.refresh_from_db()
+        self.assertEqual(self.bin.views_count, 5)
+        self.assertEqual(self.bin.views.count(), 5)
+        self.assertEqual(get_pending_views(self.bin.pk), 0)
+        self.assertEqual(flush_pending_views(), {"views": 0, "rows": 0, "bins": 0, "dropped": 0})
+
+    def test_failed_flush_keeps_batch_for_next_pass(self):
+        from bins.view_tracking import PROCESSING_KEY, QUEUE_KEY, record_view, flush_pending_views, get_pending_views
+        for i in range(3):
+            record_view(self.bin.pk, f"session{i}")
+        with patch("bins.view_tracking.ViewBin.objects.bulk_create", side_effect=RuntimeError("db down")):
+            with self.assertRaises(RuntimeError):
+                flush_pending_views()
+        # Пачка чекає в processing, pending не зменшено
+        self.assertEqual((self.redis.llen(PROCESSING_KEY), self.redis.llen(QUEUE_KEY)), (3, 0))
+        self.assertEqual(get_pending_views(self.bin.pk), 3)
+        record_view(self.bin.pk, "late")
+        self.assertEqual(flush_pending_views()["views"], 4)
+        self.bin.refresh_from_db()
+        self.assertEqual(self.bin.views_count, 4)
+        self.assertEqual((self.redis.llen(PROCESSING_KEY), get_pending_views(self.bin.pk)), (0, 0))
+
+    def test_record_view_is_all_or_nothing(self):
+        from bins.view_tracking import QUEUE_KEY, record_view, get_pending_views
+        with patch("bins.redis_client.FakePipeline.execute", side_effect=redis.ConnectionError("down")):
+            self.assertFalse(record_view(self.bin.pk, "s1"))
+        self.assertEqual((get_pending_views(self.bin.pk), self.redis.llen(QUEUE_KEY)), (0, 0))
+
+    def test_hll_mode_without_rows(self):
+        from bins.view_tracking import record_view, flush_pending_views
+        with self.settings(BIN_VIEWS_DEDUP_MODE="hll", BIN_VIEWS_ROW_SAMPLE_RATE=0):
+            self.assertTrue(record_view(self.bin.pk, "s1"))
+            self.assertFalse(record_view(self.bin.pk, "s1"))
+            self.assertTrue(record_view(self.bin.pk, "s2", user_id=self.user.pk))
+            stats = flush_pending_views()
+        self.assertEqual(stats["views"], 2)
+        self.assertEqual(stats["rows"], 0)
+        self.bin.refresh_from_db()
+        self.assertEqual(self.bin.views_count, 2)
+        self.assertFalse(self.bin.views.exists())
+
+    def test_hll_mode_dedup_does_not_rely_on_pfadd(self):
+        from bins.view_tracking import record_view, get_pending_views
+        # Справжній PFADD часто повертає 0 для нового глядача популярного біна
+        self.redis.pfadd = MagicMock(return_value=0)
+        with self.settings(BIN_VIEWS_DEDUP_MODE="hll"):
+            self.assertEqual([record_view(self.bin.pk, f"s{i}") for i in range(50)], [True] * 50)
+            self.assertFalse(record_view(self.bin.pk, "s7"))
+        self.assertEqual(get_pending_views(self.bin.pk), 50)
+
+    def test_unique_viewers_api(self):
+        from bins.view_tracking import record_view
+        # Фіксований час: на межі години перегляди й запит потрапили б у різні кошики
+        frozen = timezone.now().replace(minute=30, second=0, microsecond=0)
+        with patch("bins.view_tracking.timezone.now", return_value=frozen):
+            record_view(self.bin.pk, "s1")
+            record_view(self.bin.pk, "s2")
+            record_view(self.bin.pk, "s2")
+            url = reverse("bins:api_bin_unique_viewers", args=[self.bin.pk])
+            response = self.client.get(url, {"bucket": "hour", "periods": 3})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data["total"], 2)
+        self.assertEqual(data["standard_error"], 0.0081)
+        self.assertEqual([b["unique_viewers"] for b in data["buckets"]], [0, 0, 2])
+        self.assertEqual(self.client.get(url, {"bucket": "week"}).status_code, 400)
+
+
+class BulkDeleteTest(TestCase):
+    """Тест пакетного видалення бінів"""
+    def setUp(self):
+        import tempfile
+        from rest_framework.test import APIClient
+        from bins.storage import get_content_store, reset_content_store
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        overrides = self.settings(CONTENT_STORE_BACKEND="local", CONTENT_STORE_LOCAL_ROOT=self.tmp.name)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        reset_content_store()
+        self.addCleanup(reset_content_store)
+        self.store = get_content_store()
+
+        User = get_user_model()
+        self.user = User.objects.create_user(username="bulkowner", password="pass")
+        self.other = User.objects.create_user(username="bulkother", password="pass")
+        self.mine = []
+        for i in range(3):
+            key = f"bins/bulk_{i}.txt"
+            self.store.put(key, f"content {i}")
+            self.mine.append(Create_Bins.objects.create(title=f"b{i}", author=self.user, file_key=key, hash=f"bulk{i}"))
+        self.foreign = Create_Bins.objects.create(title="foreign", author=self.other, hash="bulkforeign")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_bulk_delete_per_id_results(self):
+        # Повторений id рахується один раз — у results і в total_requested
+        ids = [self.mine[0].pk, 999999, self.foreign.pk, self.mine[1].pk, self.mine[0].pk, self.mine[2].pk]
+        with patch("bins.storage.LocalContentStore.delete_many", wraps=self.store.delete_many) as delete_many:
+            response = self.client.post(reverse("bins:api_bulk_delete_bins"), {"bin_ids": ids}, format="json")
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data["deleted"], 3)
+        self.assertEqual(data["total_requested"], len(data["results"]))
+        self.assertEqual(data["total_requested"], 5)
+        self.assertEqual([r["status"] for r in data["results"]],
+                         ["deleted", "not_found", "forbidden", "deleted", "deleted"])
+        self.assertEqual(data["skipped"], [{"bin_id": self.foreign.pk, "reason": "Permission denied"}])
+        self.assertEqual(data["errors"], [{"bin_id": 999999, "error": "Bin not found"}])
+        delete_many.assert_called_once()
+        self.assertFalse(Create_Bins.objects.filter(pk__in=[b.pk for b in self.mine]).exists())
+        self.assertTrue(Create_Bins.objects.filter(pk=self.foreign.pk).exists())
+        self.assertFalse(self.store.exists("bins/bulk_0.txt"))
+
+    def test_failed_file_delete_keeps_bin(self):
+        from bins.services import bulk_delete_bins_service
+        failed_key = self.mine[1].file_key
+        with patch("bins.storage.LocalContentStore.delete_many",
+                   return_value={b.file_key: b.file_key != failed_key for b in self.mine}):
+            results = bulk_delete_bins_service([b.pk for b in self.mine], self.user)
+        self.assertEqual([r["status"] for r in results], ["deleted", "error", "deleted"])
+        self.assertEqual(list(Create_Bins.objects.filter(author=self.user)), [self.mine[1]])
+
+
+class ExpiredBinReaperTest(TestCase):
+    """Тест reaper'а прострочених бінів (пачки, checkpoint, пакетні видалення)"""
+    def setUp(self):
+        from bins.redis_client import FakeRedis
+        self.redis = FakeRedis()
+        for target in ("bins.tasks.get_redis_client", "bins.expiry_index._get_redis"):
+            patcher = patch(target, return_value=self.redis)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        User = get_user_model()
+        self.user = User.objects.create_user(username="reaper", password="pass")
+        past = timezone.now() - timedelta(hours=1)
+        self.expired = [
+            Create_Bins.objects.create(
+                title=f"e{i}", author=self.user, hash=f"exp{i}", file_key=f"bins/exp{i}.txt",
+                expiry_at=past + timedelta(seconds=i),
+            )
+            for i in range(5)
+        ]
+        self.alive = Create_Bins.objects.create(
+            title="alive", author=self.user, hash="alive", expiry_at=timezone.now() + timedelta(days=1)
+        )
+
+    @patch("bins.tasks.delete_many_from_r2")
+    def test_chunks_checkpoint_and_resume(self, mock_delete_many):
+        from bins.tasks import delete_expired_bins, CHECKPOINT_KEY
+        mock_delete_many.side_effect = lambda keys: {key: key != "bins/exp1.txt" for key in keys}
+
+        stats = delete_expired_bins(chunk_size=2, max_chunks=1, source="scan")
+        self.assertEqual((stats["deleted"], stats["failed"], stats["completed"]), (1, 1, False))
+        self.assertIsNotNone(self.redis.get(CHECKPOINT_KEY))
+        # Один пакетний виклик на пачку
+        mock_delete_many.assert_called_once_with(["bins/exp0.txt", "bins/exp1.txt"])
+
+        # Продовження з checkpoint: бін з невдалим видаленням файлу не перебирається повторно
+        stats = delete_expired_bins(chunk_size=2, source="scan")
+        self.assertEqual((stats["scanned"], stats["deleted"], stats["completed"]), (3, 3, True))
+        self.assertIsNone(self.redis.get(CHECKPOINT_KEY))
+        self.assertEqual(
+            set(Create_Bins.objects.values_list("hash", flat=True)), {"exp1", "alive"}
+        )
+
+        # Новий повний прохід підбирає пропущений бін
+        mock_delete_many.side_effect = lambda keys: {key: True for key in keys}
+        stats = delete_expired_bins(source="scan")
+        self.assertEqual(stats["deleted"], 1)
+        self.assertEqual(list(Create_Bins.objects.values_list("hash", flat=True)), ["alive"])
+
+    def test_time_budget_and_stop_event(self):
+        import threading
+        from bins.tasks import delete_expired_bins
+        self.assertEqual(delete_expired_bins(time_budget=0)["chunks"], 0)
+        stop = threading.Event()
+        stop.set()
+        self.assertEqual(delete_expired_bins(stop_event=stop)["chunks"], 0)
+        self.assertEqual(Create_Bins.objects.count(), 6)
+
+    def test_leader_lock_single_leader(self):
+        from bins.tasks import ReaperLeaderLock
+        first = ReaperLeaderLock(self.redis, ttl=60)
+        second = ReaperLeaderLock(self.redis, ttl=60)
+        self.assertTrue(first.acquire())
+        self.assertFalse(second.acquire())
+        # Лідер продовжує своє лідерство
+        self.assertTrue(first.acquire())
+        first.release()
+        self.assertTrue(second.acquire())
+
+    def test_leader_lock_never_touches_foreign_lock(self):
+        from bins.tasks import LEADER_KEY, ReaperLeaderLock
+        lock = ReaperLeaderLock(self.redis, ttl=60)
+        self.assertTrue(lock.acquire())
+        # Замок сплив і дістався іншій репліці — старий лідер не продовжує і не знімає його
+        self.redis.set(LEADER_KEY, "other-replica", px=60000)
+        self.assertFalse(lock.acquire())
+        lock.release()
+        self.assertEqual(self.redis.get(LEADER_KEY), b"other-replica")
+
+    @patch("bins.tasks.delete_many_from_r2")
+    def test_index_source_reaps_without_table_scan(self, mock_delete_many):
+        from bins.expiry_index import EXPIRY_INDEX_KEY
+        from bins.tasks import delete_expired_bins
+        mock_delete_many.side_effect = lambda keys: {key: True for key in keys}
+        # Сигнали занесли в індекс усі біни з терміном
+        self.assertEqual(self.redis.zcard(EXPIRY_INDEX_KEY), 6)
+        # Член без рядка в БД (бін видалено в обхід reaper'а) просто прибирається
+        self.redis.zadd(EXPIRY_INDEX_KEY, {"999999": 1})
+
+        stats = delete_expired_bins(chunk_size=4, source="index")
+        self.assertEqual((stats["deleted"], stats["scanned"], stats["completed"]), (5, 6, True))
+        self.assertEqual(list(Create_Bins.objects.values_list("hash", flat=True)), ["alive"])
+        self.assertEqual(self.redis.zcard(EXPIRY_INDEX_KEY), 1)
+
+    @patch("bins.tasks.delete_many_from_r2")
+    def test_daemon_scan_reaps_bins_missing_from_index(self, mock_delete_many):
+        from io import StringIO
+        from django.core.management import call_command
+        from bins.expiry_index import EXPIRY_INDEX_KEY
+        from bins.management.commands import delete_expired_bins as command
+        mock_delete_many.side_effect = lambda keys: {key: True for key in keys}
+        # Redis скинуто: індекс спливань порожній, прострочені біни є лише в таблиці
+        self.redis.delete(EXPIRY_INDEX_KEY)
+        sources = []
+
+        def reap(**kwargs):
+            sources.append(kwargs["source"])
+            stats = real_reap(**kwargs)
+            if kwargs["source"] == "scan":
+                kwargs["stop_event"].set()
+            return stats
+
+        real_reap = command.delete_expired_bins
+        with patch.object(command, "delete_expired_bins", side_effect=reap), \
+                patch.object(command, "get_redis_client", return_value=self.redis), \
+                patch.object(command, "is_fallback_client", return_value=False), \
+                patch.object(command.signal, "signal"), \
+                patch("bins.leaderboard._get_redis", return_value=self.redis):
+            call_command(
+                "delete_expired_bins", daemon=True, interval=0, jitter=0, scan_interval=0,
+                stdout=StringIO(), stderr=StringIO(),
+            )
+
+        self.assertEqual(sources, ["index", "scan"])
+        self.assertEqual(list(Create_Bins.objects.values_list("hash", flat=True)), ["alive"])
+
+    def test_expired_bin_is_404_from_index(self):
+        from bins.expiry_index import is_expired
+        self.assertTrue(is_expired(self.expired[0].pk))
+        self.assertFalse(is_expired(self.alive.pk))
+        response = self.client.get(reverse("bins:api_get_bin", args=[self.expired[0].pk]))
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(reverse("bins:view_bin", args=[self.expired[0].hash]))
+        self.assertEqual(response.status_code, 404)
+
+        # Продовження терміну переплановує бін
+        self.expired[0].expiry_at = timezone.now() + timedelta(days=1)
+        self.expired[0].save(update_fields=["expiry_at"])
+        self.assertFalse(is_expired(self.expired[0].pk))
+
+
+class KeysetPaginationTest(TestCase):
+    """Тест курсорної пагінації списків (bins/pagination.py)"""
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(username="pager", password="pass")
+        self.bins = [
+            Create_Bins.objects.create(title=f"Page {i}", author=self.user, hash=f"page{i}", likes_count=i % 3)
+            for i in range(7)
+        ]
+        # Однаковий created_at у кількох бінів — порядок між ними тримає id
+        same = timezone.now() - timedelta(hours=1)
+        Create_Bins.objects.filter(pk__in=[b.pk for b in self.bins[2:5]]).update(created_at=same)
+
+    def walk(self, url, params):
+        seen = []
+        response = self.client.get(url, params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            self.assertNotIn("count", data)
+            seen.extend(item["id"] for item in data["results"])
+            if not data["next"]:
+                return seen, data
+            response = self.client.get(data["next"])
+
+    def test_cursor_walk_matches_page_order(self):
+        url = reverse("bins:api_public_bins")
+        expected = list(
+            Create_Bins.objects.order_by("-created_at", "-id").values_list("id", flat=True)
+        )
+        seen, last = self.walk(url, {"pagination": "cursor", "page_size": 3})
+        self.assertEqual(seen, expected)
+        # Назад з останньої сторінки — попередні 3 біни в тому ж порядку
+        previous = self.client.get(last["previous"]).json()
+        self.assertEqual([item["id"] for item in previous["results"]], expected[3:6])
+
+    def test_popular_cursor_order(self):
+        seen, _ = self.walk(reverse("bins:api_popular_bins"), {"pagination": "cursor", "page_size": 2})
+        expected = list(
+            Create_Bins.objects.order_by("-likes_count", "-created_at", "-id").values_list("id", flat=True)
+        )
+        self.assertEqual(seen, expected)
+
+    def test_deep_page_without_count(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from bins.pagination import paginate_keyset
+        queryset = Create_Bins.objects.all()
+        _, cursor, _ = paginate_keyset(queryset, ("-created_at", "-id"), 3)
+        with CaptureQueriesContext(connection) as ctx:
+            items, _, previous = paginate_keyset(queryset, ("-created_at", "-id"), 3, cursor)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertNotIn("COUNT(", ctx.captured_queries[0]["sql"].upper())
+        self.assertNotIn("OFFSET", ctx.captured_queries[0]["sql"].upper())
+        self.assertEqual(len(items), 3)
+        self.assertIsNotNone(previous)
+
+    def test_search_cursor_keeps_rank_order(self):
+        from bins.utils import smart_search
+        expected = [b.pk for b in smart_search("page").filter(access="public").order_by("-search_rank", "-created_at", "-id")]
+        seen, _ = self.walk(reverse("bins:api_search_bins"), {"q": "page", "pagination": "cursor", "page_size": 3})
+        self.assertEqual(seen, expected)
+
+    def test_invalid_cursor_is_404(self):
+        response = self.client.get(reverse("bins:api_public_bins"), {"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_main_view_cursor_mode(self):
+        response = self.client.get(reverse("main:index"), {"pagination": "cursor"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["bins_page"]), 5)
+        self.assertIsNotNone(response.context["next_cursor"])
+        response = self.client.get(reverse("main:index"), {"pagination": "cursor", "cursor": response.context["next_cursor"]})
+        self.assertEqual(len(response.context["bins_page"]), 2)
+        self.assertIsNone(response.context["next_cursor"])
+
+
+
+class QueryPlanTest(TestCase):
+    """
+    Регресійні тести планів запитів списків на засіяних даних.
+
+    Для кожного ендпоінта береться SQL сторінки і його EXPLAIN: повний скан
+    create_bin або окреме сортування означають, що запит знову не потрапляє
+    в індекс. На PostgreSQL seqscan/sort вимикаються, щоб перевіряти, чи план
+    без них узагалі можливий, а не вибір планувальника на малій таблиці.
+    """
+    def setUp(self):
+        User = get_user_model()
+        self.user = User.objects.create_user(username="planner", password="pass")
+        # Порожній лідерборд: /api/popular/ іде в БД, і план цього запиту теж перевіряється
+        from bins.redis_client import reset_redis_client
+        reset_redis_client()
+        authors = [self.user] + [User.objects.create(username=f"planner{i}") for i in range(20)]
+        now = timezone.now()
+        Create_Bins.objects.bulk_create([
+            Create_Bins(
+                title=f"Plan {i}", author=authors[i % len(authors)], hash=f"plan{i}",
+                access="private" if i % 4 == 0 else "public",
+                language=("python", "ruby", "none")[i % 3],
+                category=("Software", "NONE")[i % 2],
+                likes_count=i % 7,
+                expiry_at=now + timedelta(days=1) if i % 5 == 0 else None,
+            )
+            for i in range(300)
+        ])
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+            if connection.vendor == "postgresql":
+                cursor.execute("SET LOCAL enable_seqscan = off")
+                cursor.execute("SET LOCAL enable_sort = off")
+
+    def page_query(self, url, params):
+        """SQL запиту сторінки (SELECT ... FROM create_bin ... ORDER BY), виконаного ендпоінтом, і відповідь."""
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        queries = [q["sql"] for q in ctx.captured_queries if 'FROM "create_bin"' in q["sql"] and "ORDER BY" in q["sql"]]
+        self.assertEqual(len(queries), 1, queries)
+        return queries[0], response
+
+    def explain(self, sql):
+        prefix = "EXPLAIN (COSTS OFF) " if connection.vendor == "postgresql" else "EXPLAIN QUERY PLAN "
+        with connection.cursor() as cursor:
+            cursor.execute(prefix + sql)
+            return [str(row[-1]) for row in cursor.fetchall()]
+
+    def assertIndexedPlan(self, name, params=None, allow_sort=False):
+        sql, response = self.page_query(reverse(name), params or {})
+        self.assertPlanUsesIndex(sql, allow_sort)
+        return response
+
+    def assertCursorPlans(self, name, params=None):
+        """Перша сторінка і сторінка за курсором `next` з її відповіді (умова keyset) — обидві з індексу."""
+        params = {**(params or {}), "pagination": "cursor"}
+        response = self.assertIndexedPlan(name, params)
+        if response.get("Content-Type", "").startswith("application/json"):
+            next_url = response.json()["next"]
+            self.assertIsNotNone(next_url)
+            sql, _ = self.page_query(next_url, {})
+        else:
+            self.assertIsNotNone(response.context["next_cursor"])
+            sql, _ = self.page_query(reverse(name), {**params, "cursor": response.context["next_cursor"]})
+        self.assertPlanUsesIndex(sql)
+
+    def assertPlanUsesIndex(self, sql, allow_sort=False):
+        plan = self.explain(sql)
+        text = "\n".join(plan)
+        for line in plan:
+            line = line.strip()
+            if connection.vendor == "postgresql":
+                node = line.lstrip("-> ")
+                seq_scan = "Seq Scan on create_bin" in node
+                sort = node.startswith(("Sort", "Incremental Sort"))
+            else:
+                seq_scan = line in ("SCAN create_bin", "SCAN TABLE create_bin")
+                sort = line.startswith("USE TEMP B-TREE FOR") and "ORDER BY" in line
+            self.assertFalse(seq_scan, f"Sequential scan of create_bin:\n{text}")
+            if not allow_sort:
+                self.assertFalse(sort, f"Sort outside of an index:\n{text}")
+
+    def test_public_list(self):
+        self.assertIndexedPlan("bins:api_public_bins")
+        self.assertCursorPlans("bins:api_public_bins")
+
+    def test_public_list_filtered(self):
+        self.assertIndexedPlan("bins:api_public_bins", {"language": "python"})
+        self.assertCursorPlans("bins:api_public_bins", {"category": "Software"})
+
+    def test_popular(self):
+        self.assertIndexedPlan("bins:api_popular_bins")
+        self.assertCursorPlans("bins:api_popular_bins")
+
+    def test_my_bins(self):
+        self.client.login(username="planner", password="pass")
+        self.assertIndexedPlan("bins:api_my_bins")
+        # У planner ~15 бінів — менша сторінка, щоб був `next`
+        self.assertCursorPlans("bins:api_my_bins", {"page_size": 5})
+
+    def test_main_page(self):
+        self.assertIndexedPlan("main:index")
+        self.assertCursorPlans("main:index")
+
+    def test_search(self):
+        # Пошук сортує за релевантністю, тож сортування тут очікуване; на SQLite
+        # icontains без триграмних індексів завжди сканує таблицю
+        if connection.vendor != "postgresql":
+            self.skipTest("Trigram indexes are PostgreSQL-only")
+        self.assertIndexedPlan("bins:api_search_bins", {"q": "plan"}, allow_sort=True)
+
+
+class LeaderboardTest(TestCase):
+    """Тест Redis-лідербордів популярних і trending бінів (bins/leaderboard.py)"""
+    def setUp(self):
+        from bins.redis_client import FakeRedis
+        self.redis = FakeRedis()
+        for target in ("bins.leaderboard._get_redis", "bins.services.get_redis_client"):
+            patcher = patch(target, return_value=self.redis)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        User = get_user_model()
+        self.users = [User.objects.create(username=f"voter{i}") for i in range(3)]
+        self.a = Create_Bins.objects.create(title="A", author=self.users[0], hash="lb_a")
+        self.b = Create_Bins.objects.create(title="B", author=self.users[0], hash="lb_b")
+        self.private = Create_Bins.objects.create(title="P", author=self.users[0], hash="lb_p", access="private")
+        from bins.leaderboard import rebuild_popular_leaderboard
+        rebuild_popular_leaderboard()
+
+    def vote(self, bin_obj, voters, action="like"):
+        from bins.services import vote_bin_service
+        for user in voters:
+            vote_bin_service(bin_obj.pk, user, action)
+
+    def test_votes_maintain_popular_board(self):
+        from bins.leaderboard import POPULAR_KEY, get_leaderboard
+        self.vote(self.a, self.users[:1])
+        self.vote(self.b, self.users)
+        self.vote(self.private, self.users)
+        self.assertEqual(self.redis.zscore(POPULAR_KEY, str(self.b.pk)), 3)
+        self.assertIsNone(self.redis.zscore(POPULAR_KEY, str(self.private.pk)))
+
+        self.assertEqual([item["title"] for item in get_leaderboard("popular")], ["B", "A"])
+        # Повторний запит — готовий payload з Redis, без БД
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("bins:api_popular_bins"))
+        self.assertEqual([item["title"] for item in response.json()], ["B", "A"])
+
+    def test_deleted_bin_leaves_board(self):
+        from bins.leaderboard import POPULAR_KEY, get_leaderboard
+        from bins.services import delete_bin_service
+        self.vote(self.a, self.users)
+        self.vote(self.b, self.users[:1])
+        self.assertEqual([item["title"] for item in get_leaderboard("popular")], ["A", "B"])
+        delete_bin_service(self.a, self.users[0])
+        self.assertIsNone(self.redis.zscore(POPULAR_KEY, str(self.a.pk)))
+        self.assertEqual([item["title"] for item in get_leaderboard("popular")], ["B"])
+
+    @patch("bins.views.delete_from_r2", return_value=True)
+    def test_web_delete_leaves_board(self, mock_delete):
+        from bins.leaderboard import POPULAR_KEY, get_leaderboard
+        self.vote(self.a, self.users)
+        self.vote(self.b, self.users[:1])
+        self.assertEqual([item["title"] for item in get_leaderboard("popular")], ["A", "B"])
+        self.client.force_login(self.users[0])
+        self.client.post(reverse("bins:delete_bin", args=[self.a.hash]))
+        self.assertIsNone(self.redis.zscore(POPULAR_KEY, str(self.a.pk)))
+        self.assertEqual([item["title"] for item in get_leaderboard("popular")], ["B"])
+
+    @patch("bins.views.get_bin_content", return_value="Unchanged content")
+    def test_bin_made_private_leaves_board(self, mock_content):
+        from bins.leaderboard import POPULAR_KEY, get_leaderboard
+        from bins.services import update_bin_service
+        self.vote(self.a, self.users)
+        self.vote(self.b, self.users[:1])
+        self.assertEqual([item["title"] for item in get_leaderboard("popular")], ["A", "B"])
+
+        # Через сторінку редагування
+        self.client.force_login(self.users[0])
+        self.client.post(reverse("bins:edit_bin", args=[self.a.hash]), {
+            "content": "Unchanged content", "title": "A", "category": "NONE",
+            "language": "none", "expiry": "never", "access": "private", "tags": "",
+        })
+        self.assertIsNone(self.redis.zscore(POPULAR_KEY, str(self.a.pk)))
+        self.assertEqual([item["title"] for item in get_leaderboard("popular")], ["B"])
+
+        # Через API-сервіс; прострочений бін так само не повертається на дошку
+        self.b.refresh_from_db()
+        self.b.expiry_at = timezone.now() - timedelta(minutes=1)
+        update_bin_service(self.b, self.users[0], {"access": "public"})
+        self.assertIsNone(self.redis.zscore(POPULAR_KEY, str(self.b.pk)))
+        self.a.refresh_from_db()
+        update_bin_service(self.a, self.users[0], {"access": "public"})
+        self.assertEqual(self.redis.zscore(POPULAR_KEY, str(self.a.pk)), 3)
+        self.assertEqual([item["title"] for item in get_leaderboard("popular")], ["A"])
+
+    def test_empty_board_falls_back_to_database(self):
+        from bins.leaderboard import get_leaderboard
+        Create_Bins.objects.filter(pk=self.b.pk).update(likes_count=5)
+        self.assertEqual([item["title"] for item in get_leaderboard("popular")], ["B", "A"])
+
+    def test_board_is_not_used_until_rebuilt(self):
+        from bins.leaderboard import PAYLOAD_KEY, POPULAR_KEY, get_leaderboard, rebuild_popular_leaderboard
+        # Redis скинуто: в БД у B вже є лайки, а в ZSET потрапляє лише A з новим голосом
+        self.redis.delete(*self.redis.store, *self.redis.zsets)
+        Create_Bins.objects.filter(pk=self.b.pk).update(likes_count=5)
+        self.vote(self.a, self.users[:1])
+        self.assertEqual(self.redis.zcard(POPULAR_KEY), 1)
+        self.assertEqual([item["title"] for item in get_leaderboard("popular")], ["B", "A"])
+        self.redis.delete(PAYLOAD_KEY.format("popular"))
+        self.assertEqual(rebuild_popular_leaderboard(), 2)
+        self.assertEqual(self.redis.zscore(POPULAR_KEY, str(self.b.pk)), 5)
+        self.assertEqual([item["title"] for item in get_leaderboard("popular")], ["B", "A"])
+
+    def test_trending_decays_old_activity(self):
+        from bins.leaderboard import TRENDING_BUCKET_KEY, get_leaderboard, record_activity
+        import time as time_module
+        # Давня активність B (5 годин тому) важить менше за свіжий лайк A у вікні "day"
+        old_bucket = int(time_module.time() // 300) - 60
+        self.redis.zadd(TRENDING_BUCKET_KEY.format(old_bucket), {str(self.b.pk): 3})
+        self.vote(self.a, self.users[:2])
+        record_activity(self.b.pk, "view")
+        self.assertEqual([item["title"] for item in get_leaderboard("day")], ["A", "B"])
+        # У вікно "hour" давній кошик не потрапляє взагалі
+        self.assertEqual([item["title"] for item in get_leaderboard("hour")], ["A", "B"])
+        response = self.client.get(reverse("bins:api_trending_bins"), {"period": "week"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_switch_to_dislike_removes_trending_like(self):
+        from bins.leaderboard import get_leaderboard
+        self.vote(self.a, self.users[:1])
+        self.vote(self.a, self.users[:1], "dislike")
+        self.vote(self.b, self.users[:1])
+        self.assertEqual([item["title"] for item in get_leaderboard("hour")], ["B"])
+
+
+@override_settings(BIN_HASH_LEASE_BLOCK=4, BIN_HASH_LEASE_LOW_WATER=2)
+class HashLeaseTest(TestCase):
+    """Тест локальної оренди хешів (bins/hash_lease.py)"""
+    def setUp(self):
+        from bins.hash_lease import POOL_KEY, reset_hash_lease
+        from bins.redis_client import FakeRedis
+        self.redis = FakeRedis()
+        self.redis.rpush(POOL_KEY, *[f"h{i}" for i in range(10)])
+        self.pool_key = POOL_KEY
+        patcher = patch("bins.hash_lease._get_redis", return_value=self.redis)
+        self.mock_redis = patcher.start()
+        self.addCleanup(patcher.stop)
+        # Фонове доповнення виконуємо синхронно, щоб тест був детермінованим
+        refill = patch("bins.hash_lease.HashLease._refill_async", lambda lease: lease._lease_block())
+        refill.start()
+        self.addCleanup(refill.stop)
+        reset_hash_lease()
+        self.addCleanup(reset_hash_lease)
+
+    def test_leases_blocks_and_survives_redis_outage(self):
+        from bins.hash_lease import acquire_hash
+        self.assertEqual(acquire_hash(), "h0")
+        self.assertEqual(self.redis.llen(self.pool_key), 6)
+        self.assertEqual([acquire_hash(), acquire_hash()], ["h1", "h2"])
+        # Черга впала нижче порогу — доповнена наступним блоком
+        self.assertEqual(self.redis.llen(self.pool_key), 2)
+        self.mock_redis.side_effect = redis.ConnectionError("down")
+        self.assertEqual([acquire_hash() for _ in range(5)], ["h3", "h4", "h5", "h6", "h7"])
+        self.assertIsNone(acquire_hash())
+
+    def test_release_and_return_unused(self):
+        from bins.hash_lease import _lease, acquire_hash, release_hash
+        value = acquire_hash()
+        release_hash(value)
+        self.assertEqual(_lease.return_unused(), 4)
+        self.assertEqual(self.redis.lpop(self.pool_key, 10), [f"h{i}".encode() for i in range(10)])
+
+    @patch("bins.services.upload_to_r2", return_value="https://fake-url.com/bin.txt")
+    def test_create_bin_service_uses_lease(self, mock_upload):
+        from bins.services import create_bin_service
+        User = get_user_model()
+        user = User.objects.create(username="leaser")
+        first = create_bin_service(user, {"content": "a", "title": "a"})
+        self.mock_redis.side_effect = redis.ConnectionError("down")
+        second = create_bin_service(user, {"content": "b", "title": "b"})
+        self.assertEqual((first.hash, second.hash), ("h0", "h1"))
+
+
+    @patch("bins.services.delete_from_r2")
+    @patch("bins.services.upload_to_r2", return_value="https://fake-url.com/bin.txt")
+    def test_duplicate_hash_is_not_released(self, mock_upload, mock_delete):
+        from bins.hash_lease import _lease
+        from bins.services import ServiceError, create_bin_service
+        user = get_user_model().objects.create(username="leaser")
+        # h0 уже зайнятий (наприклад, пул отримав дубль) — створення падає на unique hash
+        Create_Bins.objects.create(title="taken", author=user, hash="h0")
+        with self.assertRaises(ServiceError):
+            create_bin_service(user, {"content": "a", "title": "a"})
+        self.assertNotIn("h0", list(_lease._queue))
+        self.assertEqual(create_bin_service(user, {"content": "b", "title": "b"}).hash, "h1")
+
+        # Інша помилка створення — хеш вертається в чергу
+        with patch("bins.services.Create_Bins.objects.create", side_effect=RuntimeError("db down")):
+            with self.assertRaises(ServiceError):
+                create_bin_service(user, {"content": "c", "title": "c"})
+        self.assertEqual(_lease._queue[0], "h2")
+
+class CachedViewBinTest(TestCase):
+    """Тест сторінки біна з кешованими метаданими (лічильники з Redis, коментарі сторінками)"""
+    def setUp(self):
+        from bins.redis_client import reset_redis_client
+        reset_redis_client()
+        User = get_user_model()
+        self.user = User.objects.create_user(username="owner", password="pass", image="users_images/owner.png")
+        self.bin = Create_Bins.objects.create(
+            title="Hot Bin", author=self.user, access="public", hash="hotbin01", likes_count=3, views_count=7
+        )
+        commenters = [User.objects.create(username=f"c{i}") for i in range(3)]
+        now = timezone.now()
+        for i in range(25):
+            comment = BinComment.objects.create(bin=self.bin, author=commenters[i % 3], text=f"comment {i}")
+            BinComment.objects.filter(pk=comment.pk).update(created_at=now - timedelta(minutes=i))
+        cache_bin_meta_and_content(self.bin, "Hot content")
+        self.url = reverse("bins:view_bin", args=[self.bin.hash])
+
+    def _bin_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return response, [q["sql"] for q in ctx.captured_queries if "django_session" not in q["sql"]]
+
+    def test_meta_contains_author_avatar(self):
+        meta = json.loads(get_redis_client().get(f"bin_meta:{self.bin.hash}"))
+        self.assertEqual(meta["id"], self.bin.pk)
+        self.assertEqual(meta["author_image"], self.user.image.url)
+
+    def test_hot_bin_renders_with_one_query(self):
+        # Перший запит створює сесію і кладе лічильники в Redis
+        self.client.get(self.url)
+        response, queries = self._bin_queries()
+        self.assertEqual(len(queries), 1, queries)
+        self.assertIn("JOIN", queries[0])
+        bin = response.context["bin"]
+        self.assertEqual((bin.likes_count, bin.views_count), (3, 8))
+        self.assertEqual(bin.author.image.url, self.user.image.url)
+        self.assertContains(response, self.user.image.url)
+        self.assertEqual(len(response.context["comments"]), 20)
+        self.assertEqual(response.context["comments"][0].text, "comment 0")
+        cursor = response.context["comments_next_cursor"]
+        response = self.client.get(self.url, {"comments_cursor": cursor})
+        self.assertEqual([c.text for c in response.context["comments"]], [f"comment {i}" for i in range(20, 25)])
+        self.assertIsNone(response.context["comments_next_cursor"])
+
+    def test_votes_and_flushed_views_update_cached_counters(self):
+        from bins.counters import get_counters
+        from bins.services import vote_bin_service
+        from bins.view_tracking import flush_pending_views
+        self.client.get(self.url)
+        voter = get_user_model().objects.create(username="voter")
+        vote_bin_service(self.bin.pk, voter, "dislike")
+        flush_pending_views()
+        with self.assertNumQueries(0):
+            self.assertEqual(get_counters(self.bin.pk), {"likes": 3, "dislikes": 1, "views": 8})
+        response = self.client.get(self.url)
+        self.assertEqual(response.context["bin"].views_count, 8)
+
+    def test_counter_writes_never_create_or_overwrite_newer_hash(self):
+        from bins import counters
+        redis = get_redis_client()
+        key = counters.COUNTERS_KEY.format(self.bin.pk)
+        redis.delete(key)
+        # Без заповненого hash HINCRBY/HSET нічого не створюють (жодних часткових hash)
+        counters.add_views(self.bin.pk, 5)
+        counters.set_counters(self.bin.pk, likes=10)
+        self.assertEqual(redis.hgetall(key), {})
+
+        # Перегляди перенесено між читанням БД і заповненням — застарілий рядок не кешується
+        def stale_row():
+            counters.add_views(self.bin.pk, 2)
+            return (3, 0, 7)
+
+        with patch.object(counters, "Create_Bins") as model:
+            model.objects.filter.return_value.values_list.return_value.first.side_effect = stale_row
+            self.assertEqual(counters.get_counters(self.bin.pk), {"likes": 3, "dislikes": 0, "views": 7})
+        self.assertEqual(redis.hgetall(key), {})
+        Create_Bins.objects.filter(pk=self.bin.pk).update(views_count=9)
+        self.assertEqual(counters.get_counters(self.bin.pk)["views"], 9)
+        self.assertEqual(counters._read(self.bin.pk)["views"], 9)
+
+    def test_content_loads_when_only_meta_is_cached(self):
+        from bins.cache import clear_local_cache
+        Create_Bins.objects.filter(pk=self.bin.pk).update(
+            file_key="bins/hotbin01.txt", file_url="https://fake-url.com/hotbin01.txt"
+        )
+        self.bin.refresh_from_db()
+        cache_bin_meta_and_content(self.bin, None)
+        # Контент витіснено раніше за метадані
+        get_redis_client().delete(f"bin_content:{self.bin.hash}")
+        clear_local_cache()
+        with patch("bins.utils.storage.get_content_store") as store:
+            store.return_value.get.return_value = "Real content".encode("utf-8")
+            response = self.client.get(self.url)
+        self.assertNotIsInstance(response.context["bin"], Create_Bins)
+        store.return_value.get.assert_called_once_with("bins/hotbin01.txt")
+        self.assertEqual(response.context["bin_content"], "Real content")
+        self.assertContains(response, "Real content")
+
+    def test_owner_gets_edit_form(self):
+        self.client.login(username="owner", password="pass")
+        response = self.client.get(self.url)
+        self.assertIsInstance(response.context["bin"], Create_Bins)
+        self.assertIsNotNone(response.context["form"])
@@ -17,6 +17,7 @@ urlpatterns = [
     # DRF API endpoints
     path("api/create/", viewsapi.CreateBinAPIView.as_view(), name="api_create_bin"),
     path("api/bin/<int:pk>/", viewsapi.GetBinAPIView.as_view(), name="api_get_bin"),
+    path("api/bin/<int:pk>/unique-viewers/", viewsapi.BinUniqueViewersAPIView.as_view(), name="api_bin_unique_viewers"),
     path("api/update/<int:pk>/", viewsapi.UpdateBinAPIView.as_view(), name="api_update_bin"),
     path("api/delete/<int:pk>/", viewsapi.DeleteBinAPIView.as_view(), name="api_delete_bin"),
 
@@ -29,6 +30,7 @@ urlpatterns = [
     path("api/my-bins/", viewsapi.MyBinsListAPIView.as_view(), name="api_my_bins"),
     path("api/search/", viewsapi.SearchBinsAPIView.as_view(), name="api_search_bins"),
     path("api/popular/", viewsapi.PopularBinsListAPIView.as_view(), name="api_popular_bins"),
+    path("api/trending/", viewsapi.TrendingBinsAPIView.as_view(), name="api_trending_bins"),
     
     # Batch operations
     path("api/bulk-delete/", viewsapi.BulkDeleteBinsAPIView.as_view(), name="api_bulk_delete_bins"),
@@ -1,20 +1,23 @@
-import boto3
 import uuid
+import hashlib
 from django.conf import settings
 from datetime import timedelta
 from django.utils import timezone
-import redis
 import json
 import logging
 import sys
-from botocore.exceptions import ClientError
-from rapidfuzz import fuzz
 from django.core.paginator import Paginator
 from rest_framework.response import Response
 from rest_framework import status
+from django.db import transaction
 from django.db.models import Q
 
 from .models import Create_Bins
+from . import storage
+from . import cache
+from . import redis_client
+from . import search
+from .hash_lease import acquire_hash, release_unless_taken
 
 logger = logging.getLogger(__name__)
 
@@ -48,76 +51,13 @@ def get_bin_or_error(**lookup):
 
 def get_redis_client():
     """
-    Повертає налаштований Redis клієнт з параметрів Django settings."""
-    # Якщо в settings заздалегідь інстанційований Upstash-клієнт — використовуємо його.
-    upstash_client = getattr(settings, "UPSTASH_REDIS_CLIENT", None)
-    if upstash_client:
-        try:
-            upstash_client.ping()
-            return upstash_client
-        except Exception:
-            logger.warning("Configured UPSTASH_REDIS_CLIENT not responding, falling back")
-
-    # Якщо в .env задані Upstash REST параметри, спробуємо створити клієнт тут.
-    if getattr(settings, "UPSTASH_REDIS_REST_URL", None) and getattr(settings, "UPSTASH_REDIS_REST_TOKEN", None):
-        try:
-            from upstash_redis import Redis as UpstashRedisClient
-
-            client = UpstashRedisClient(
-                url=settings.UPSTASH_REDIS_REST_URL,
-                token=settings.UPSTASH_REDIS_REST_TOKEN,
-            )
-            client.ping()
-            return client
-        except Exception as e:
-            logger.warning("Upstash client init failed (%s), will try standard Redis: %s", type(e).__name__, e)
-
-    # Спробуємо підключитися до звичайного Redis (host/port/db), якщо Upstash не доступний.
-    try:
-        client = redis.Redis(
-            host=getattr(settings, "REDIS_HOST", "localhost"),
-            port=getattr(settings, "REDIS_PORT", 6379),
-            db=getattr(settings, "REDIS_DB", 0),
-            socket_connect_timeout=1,
-        )
-        # Перевірка живучості — невеликий ping
-        client.ping()
-        return client
-    except Exception as e:
-        logger.warning("Redis unavailable (%s), falling back to in-memory FakeRedis", e)
-
-        class FakeRedis:
-            def __init__(self):
-                self.store = {}
-                self.lists = {}
-
-            def setex(self, name, time, value):
-                if isinstance(value, str):
-                    value = value.encode("utf-8")
-                self.store[name] = value
+    Повертає налаштований Redis клієнт з параметрів Django settings.
 
-            def get(self, name):
-                return self.store.get(name)
-
-            def delete(self, *names):
-                for n in names:
-                    self.store.pop(n, None)
-
-            def lpop(self, name):
-                lst = self.lists.get(name, [])
-                if lst:
-                    return lst.pop(0)
-                return None
-
-            def lpush(self, name, value):
-                lst = self.lists.setdefault(name, [])
-                lst.insert(0, value)
-
-            # Для сумісності з деякими викликами redis
-            def ping(self):
-                return True
-
-        return FakeRedis()
+    Клієнт (Upstash / redis-py з ConnectionPool / FakeRedis) обирається один раз на процес
+    і перевіряється фоновим потоком з circuit breaker — див. `bins.redis_client`.
+    Сам виклик не робить мережевих запитів.
+    """
+    return redis_client.get_redis_client()
 
 
 def create_bin_from_data(request, data):
@@ -133,8 +73,8 @@ def create_bin_from_data(request, data):
     
     Notes:
         - Завантажує контент у Cloudflare R2
-        - Отримує унікальний хеш з Redis пулу my_unique_hash_pool
-        - Повертає хеш назад у пул при помилці створення
+        - Отримує унікальний хеш з пулу my_unique_hash_pool через локальну оренду воркера
+        - Повертає хеш назад при помилці створення, крім хеша, вже зайнятого іншим біном
     """
     try:
         filename = f"bins/bin_{uuid.uuid4().hex}.txt"
@@ -143,57 +83,39 @@ def create_bin_from_data(request, data):
         content_bytes = data.get("content", "").encode("utf-8")
         size_bin = len(content_bytes)
 
-        # Отримуємо Redis-клієнт і хеш ДО створення об'єкта у БД.
-        redis_client = get_redis_client()
-        hash_value = None
-        try:
-            hash_value = redis_client.lpop("my_unique_hash_pool")
-        except Exception as e:
-            logger.warning("Failed to lpop from Redis: %s", e)
-
-        if not hash_value:
-            logger.info("Хеш не отримано з Redis — перериваємо створення біна")
+        # Хеш беремо ДО створення об'єкта у БД — з локальної оренди воркера (bins/hash_lease.py),
+        # зазвичай без звернення до Redis.
+        hash_value_str = acquire_hash()
+        if not hash_value_str:
+            logger.info("Хеш не отримано з пулу — перериваємо створення біна")
             return False
 
-        # Безпечне приведення значення хеша до str.
-        try:
-            if isinstance(hash_value, (bytes, bytearray)):
-                hash_value_str = hash_value.decode("utf-8")
-            else:
-                try:
-                    decoded = hash_value.decode("utf-8") if hasattr(hash_value, "decode") else None
-                except Exception:
-                    decoded = None
-                hash_value_str = decoded if isinstance(decoded, str) else str(hash_value)
-        except Exception:
-            hash_value_str = str(hash_value)
-
         # Тепер завантажуємо контент у R2 і створюємо запис у БД.
         try:
             file_url = upload_to_r2(filename, data["content"])
             expiry_at = get_expiry_map(data["expiry"])
             file_key = filename
 
-            bin_obj = Create_Bins.objects.create(
-                file_url=file_url,
-                file_key=file_key,
-                category=data["category"],
-                language=data["language"],
-                expiry=data["expiry"],
-                expiry_at=expiry_at,
-                access=data["access"],
-                title=f"{request.user.username}/{data['title']}",
-                tags=data["tags"],
-                author=request.user,
-                size_bin=size_bin,
-                hash=hash_value_str,
-            )
+            # Savepoint: після IntegrityError з'єднання лишається придатним для перевірки хеша
+            with transaction.atomic():
+                bin_obj = Create_Bins.objects.create(
+                    file_url=file_url,
+                    file_key=file_key,
+                    category=data["category"],
+                    language=data["language"],
+                    expiry=data["expiry"],
+                    expiry_at=expiry_at,
+                    access=data["access"],
+                    title=f"{request.user.username}/{data['title']}",
+                    tags=data["tags"],
+                    author=request.user,
+                    size_bin=size_bin,
+                    content_digest=content_digest(content_bytes),
+                    hash=hash_value_str,
+                )
         except Exception as e:
-            # Повертаємо хеш назад у пул при помилці створення (best-effort)
-            try:
-                redis_client.lpush("my_unique_hash_pool", hash_value)
-            except Exception:
-                logger.warning("Failed to return hash to Redis after error: %s", e)
+            # Повертаємо хеш назад при помилці створення, якщо його не зайняв інший бін
+            release_unless_taken(hash_value_str, e)
             logger.exception("Помилка при завантаженні/створенні біна: %s", e)
             return False
 
@@ -204,45 +126,54 @@ def create_bin_from_data(request, data):
 
 def get_s3_client():
     """
-    Створює та повертає налаштований boto3 S3 клієнт для роботи з Cloudflare R2.
+    Повертає спільний для процесу boto3 S3 клієнт для роботи з Cloudflare R2.
+
+    Клієнт створюється один раз і перевикористовується (див. `bins.storage.S3ClientRegistry`),
+    параметри пулу з'єднань, ретраїв і таймаутів — `R2_*` у settings.
     
     Returns:
         boto3.client: S3-сумісний клієнт для операцій з R2
     """
-    return boto3.client(
-        "s3",
-        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-        endpoint_url=settings.AWS_S3_ENDPOINT_URL,
-        region_name=settings.AWS_S3_REGION_NAME,
-    )
+    return storage.get_s3_client()
 
 def upload_to_r2(filename, content):
     """
-    Завантажує контент у Cloudflare R2 бакет і повертає публічний URL до файлу.
+    Завантажує контент у сховище контенту (за замовчуванням Cloudflare R2) і повертає URL до файлу.
     
     Args:
         filename (str): Шлях до файлу в бакеті (ключ), наприклад 'bins/bin_abc123.txt'
         content (str): Текстовий контент для завантаження
     
     Returns:
-        str: Публічний HTTPS URL до завантаженого файлу
+        str: Публічний HTTPS URL до завантаженого файлу (для local-бекенда — local://<ключ>)
     """
-    # Підключення до R2 через boto3
-    s3 = get_s3_client()
+    store = storage.get_content_store()
+    store.put(filename, content)
+    return store.url_for(filename)
 
-    # Завантаження файлу у бакет R2
-    s3.put_object(
-        Bucket=settings.AWS_STORAGE_BUCKET_NAME,
-        Key=filename,
-        Body=content,
-        ContentType="text/plain",
-    )
+def content_digest(content):
+    """
+    Повертає SHA-256 (hex) контенту біна — зберігається у `Create_Bins.content_digest`.
+
+    Args:
+        content (str | bytes): Контент, що записується у сховище
+    """
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    return hashlib.sha256(content or b"").hexdigest()
+
+
+def get_bin_etag(bin):
+    """
+    Повертає сильний ETag біна з дайджесту контенту та `updated_at`.
+
+    Обчислюється лише з полів БД, тож умовний GET відповідає 304 без звернення до R2.
+    Для старих бінів без дайджесту використовується file_key + size_bin.
+    """
+    updated_at = bin.updated_at.isoformat() if getattr(bin, "updated_at", None) else ""
+    basis = f"{bin.content_digest or bin.file_key}:{bin.size_bin}:{updated_at}"
+    return '"%s"' % hashlib.sha256(basis.encode("utf-8")).hexdigest()[:32]
 
-    # Формуємо URL для доступу до файлу
-    file_url = f"https://{settings.AWS_S3_CUSTOM_DOMAIN}/{filename}"
-    
-    return file_url
 
 def get_expiry_map(expiry):
     """
@@ -274,9 +205,16 @@ def get_expiry_map(expiry):
 
     return expiry_at
 
-def get_bin_content(bin_or_file_key, default="Контент не знайдено."):
+
+CONTENT_NOT_FOUND = "Контент не знайдено."
+
+
+def get_bin_content(bin_or_file_key, default=CONTENT_NOT_FOUND):
     """
-    Повертає текстовий контент біна з Cloudflare R2.
+    Повертає текстовий контент біна зі сховища контенту.
+
+    Виконує один GET: відсутній об'єкт обробляється як default,
+    без попередньої перевірки існування.
     
     Args:
         bin_or_file_key: Або об'єкт Create_Bins (з атрибутом file_key), або рядок file_key
@@ -293,26 +231,20 @@ def get_bin_content(bin_or_file_key, default="Контент не знайден
     else:
         file_key = bin_or_file_key
 
-    # Якщо об'єкт відсутній — повертаємо заглушку відразу
     try:
-        if not r2_object_exists(file_key):
-            logger.debug("R2 content not found for %s, returning default", file_key)
+        body = storage.get_content_store().get(file_key)
+        if body is None:
+            logger.debug("Content not found for %s, returning default", file_key)
             return default
-    except Exception:
-        logger.exception("Помилка при перевірці існування об'єкта в R2 для %s", file_key)
-
-    try:
-        s3 = get_s3_client()
-        obj = s3.get_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=file_key)
-        return obj["Body"].read().decode("utf-8")
+        return body.decode("utf-8")
     except Exception as e:
-        logger.warning("Не вдалося отримати контент з R2 для %s: %s", file_key, e)
+        logger.warning("Не вдалося отримати контент зі сховища для %s: %s", file_key, e)
         return default
 
 
 def get_r2_object_if_exists(file_key):
     """
-    Перевіряє, чи існує об'єкт з ключем `file_key` у R2. Якщо існує — повертає
+    Отримує об'єкт з ключем `file_key` зі сховища одним запитом. Якщо існує — повертає
     кортеж (content_str, size_bytes). Якщо не існує або сталася помилка — повертає (None, None).
 
     Args:
@@ -321,144 +253,105 @@ def get_r2_object_if_exists(file_key):
     Returns:
         tuple: (content:str, size:int) або (None, None)
     """
-    s3 = get_s3_client()
     try:
-        head = s3.head_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=file_key)
-    except ClientError as e:
-        code = e.response.get('Error', {}).get('Code', '')
-        # Типові коди для неіснуючого об'єкта: '404', 'NoSuchKey', 'NotFound'
-        if code in ('404', 'NoSuchKey', 'NotFound'):
-            logger.debug("R2 object not found: %s", file_key)
-            return None, None
-        logger.warning("ClientError checking R2 for %s: %s", file_key, e)
-        return None, None
+        body = storage.get_content_store().get(file_key)
     except Exception as e:
-        logger.warning("Unexpected error checking R2 for %s: %s", file_key, e)
+        logger.warning("Unexpected error getting object %s: %s", file_key, e)
+        return None, None
+    if body is None:
+        logger.debug("Object not found: %s", file_key)
         return None, None
 
-    # Якщо head_object успішний — отримуємо сам об'єкт
     try:
-        obj = s3.get_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=file_key)
-        body = obj['Body'].read()
-        try:
-            content = body.decode('utf-8')
-        except Exception:
-            # Якщо не текстовий — повертаємо байти як None (або можна вернути body)
-            content = None
-        size = int(head.get('ContentLength', len(body)))
-        return content, size
-    except Exception as e:
-        logger.warning("Failed to get R2 object %s after head_object: %s", file_key, e)
-        return None, None
+        content = body.decode('utf-8')
+    except Exception:
+        # Якщо не текстовий — повертаємо байти як None (або можна вернути body)
+        content = None
+    return content, len(body)
 
 
 def r2_object_exists(file_key):
     """
-    Перевіряє наявність об'єкта у R2 за ключем. Повертає True якщо об'єкт існує, інакше False.
+    Перевіряє наявність об'єкта у сховищі за ключем. Повертає True якщо об'єкт існує, інакше False.
     """
-    s3 = get_s3_client()
     try:
-        s3.head_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=file_key)
-        return True
-    except ClientError as e:
-        code = e.response.get('Error', {}).get('Code', '')
-        if code in ('404', 'NoSuchKey', 'NotFound'):
-            return False
-        logger.warning("ClientError checking existence for %s: %s", file_key, e)
-        return False
+        return storage.get_content_store().exists(file_key)
     except Exception as e:
         logger.warning("Error checking existence for %s: %s", file_key, e)
         return False
 
 def get_bin_size(file_key):
     """
-    Повертає розмір файлу (біна) у байтах з Cloudflare R2.
+    Повертає розмір файлу (біна) у байтах зі сховища одним запитом метаданих.
+
+    Після завантаження розмір краще брати з довжини payload — тоді цей запит не потрібен.
     
     Args:
-        file_key (str): Ключ файлу в R2 бакеті
+        file_key (str): Ключ файлу в сховищі
     
     Returns:
-        int or None: Розмір файлу в байтах або None при помилці
+        int or None: Розмір файлу в байтах, 0 якщо об'єкта немає, або None при помилці
     """
-    # Якщо об'єкт не існує — повертаємо 0
     try:
-        if not r2_object_exists(file_key):
-            logger.debug("R2 object %s does not exist, returning size 0", file_key)
-            return 0
-    except Exception:
-        logger.exception("Помилка при перевірці існування об'єкта в R2 для %s", file_key)
-
-    s3 = get_s3_client()
-    try:
-        obj = s3.head_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=file_key)
-        return obj['ContentLength']
+        size = storage.get_content_store().size(file_key)
     except Exception as e:
-        logger.warning("Не вдалося отримати розмір з R2 for %s: %s", file_key, e)
+        logger.warning("Не вдалося отримати розмір зі сховища для %s: %s", file_key, e)
         return None
+    if size is None:
+        logger.debug("Object %s does not exist, returning size 0", file_key)
+        return 0
+    return size
 
 
 def delete_from_r2(file_key):
     """
-    Видаляє файл з Cloudflare R2 за ключем.
+    Видаляє файл зі сховища контенту за ключем.
+
+    DELETE ідемпотентний: видалення відсутнього об'єкта теж успішне,
+    тому перевірка існування перед ним не робиться.
     
     Args:
         file_key (str): Ключ файлу для видалення
     
     Returns:
-        bool: True якщо видалено успішно, False при помилці
+        bool: True якщо об'єкта після виклику немає, False при помилці
     """
-    # Якщо нема об'єкта — повертаємо False (нічого не видалено)
     try:
-        if not r2_object_exists(file_key):
-            logger.debug("delete_from_r2: object %s not found, skipping delete", file_key)
-            return False
-    except Exception:
-        logger.exception("Помилка при перевірці існування об'єкта перед видаленням %s", file_key)
+        return storage.get_content_store().delete(file_key)
+    except Exception as e:
+        logger.warning("Помилка при видаленні зі сховища для %s: %s", file_key, e)
+        return False
 
+def delete_many_from_r2(file_keys):
+    """
+    Видаляє набір файлів зі сховища пакетами (DeleteObjects до 1000 ключів на запит).
+    
+    Args:
+        file_keys (list): Ключі файлів для видалення
+    
+    Returns:
+        dict: {file_key: True/False} — False для ключів, які не вдалося видалити
+    """
     try:
-        s3 = get_s3_client()
-        s3.delete_object(Bucket=settings.AWS_STORAGE_BUCKET_NAME, Key=file_key)
-        return True
+        return storage.get_content_store().delete_many(file_keys)
     except Exception as e:
-        logger.warning("Помилка при видаленні з R2 для %s: %s", file_key, e)
-        return False
+        logger.warning("Помилка пакетного видалення зі сховища (%s ключів): %s", len(file_keys), e)
+        return {key: False for key in file_keys}
 
 def smart_search(query):
     """
-    Розумний fuzzy-пошук бінів по назві та мові за допомогою RapidFuzz.
+    Пошук бінів по назві, тегах та мові з ранжуванням на боці БД.
     
     Args:
         query (str): Пошуковий запит
     
     Returns:
-        QuerySet: Відфільтрований і відсортований QuerySet бінів із схожістю > 50%
+        QuerySet: Непрострочені біни, відсортовані за релевантністю (див. bins/search.py)
     
     Notes:
-        Використовує fuzz.partial_ratio для порівняння запиту з title та language_display
+        На PostgreSQL використовує pg_trgm і GIN-індекси; пагінація виконується в БД
     """
-    if not query:
-        return Create_Bins.objects.none()
-
-    query = query.lower().strip()
-    # exclude expired bins: either no expiry (None) or expiry in the future
-    bins = Create_Bins.objects.filter(Q(expiry_at__isnull=True) | Q(expiry_at__gt=timezone.now()))
-    results = []
-
-    for bin in bins:
-        # Порівнюємо з назвою
-        title_score = fuzz.partial_ratio(query, bin.title.lower())
-        # Порівнюємо з мовою (display)
-        lang_score = fuzz.partial_ratio(query, bin.get_language_display().lower())
-        # Якщо хоча б одна схожість > 50, додаємо у результати
-        if max(title_score, lang_score) > 50:
-            results.append((max(title_score, lang_score), bin))
-
-    # Сортуємо за схожістю (від більшої до меншої)
-    results.sort(reverse=True, key=lambda x: x[0])
-
-    # Повертаємо тільки Bin-об'єкти
-    bins_ids = [bin.id for score, bin in results]
-    return Create_Bins.objects.filter(id__in=bins_ids).order_by("-created_at")
+    return search.search_bins(query)
 
 
 def cache_bin_meta_and_content(bin, bin_content=None, ttl_meta=3600, ttl_content=3600):
@@ -472,16 +365,26 @@ def cache_bin_meta_and_content(bin, bin_content=None, ttl_meta=3600, ttl_content
         ttl_content (int): Час життя кешу контенту у секундах (за замовчуванням 3600 = 1 година)
     
     Notes:
-        Зберігає метадані як JSON у ключі bin_meta:<hash>
+        Зберігає метадані як JSON у ключі bin_meta:<hash> (разом з id, file_key, file_url
+        та URL аватара автора — усім, що потрібно ViewBin без запиту до БД)
         Зберігає контент у ключі bin_content:<hash>
+        Обидва ключі пишуться у Redis і в локальний LRU воркера (див. bins/cache.py)
     """
-    redis_cache = get_redis_client()
     meta_key = f"bin_meta:{bin.hash}"
     content_key = f"bin_content:{bin.hash}"
 
+    author = bin.author
+    image = getattr(author, "image", None)
     meta = {
+        "id": bin.pk,
+        "file_key": bin.file_key,
+        # Без file_url get_bin_content не читає сховище — потрібен, коли bin_content:<hash> уже витіснено
+        "file_url": bin.file_url,
         "title": bin.title,
-        "author": bin.author.username,
+        "author": author.username if author else None,
+        "author_id": author.pk if author else None,
+        # URL аватара — щоб сторінка з кешу не читала користувача з БД
+        "author_image": image.url if image else None,
         "created_at": str(bin.created_at),
         "size_bin": getattr(bin, "size_bin", 0),
         "language": bin.language,
@@ -490,10 +393,10 @@ def cache_bin_meta_and_content(bin, bin_content=None, ttl_meta=3600, ttl_content
         "category_display": bin.get_category_display() if hasattr(bin, "get_category_display") else bin.category,
         "tags": getattr(bin, "tags", ""),
     }
-    redis_cache.setex(meta_key, ttl_meta, json.dumps(meta))
+    cache.cache_set(meta_key, json.dumps(meta), ttl_meta)
 
     if bin_content is not None:
-        redis_cache.setex(content_key, ttl_content, bin_content)
+        cache.cache_set(content_key, bin_content, ttl_content)
 
 
 def invalidate_bin_cache(hash):
@@ -504,10 +407,17 @@ def invalidate_bin_cache(hash):
         hash (str): Хеш біна для інвалідації кешу
     
     Notes:
-        Видаляє обидва ключі: bin_meta:<hash> та bin_content:<hash>
+        Видаляє обидва ключі: bin_meta:<hash> та bin_content:<hash> — з Redis і з
+        локального LRU, та сповіщає інші воркери через Redis pub/sub
+    """
+    cache.invalidate_bin(hash)
+
+
+def invalidate_bins_cache(hashes):
+    """
+    Видаляє кеш метаданих і контенту для набору бінів одним зверненням до Redis.
+    
+    Args:
+        hashes (list): Хеші бінів
     """
-    redis_cache = get_redis_client()
-    meta_key = f"bin_meta:{hash}"
-    content_key = f"bin_content:{hash}"
-    redis_cache.delete(meta_key)
-    redis_cache.delete(content_key)
+    cache.invalidate_bins(hashes)
@@ -1,8 +1,10 @@
+from django.conf import settings
 from django.shortcuts import render
 from django.contrib import messages
 from django.shortcuts import get_object_or_404, redirect
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse
 from django.views import View
+from django.core.exceptions import ValidationError
 from django.template.loader import render_to_string
 import json
 from django.views.generic.edit import FormView
@@ -11,17 +13,26 @@ from django.views.generic.list import ListView
 from django.views.generic.edit import UpdateView
 
 from .choices import CATEGORY_CHOICES, LANGUAGE_CHOICES, EXPIRY_CHOICES, ACCESS_CHOICES
-from .models import Create_Bins, BinLike, BinComment
+from .models import Create_Bins, BinComment
 from .utils import (
     upload_to_r2,
     create_bin_from_data,
     delete_from_r2,
+    CONTENT_NOT_FOUND,
     get_bin_content,
+    content_digest,
     cache_bin_meta_and_content,
     invalidate_bin_cache,
-    get_redis_client,
 )
+from .cache import cache_get
+from .cache_policy import get_bin_content_cached, should_admit, warm_bin_cache
+from .view_tracking import get_pending_views, record_view
+from .counters import get_counters
+from .pagination import COMMENTS_ORDERING, InvalidCursor, paginate_keyset
+from .expiry_index import is_expired
 from .forms import CreateBinsForm, BinCommentForm, BinComment
+from .services import vote_bin_service
+from . import leaderboard
 from hash_generator.fake_class import FakeBin
 
 class CreateBinView(FormView):
@@ -85,66 +96,81 @@ class ViewBin(DetailView):
     def get_object(self, queryset=None):
         # Отримуємо об'єкт Bin за hash (slug)
         hash = self.kwargs.get(self.slug_url_kwarg)
-        redis_cache = get_redis_client()
-        meta_key = f"bin_meta:{hash}"
-        meta = redis_cache.get(meta_key)
-        if meta:
-            meta = json.loads(meta)
+        meta = cache_get(f"bin_meta:{hash}")
+        meta = json.loads(meta) if meta else None
+        user = self.request.user
+        # Метадані старого формату (без id) і власник (йому потрібна форма редагування) — з БД
+        if meta and meta.get("id") and not (user.is_authenticated and user.pk == meta.get("author_id")):
             bin = FakeBin(meta, hash)
-            real_bin = get_object_or_404(Create_Bins, hash=hash)
-            bin.views_count = real_bin.views_count
-            bin.likes = real_bin.likes_count
-            bin.dislikes = real_bin.dislikes_count
-            bin.author.image = getattr(real_bin.author, "image", None)
-            self.comments = real_bin.comments.all().order_by("-created_at")
+            # Лічильники — з Redis, при промаху одним вузьким запитом (bins/counters.py)
+            values = get_counters(bin.pk)
+            if values is None:
+                raise Http404("Bin not found")
+            bin.views_count = values["views"]
+            bin.likes_count = values["likes"]
+            bin.dislikes_count = values["dislikes"]
         else:
-            bin = get_object_or_404(Create_Bins, hash=hash)
-            self.comments = bin.comments.all().order_by("-created_at")
+            bin = get_object_or_404(Create_Bins.objects.select_related("author"), hash=hash)
         self.bin_obj = bin
         return bin
 
+    def get_comments(self, bin):
+        """
+        Сторінка коментарів біна: автори одним JOIN, keyset по (created_at, id) без COUNT.
+
+        Returns:
+            tuple: (comments, next_cursor, previous_cursor)
+        """
+        queryset = BinComment.objects.filter(bin_id=bin.pk).select_related("author")
+        try:
+            return paginate_keyset(
+                queryset, COMMENTS_ORDERING, getattr(settings, "BIN_COMMENTS_PAGE_SIZE", 20),
+                self.request.GET.get("comments_cursor"),
+            )
+        except InvalidCursor:
+            raise Http404("Invalid cursor")
+
     def get(self, request, *args, **kwargs):
         self.object = self.get_object()
         bin = self.object
+        if is_expired(bin.pk):
+            raise Http404("Bin expired")
         # --- Підрахунок переглядів ---
         session_key = request.session.session_key
         if not session_key:
             request.session.create()
             session_key = request.session.session_key
-        already_viewed = bin.views.filter(session_key=session_key).exists()
+        # Дедуплікація і лічильник — у Redis; у БД перегляди пише flush_bin_views
         user = request.user if request.user.is_authenticated else None
-        if user:
-            already_viewed = bin.views.filter(user=user).exists() or already_viewed
-        if not already_viewed:
-            bin.views.create(
-                user=user,
-                ip_address=request.META.get("REMOTE_ADDR", ""),
-                user_agent=request.META.get("HTTP_USER_AGENT", ""),
-                session_key=session_key,
-            )
-            bin.views_count = bin.views.count()
-            bin.save(update_fields=["views_count"])
-
-        # --- Кешування контенту ---
-        redis_cache = get_redis_client()
-        content_key = f"bin_content:{bin.hash}"
-        bin_content = redis_cache.get(content_key)
-        if bin_content:
-            bin_content = bin_content.decode("utf-8")
-        else:
-            bin_content = get_bin_content(bin)
-            if hasattr(bin, "views_count") and bin.views_count >= 50:
-                cache_bin_meta_and_content(
-                    bin, bin_content, ttl_meta=3600, ttl_content=3600
-                )
+        record_view(
+            bin.pk,
+            session_key,
+            user_id=user.pk if user else None,
+            ip_address=request.META.get("REMOTE_ADDR", ""),
+            user_agent=request.META.get("HTTP_USER_AGENT", ""),
+        )
+        bin.views_count = (bin.views_count or 0) + get_pending_views(bin.pk)
+
+        # --- Кешування контенту (локальний LRU → Redis → R2) ---
+        # Що кешувати, вирішує політика: недавня популярність, single-flight, раннє оновлення
+        # Промах сховища (None) не кешується; текст-заглушка лише для сторінки
+        bin_content = get_bin_content_cached(bin, lambda b: get_bin_content(b, default=None))
+        if bin_content is None:
+            bin_content = CONTENT_NOT_FOUND
+        if isinstance(bin, Create_Bins) and should_admit(bin.hash):
+            cache_bin_meta_and_content(bin, None, ttl_meta=settings.BIN_CACHE_TTL)
 
-        form = CreateBinsForm(instance=bin)
+        # Форма редагування потрібна лише власнику, а він завжди отримує справжній Create_Bins
+        form = CreateBinsForm(instance=bin) if isinstance(bin, Create_Bins) else None
+        comments, comments_next, comments_previous = self.get_comments(bin)
 
         context = self.get_context_data(
             bin=bin,
             form=form,
             bin_content=bin_content,
-            comments=self.comments,
+            comments=comments,
+            comments_next_cursor=comments_next,
+            comments_previous_cursor=comments_previous,
             views_count=bin.views_count if hasattr(bin, "views_count") else 0,
             category_choices=CATEGORY_CHOICES,
             language_choices=LANGUAGE_CHOICES,
@@ -199,48 +225,18 @@ class BinLikeDislikeView(View):
 
     def post(self, request, *args, **kwargs):
         bin_hash = kwargs.get("hash")
-        bin_obj = get_object_or_404(Create_Bins, hash=bin_hash)
+        bin_id = get_object_or_404(Create_Bins.objects.only("pk"), hash=bin_hash).pk
         action = request.POST.get("action")
 
         if not request.user.is_authenticated:
             return JsonResponse({"error": "Потрібна авторизація"}, status=403)
 
-        # --- Логіка для одного лайка/дизлайка ---
-        like_obj = BinLike.objects.filter(bin=bin_obj, user=request.user).first()
-        if action == "like":
-            if like_obj and like_obj.is_like:
-                return JsonResponse(
-                    {
-                        "likes": bin_obj.likes_count,
-                        "dislikes": bin_obj.dislikes_count,
-                    })
-            # Якщо був дизлайк — забираємо його
-            if like_obj and not like_obj.is_like:
-                bin_obj.dislikes_count -= 1
-                like_obj.delete()
-            BinLike.objects.create(bin=bin_obj, user=request.user, is_like=True)
-            bin_obj.likes_count += 1
-            bin_obj.save(update_fields=["likes_count", "dislikes_count"])
-        elif action == "dislike":
-            if like_obj and not like_obj.is_like:
-                return JsonResponse(
-                    {
-                        "likes": bin_obj.likes_count,
-                        "dislikes": bin_obj.dislikes_count,
-                    })
-            # Якщо був лайк — забираємо його
-            if like_obj and like_obj.is_like:
-                bin_obj.likes_count -= 1
-                like_obj.delete()
-            BinLike.objects.create(bin=bin_obj, user=request.user, is_like=False)
-            bin_obj.dislikes_count += 1
-            bin_obj.save(update_fields=["likes_count", "dislikes_count"])
-        else:
+        # Голос і лічильники — атомарно в одній транзакції (див. vote_bin_service)
+        try:
+            counts = vote_bin_service(bin_id, request.user, action)
+        except ValidationError:
             return JsonResponse({"error": "Невідома дія"}, status=400)
-
-        return JsonResponse(
-            {"likes": bin_obj.likes_count, "dislikes": bin_obj.dislikes_count}
-        )
+        return JsonResponse(counts)
 
 
 class BinCommentView(View):
@@ -319,15 +315,18 @@ class EditBinView(UpdateView):
         # Оновлюємо контент у R2, якщо він змінився
         if new_content and new_content != old_content:
             upload_to_r2(bin.file_key, new_content)
+            form.instance.size_bin = len(new_content.encode("utf-8"))
+            form.instance.content_digest = content_digest(new_content)
 
         form.save()
         # Очищаємо старий кеш
         invalidate_bin_cache(bin.hash)
-        # Оновлюємо кеш, якщо бін популярний
+        # Прогріваємо кеш новим контентом, якщо бін зараз популярний
         bin.refresh_from_db()
-        if bin.views_count >= 50:
-            updated_content = get_bin_content(bin)
-            cache_bin_meta_and_content(bin, updated_content, ttl_meta=3600, ttl_content=3600)
+        # Приватний чи прострочений бін зникає з лідерборду одразу, а не після TTL top-N
+        leaderboard.sync_bin(bin)
+        if warm_bin_cache(bin, new_content or old_content):
+            cache_bin_meta_and_content(bin, None, ttl_meta=settings.BIN_CACHE_TTL)
 
         messages.success(self.request, "Bin успішно оновлено!")
         return redirect("bins:view_bin", hash=bin.hash)
@@ -347,7 +346,10 @@ class DeleteBinView(View):
         # Очищення кешу
         invalidate_bin_cache(bin_obj.hash)
         # Видалення з БД
+        bin_pk = bin_obj.pk
         bin_obj.delete()
+        # Прибираємо з `popular` і скидаємо закешовані top-N, як delete_bin_service
+        leaderboard.remove_from_leaderboards(bin_pk)
 
         messages.success(request, "Bin успішно видалено!")
         return redirect("bins:user_bins")
@@ -1,9 +1,13 @@
+import logging
+
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from rest_framework import status
-from rest_framework.pagination import PageNumberPagination
 from django.shortcuts import get_object_or_404
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 from django.core.exceptions import ValidationError
 from django.db.models import Q
 from django.utils import timezone
@@ -14,12 +18,22 @@ from .services import (
     update_bin_service,
     get_bin_service,
     delete_bin_service,
+    bulk_delete_bins_service,
     ServiceError,
 )
 from .models import Create_Bins
-from .utils import smart_search, get_bin_content, get_bin_or_error
+from .utils import smart_search, get_bin_or_error, get_bin_etag
 from .choices import CATEGORY_CHOICES, LANGUAGE_CHOICES
 from .permissions import IsAuthor, IsAuthorOrAdmin
+from .storage import get_content_store, iter_chunks, LocalContentStore, RangeNotSatisfiable
+from .view_tracking import get_unique_viewers
+from .expiry_index import is_expired
+from .leaderboard import TRENDING_WINDOWS, get_leaderboard
+from .pagination import POPULAR_ORDERING, RECENT_ORDERING, SEARCH_ORDERING, get_bins_paginator, use_keyset
+
+logger = logging.getLogger(__name__)
+
+RAW_CONTENT_TYPE = "text/plain; charset=utf-8"
 
 
 class CreateBinAPIView(APIView):
@@ -69,6 +83,10 @@ class GetBinAPIView(APIView):
     permission_classes = [AllowAny]
 
     def get(self, request, pk):
+        # Прострочений, але ще не прибраний бін — 404 з індексу спливань, без запиту до БД
+        if is_expired(pk):
+            return Response({"detail": f"Bin with id '{pk}' not found"}, status=status.HTTP_404_NOT_FOUND)
+
         bin_obj, error = get_bin_or_error(pk=pk)
         if error:
             return error
@@ -104,19 +122,12 @@ class DeleteBinAPIView(APIView):
             return Response({"detail": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-class BinsPagination(PageNumberPagination):
-    """Пагінація для списків бінів."""
-    page_size = 20
-    page_size_query_param = 'page_size'
-    max_page_size = 100
-
-
 class PublicBinsListAPIView(APIView):
-    """Публічні біни з пагінацією та фільтрами."""
+    """Публічні біни з пагінацією (посторінковою або курсорною) та фільтрами."""
     permission_classes = [AllowAny]
     
     def get(self, request):
-        queryset = Create_Bins.objects.select_related('author').order_by('-created_at')
+        queryset = Create_Bins.objects.select_related('author').order_by(*RECENT_ORDERING)
         
         # Фільтри з query params
         language = request.query_params.get('language')
@@ -146,7 +157,7 @@ class PublicBinsListAPIView(APIView):
         queryset = queryset.filter(access='public')
         
         # Пагінація
-        paginator = BinsPagination()
+        paginator = get_bins_paginator(request)
         page = paginator.paginate_queryset(queryset, request)
         serializer = BinListSerializer(page, many=True)
         return paginator.get_paginated_response(serializer.data)
@@ -157,21 +168,21 @@ class MyBinsListAPIView(APIView):
     permission_classes = [IsAuthenticated]
     
     def get(self, request):
-        queryset = Create_Bins.objects.filter(author=request.user).select_related('author').order_by('-created_at')
+        queryset = Create_Bins.objects.filter(author=request.user).select_related('author').order_by(*RECENT_ORDERING)
         
         # Опціонально: фільтр активних
         active_only = request.query_params.get('active', 'false').lower() == 'true'
         if active_only:
             queryset = queryset.filter(Q(expiry_at__isnull=True) | Q(expiry_at__gt=timezone.now()))
         
-        paginator = BinsPagination()
+        paginator = get_bins_paginator(request)
         page = paginator.paginate_queryset(queryset, request)
         serializer = BinListSerializer(page, many=True)
         return paginator.get_paginated_response(serializer.data)
 
 
 class SearchBinsAPIView(APIView):
-    """Пошук бінів по назві та мові через fuzzy matching (smart_search)."""
+    """Пошук бінів по назві, тегах та мові з ранжуванням у БД (smart_search)."""
     permission_classes = [AllowAny]
     
     def get(self, request):
@@ -180,21 +191,126 @@ class SearchBinsAPIView(APIView):
         if not query:
             return Response({"detail": "Query parameter 'q' is required"}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Використовуємо smart_search з utils (fuzzy matching)
+        # smart_search повертає лише активні біни, відсортовані за релевантністю
         queryset = smart_search(query)
         
-        # Фільтр активних
-        queryset = queryset.filter(Q(expiry_at__isnull=True) | Q(expiry_at__gt=timezone.now()))
-        
         # Фільтр публічних (опціонально — smart_search шукає по всіх)
         queryset = queryset.filter(access='public')
         
-        paginator = BinsPagination()
+        paginator = get_bins_paginator(request, SEARCH_ORDERING)
         page = paginator.paginate_queryset(queryset, request)
         serializer = BinListSerializer(page, many=True)
         return paginator.get_paginated_response(serializer.data)
 
 
+def parse_byte_range(header, size):
+    """
+    Розбирає заголовок `Range: bytes=...` для об'єкта розміром size.
+
+    Підтримується один діапазон (`a-b`, `a-`, `-n`); кілька діапазонів або
+    некоректний синтаксис ігноруються (віддається весь контент, як дозволяє RFC 9110).
+
+    Returns:
+        tuple or None: (start, end) включно, або None — віддати весь контент
+    Raises:
+        ValueError: діапазон синтаксично коректний, але незадовольняльний (416)
+    """
+    if not header or not header.startswith("bytes=") or size <= 0:
+        return None
+    spec = header[len("bytes="):].strip()
+    if "," in spec or "-" not in spec:
+        return None
+    first, last = (part.strip() for part in spec.split("-", 1))
+    if not first:
+        # Суфікс: останні N байт
+        if not last.isdigit():
+            return None
+        suffix = int(last)
+        if suffix == 0:
+            raise ValueError("Unsatisfiable range")
+        return max(0, size - suffix), size - 1
+    if not first.isdigit() or (last and not last.isdigit()):
+        return None
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size:
+        raise ValueError("Unsatisfiable range")
+    if start > end:
+        return None
+    return start, min(end, size - 1)
+
+
+def raw_content_response(request, bin_obj):
+    """
+    Віддає контент біна потоком, не читаючи його повністю в пам'ять воркера.
+
+    Для local-бекенда — FileResponse (sendfile-дружній), для R2 — StreamingHttpResponse
+    поверх StreamingBody шматками по CONTENT_STREAM_CHUNK_SIZE. Content-Length береться
+    з метаданих сховища, тож пікова пам'ять не залежить від розміру біна.
+
+    ETag/Last-Modified рахуються з полів БД, тож If-None-Match / If-Modified-Since
+    отримують 304 без звернення до сховища. `Range` перетворюється на ranged GET.
+    """
+    etag = get_bin_etag(bin_obj)
+    # get_conditional_response порівнює з If-Modified-Since цілими секундами
+    last_modified = int(bin_obj.updated_at.timestamp()) if bin_obj.updated_at else None
+    cache_control = "private, no-cache" if bin_obj.access == "private" else "no-cache"
+    conditional = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if conditional is not None:
+        # 304 несе ті самі валідатори, що й 200 (RFC 9110 §15.4.5)
+        conditional["ETag"] = etag
+        if last_modified is not None:
+            conditional["Last-Modified"] = http_date(last_modified)
+        conditional["Cache-Control"] = cache_control
+        return conditional
+
+    store = get_content_store()
+    byte_range = None
+    if_range = request.META.get("HTTP_IF_RANGE")
+    if bin_obj.size_bin and (not if_range or if_range == etag):
+        try:
+            byte_range = parse_byte_range(request.META.get("HTTP_RANGE"), bin_obj.size_bin)
+        except ValueError:
+            response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+            response["Content-Range"] = f"bytes */{bin_obj.size_bin}"
+            return response
+
+    body, size = (None, None)
+    if bin_obj.file_key and bin_obj.file_url:
+        try:
+            if byte_range:
+                body, size = store.open_range(bin_obj.file_key, *byte_range)
+            else:
+                body, size = store.open(bin_obj.file_key)
+        except RangeNotSatisfiable:
+            # Об'єкт коротший, ніж size_bin у БД
+            response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+            response["Content-Range"] = f"bytes */{bin_obj.size_bin}"
+            return response
+        except Exception as e:
+            logger.warning("Failed to open content for %s: %s", bin_obj.file_key, e)
+    if body is None:
+        return Response("Content not found", content_type='text/plain', status=status.HTTP_200_OK)
+
+    if byte_range:
+        response = StreamingHttpResponse(
+            iter_chunks(body), content_type=RAW_CONTENT_TYPE, status=status.HTTP_206_PARTIAL_CONTENT
+        )
+        response["Content-Range"] = f"bytes {byte_range[0]}-{byte_range[0] + size - 1}/{bin_obj.size_bin}"
+    elif isinstance(store, LocalContentStore):
+        response = FileResponse(body, content_type=RAW_CONTENT_TYPE)
+    else:
+        response = StreamingHttpResponse(iter_chunks(body), content_type=RAW_CONTENT_TYPE)
+    response["Content-Length"] = str(size)
+    response["Accept-Ranges"] = "bytes"
+    response["ETag"] = etag
+    if last_modified is not None:
+        response["Last-Modified"] = http_date(last_modified)
+    # Клієнти мають перевіряти актуальність через ETag (дешевий 304), а не брати з кешу наосліп
+    response["Cache-Control"] = cache_control
+    return response
+
+
 class BinRawByPkAPIView(APIView):
     """Повертає raw text/plain контент біну за ID."""
     permission_classes = [AllowAny]
@@ -208,9 +324,7 @@ class BinRawByPkAPIView(APIView):
         if bin_obj.access == 'private' and bin_obj.author != request.user:
             return Response({"detail": "Access denied"}, status=status.HTTP_403_FORBIDDEN)
         
-        content = get_bin_content(bin_obj, default="Content not found")
-        
-        return Response(content, content_type='text/plain', status=status.HTTP_200_OK)
+        return raw_content_response(request, bin_obj)
 
 
 class BinRawByHashAPIView(APIView):
@@ -226,23 +340,74 @@ class BinRawByHashAPIView(APIView):
         if bin_obj.access == 'private' and bin_obj.author != request.user:
             return Response({"detail": "Access denied"}, status=status.HTTP_403_FORBIDDEN)
         
-        content = get_bin_content(bin_obj, default="Content not found")
-        
-        return Response(content, content_type='text/plain', status=status.HTTP_200_OK)
+        return raw_content_response(request, bin_obj)
+
+
+class BinUniqueViewersAPIView(APIView):
+    """
+    Наближена кількість унікальних глядачів біна (HyperLogLog, похибка ~0.81%).
+
+    Query params: bucket=hour|day (за замовчуванням day), periods=N.
+    """
+    permission_classes = [AllowAny]
+    max_periods = {"hour": 168, "day": 90}
+
+    def get(self, request, pk):
+        bin_obj, error = get_bin_or_error(pk=pk)
+        if error:
+            return error
+
+        # Статистика приватного біна — тільки для автора
+        if bin_obj.access == 'private' and bin_obj.author != request.user:
+            return Response({"detail": "Access denied"}, status=status.HTTP_403_FORBIDDEN)
+
+        bucket = request.query_params.get('bucket', 'day')
+        if bucket not in self.max_periods:
+            return Response({"detail": "bucket must be 'hour' or 'day'"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            periods = int(request.query_params.get('periods', 24 if bucket == 'hour' else 7))
+        except ValueError:
+            return Response({"detail": "periods must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+        if not 1 <= periods <= self.max_periods[bucket]:
+            return Response(
+                {"detail": f"periods must be between 1 and {self.max_periods[bucket]}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        data = get_unique_viewers(bin_obj.pk, bucket=bucket, periods=periods)
+        data["id"] = bin_obj.pk
+        return Response(data, status=status.HTTP_200_OK)
 
 
 class PopularBinsListAPIView(APIView):
-    """Топ-20 популярних публічних бінів, відсортованих по лайках."""
+    """Топ популярних публічних бінів за лайками (з ?pagination=cursor — усі, сторінками)."""
     permission_classes = [AllowAny]
     
     def get(self, request):
         queryset = Create_Bins.objects.filter(
             access='public').filter(
             Q(expiry_at__isnull=True) | Q(expiry_at__gt=timezone.now())
-        ).select_related('author').order_by('-likes_count', '-created_at')[:20]
-        
-        serializer = BinListSerializer(queryset, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        ).select_related('author').order_by(*POPULAR_ORDERING)
+
+        if use_keyset(request.query_params):
+            paginator = get_bins_paginator(request, POPULAR_ORDERING)
+            page = paginator.paginate_queryset(queryset, request)
+            serializer = BinListSerializer(page, many=True)
+            return paginator.get_paginated_response(serializer.data)
+
+        # Готовий top-N з Redis-лідерборду (bins/leaderboard.py), без сортування таблиці
+        return Response(get_leaderboard("popular"), status=status.HTTP_200_OK)
+
+
+class TrendingBinsAPIView(APIView):
+    """Біни, що набирають лайки й перегляди: ?period=hour|day (за замовчуванням day)."""
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        period = request.query_params.get('period', 'day')
+        if period not in TRENDING_WINDOWS:
+            return Response({"detail": "Invalid period"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(get_leaderboard(period), status=status.HTTP_200_OK)
 
 class BulkDeleteBinsAPIView(APIView):
     """Видалення кількох бінів одночасно. POST з масивом bin_ids."""
@@ -286,46 +451,24 @@ class BulkDeleteBinsAPIView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        deleted_count = 0
-        skipped = []
-        errors = []
-        
-        for bin_id in bin_ids:
-            bin_obj = Create_Bins.objects.filter(pk=bin_id).first()
-
-            if not bin_obj:
-                errors.append({
-                    'bin_id': bin_id,
-                    'error': 'Bin not found'
-                })
-                continue
-
-            # Перевіряємо права: лише автор або адмін
-            if bin_obj.author != request.user and not request.user.is_staff:
-                skipped.append({
-                    'bin_id': bin_id,
-                    'reason': 'Permission denied'
-                })
-                continue
-
-            # Видаляємо через сервіс
-            try:
-                delete_bin_service(bin_obj, request.user)
-                deleted_count += 1
-            except ServiceError as e:
-                errors.append({
-                    'bin_id': bin_id,
-                    'error': str(e)
-                })
-            except Exception as e:
-                errors.append({
-                    'bin_id': bin_id,
-                    'error': str(e)
-                })
-        
+        # Вся робота пакетна: один SELECT, DeleteObjects у R2, один DELETE, одна інвалідація кешу
+        results = bulk_delete_bins_service(bin_ids, request.user)
+
+        deleted_count = sum(1 for r in results if r['status'] == 'deleted')
+        skipped = [
+            {'bin_id': r['bin_id'], 'reason': 'Permission denied'}
+            for r in results if r['status'] == 'forbidden'
+        ]
+        errors = [
+            {'bin_id': r['bin_id'], 'error': 'Bin not found' if r['status'] == 'not_found' else r['detail']}
+            for r in results if r['status'] in ('not_found', 'error')
+        ]
+
         return Response({
             'deleted': deleted_count,
             'skipped': skipped,
             'errors': errors,
-            'total_requested': len(bin_ids)
+            'results': results,
+            # Повтори id сервіс відкидає, тож рахуємо унікальні — як і results
+            'total_requested': len(results)
         }, status=status.HTTP_200_OK)
\ No newline at end of file
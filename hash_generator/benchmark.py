@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Навантажувальний тест hash service: скільки хешів на секунду видають
+`/get_hash/` і `/get_hashes/?n=` за різної кількості одночасних клієнтів.
+
+    python -m hash_generator.benchmark --url http://localhost:8081
+    python -m hash_generator.benchmark --in-process --concurrency 1 8 32 128
+
+`--in-process` піднімає застосунок у цьому ж процесі (httpx.ASGITransport +
+lifespan), тож потрібен лише Redis; без нього — запущений сервіс за `--url`.
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+
+async def _worker(client, path, params, deadline, stats):
+    while time.monotonic() < deadline:
+        response = await client.get(path, params=params)
+        data = response.json() if response.status_code == 200 else {}
+        if "hash" in data:
+            stats["hashes"] += 1
+        elif "hashes" in data:
+            stats["hashes"] += len(data["hashes"])
+        else:
+            stats["errors"] += 1
+        stats["requests"] += 1
+
+
+async def run_level(client, path, params, concurrency, duration):
+    """
+    Ганяє `concurrency` клієнтів по `path` протягом `duration` секунд.
+
+    Returns:
+        dict: {"requests", "hashes", "errors", "seconds"}
+    """
+    stats = {"requests": 0, "hashes": 0, "errors": 0}
+    started = time.monotonic()
+    deadline = started + duration
+    await asyncio.gather(*[_worker(client, path, params, deadline, stats) for _ in range(concurrency)])
+    stats["seconds"] = time.monotonic() - started
+    return stats
+
+
+async def benchmark(args):
+    if args.in_process:
+        from hash_generator.hash_service import app
+
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://hash-service") as client:
+                await _report(client, args)
+    else:
+        limits = httpx.Limits(max_connections=max(args.concurrency))
+        async with httpx.AsyncClient(base_url=args.url, limits=limits, timeout=30) as client:
+            await _report(client, args)
+
+
+async def _report(client, args):
+    endpoints = [("/get_hash/", {})] + [("/get_hashes/", {"n": n}) for n in args.batch]
+    print(f"{'endpoint':<22}{'clients':>8}{'req/s':>12}{'hashes/s':>12}{'errors':>8}")
+    for path, params in endpoints:
+        label = f"{path}?n={params['n']}" if params else path
+        for concurrency in args.concurrency:
+            stats = await run_level(client, path, params, concurrency, args.duration)
+            print(
+                f"{label:<22}{concurrency:>8}"
+                f"{stats['requests'] / stats['seconds']:>12.1f}"
+                f"{stats['hashes'] / stats['seconds']:>12.1f}"
+                f"{stats['errors']:>8}"
+            )
+    metrics = await client.get("/metrics/")
+    print("metrics:", metrics.json())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test for the hash service")
+    parser.add_argument("--url", default="http://localhost:8081", help="адреса запущеного сервісу")
+    parser.add_argument("--in-process", action="store_true", help="запустити застосунок у цьому процесі")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32, 128], help="рівні одночасних клієнтів")
+    parser.add_argument("--batch", type=int, nargs="*", default=[10, 100], help="значення n для /get_hashes/")
+    parser.add_argument("--duration", type=float, default=5.0, help="секунд на кожен рівень")
+    asyncio.run(benchmark(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,28 @@
+from django.utils.dateparse import parse_datetime
+
+
+class FakeImage:
+    def __init__(self, url):
+        self.url = url
+
+
 class FakeUser:
-    def __init__(self, username, image=None):
+    def __init__(self, username, image=None, pk=None):
         self.username = username
-        self.image = image
+        self.pk = pk
+        # Шаблон звертається до image.url, як у ImageField
+        self.image = FakeImage(image) if image else None
 
 
 class FakeBin:
     def __init__(self, meta, hash):
+        self.pk = meta.get("id")
+        self.file_key = meta.get("file_key")
+        self.file_url = meta.get("file_url")
         self.title = meta.get("title")
-        self.author = FakeUser(meta.get("author"), meta.get("author_image"))
-        self.created_at = meta.get("created_at")
+        self.author = FakeUser(meta.get("author"), meta.get("author_image"), meta.get("author_id"))
+        created_at = meta.get("created_at")
+        self.created_at = (parse_datetime(created_at) if created_at else None) or created_at
         self.hash = hash
         self.size_bin = meta.get("size_bin", 0)
         self.language = meta.get("language", "")
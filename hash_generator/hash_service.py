@@ -1,59 +1,308 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Query
+import asyncio
 import base64
-import redis as redis_py
-import threading
+import hashlib
+import logging
 import os
 import time
-from upstash_redis import Redis as UpstashRedis
+from collections import deque
 
-app = FastAPI()
+import redis.asyncio as redis_asyncio
+from upstash_redis.asyncio import Redis as UpstashRedis
 
-# Instantiate redis client from env: prefer Upstash REST if provided, otherwise fall back to redis-py
-try:
-    if os.getenv("UPSTASH_REDIS_REST_URL") and os.getenv("UPSTASH_REDIS_REST_TOKEN"):
-        redis_client = UpstashRedis(url=os.getenv("UPSTASH_REDIS_REST_URL"), token=os.getenv("UPSTASH_REDIS_REST_TOKEN"))
-    else:
-        redis_client = redis_py.Redis(host=os.getenv("REDIS_HOST", "localhost"), port=int(os.getenv("REDIS_PORT", "6379")), db=int(os.getenv("REDIS_DB", "0")), password=os.getenv("REDIS_PASSWORD") or None)
-except Exception:
-    redis_client = redis_py.Redis(host="localhost", port=6379)
+logger = logging.getLogger(__name__)
 
 POOL_KEY = "my_unique_hash_pool"
-LAST_ID_KEY = "last_id"
-HASH_SET_KEY = "hash_set"  # Для контролю унікальності
+LAST_ID_KEY = "last_id"  # наступний невиданий id; діапазони резервуються INCRBY
+PERMUTATION_KEY = "hash_permutation_key"
+
+# Пул доповнюється до HIGH_WATER, щойно падає нижче LOW_WATER
+HASH_POOL_HIGH_WATER = int(os.getenv("HASH_POOL_HIGH_WATER", "2000"))
+HASH_POOL_LOW_WATER = int(os.getenv("HASH_POOL_LOW_WATER", "500"))
+HASH_REFILL_BATCH = int(os.getenv("HASH_REFILL_BATCH", "1000"))  # хешів на один RPUSH
+HASH_PRODUCER_POLL_INTERVAL = float(os.getenv("HASH_PRODUCER_POLL_INTERVAL", "1"))  # секунди, якщо подій немає
+HASH_MAX_BATCH = int(os.getenv("HASH_MAX_BATCH", "1000"))  # найбільше n для /get_hashes/
+HASH_RATE_WINDOW = 60  # секунди для refill_rate
+
+# Хеш — 48-бітне число в base64url (8 символів). Старі хеші були id без перестановки
+# (id < 2^40), нові завжди >= LEGACY_LIMIT, тож вони не перетинаються.
+HASH_BITS = 48
+HALF_BITS = HASH_BITS // 2
+HALF_MASK = (1 << HALF_BITS) - 1
+LEGACY_LIMIT = 1 << 40
+FEISTEL_ROUNDS = 6
+
+
+def create_redis_client():
+    """Async-клієнт з env: Upstash REST, якщо задано, інакше redis.asyncio (один пул з'єднань на процес)."""
+    if os.getenv("UPSTASH_REDIS_REST_URL") and os.getenv("UPSTASH_REDIS_REST_TOKEN"):
+        return UpstashRedis(url=os.getenv("UPSTASH_REDIS_REST_URL"), token=os.getenv("UPSTASH_REDIS_REST_TOKEN"))
+    return redis_asyncio.Redis(
+        host=os.getenv("REDIS_HOST", "localhost"),
+        port=int(os.getenv("REDIS_PORT", "6379")),
+        db=int(os.getenv("REDIS_DB", "0")),
+        password=os.getenv("REDIS_PASSWORD") or None,
+    )
+
+
+async def load_permutation_key(client):
+    """
+    Секрет перестановки з HASH_PERMUTATION_KEY; без нього сервіс не стартує.
+
+    Ключ не можна змінювати після видачі перших хешів — з іншим ключем
+    унікальність щодо вже виданих хешів не гарантується. Тому він живе в
+    конфігурації, а не в Redis, де його могли б витіснити (maxmemory) чи
+    скинути разом з даними. Ключ, який попередні версії зберігали в Redis
+    (`hash_permutation_key`), треба перенести в env.
+
+    Raises:
+        RuntimeError: HASH_PERMUTATION_KEY не задано
+    """
+    key = os.getenv("HASH_PERMUTATION_KEY")
+    if key:
+        return key.encode("utf-8")
+    stored = await client.get(PERMUTATION_KEY)
+    if stored:
+        raise RuntimeError(
+            f"HASH_PERMUTATION_KEY is not set; copy the key stored in Redis `{PERMUTATION_KEY}` into it"
+        )
+    raise RuntimeError("HASH_PERMUTATION_KEY is not set; generate one (e.g. `openssl rand -hex 32`) and never change it")
+
+
+def _round(key, half, index):
+    digest = hashlib.blake2b(half.to_bytes(3, "big") + bytes([index]), key=key[:64], digest_size=3).digest()
+    return int.from_bytes(digest, "big")
 
-def generate_hash(id_num: int) -> str:
-    b64 = base64.urlsafe_b64encode(id_num.to_bytes(6, "big")).decode("utf-8")
+
+def feistel_permute(key, value):
+    """Ключова перестановка 48-бітних чисел (мережа Фейстеля): бієкція, тож різні входи дають різні виходи."""
+    left, right = value >> HALF_BITS, value & HALF_MASK
+    for index in range(FEISTEL_ROUNDS):
+        left, right = right, left ^ _round(key, right, index)
+    return (left << HALF_BITS) | right
+
+
+def generate_hash(key, id_num: int) -> str:
+    """
+    Перетворює id у непередбачуваний, але гарантовано унікальний 8-символьний хеш.
+
+    Перестановка звужується на [LEGACY_LIMIT, 2^48) повторним застосуванням
+    (cycle walking) — це теж бієкція, а результат не збігається з жодним старим хешем.
+    """
+    value = feistel_permute(key, id_num + LEGACY_LIMIT)
+    while value < LEGACY_LIMIT:
+        value = feistel_permute(key, value)
+    b64 = base64.urlsafe_b64encode(value.to_bytes(6, "big")).decode("utf-8")
     return b64[:8]
 
 
-def hash_producer():
-    while True:
-        last_id = int(redis_client.get(LAST_ID_KEY) or 1)
-        # Генеруємо 10 хешів за раз, якщо пул менше 100
-        if redis_client.llen(POOL_KEY) < 100:
-            for i in range(10):
-                hash_value = generate_hash(last_id + i)
-                # Перевіряємо унікальність через Redis set
-                if not redis_client.sismember(HASH_SET_KEY, hash_value):
-                    redis_client.rpush(POOL_KEY, hash_value)
-                    redis_client.sadd(HASH_SET_KEY, hash_value)
-            redis_client.set(LAST_ID_KEY, last_id + 10)
-        time.sleep(1)
+def _decode(value):
+    return value.decode("utf-8") if isinstance(value, (bytes, bytearray)) else str(value)
+
+
+def merge_keyspace_flags(current, required="Kl"):
+    """
+    Додає до наявних прапорців notify-keyspace-events ті з `required`, яких бракує.
+
+    Прапорці інших споживачів (E, x, g, ...) зберігаються; "A" вже включає
+    всі класи подій, зокрема "l".
+
+    Args:
+        current (str): значення CONFIG GET notify-keyspace-events
+
+    Returns:
+        str: значення для CONFIG SET (== current, якщо нічого не бракує)
+    """
+    current = current or ""
+    missing = "".join(
+        flag for flag in required
+        if flag not in current and not (flag in "g$lshzxetd" and "A" in current)
+    )
+    return current + missing
+
+
+class HashProducer:
+    """
+    Тримає пул хешів між LOW_WATER і HIGH_WATER і видає з нього хеші.
+
+    `run()` — asyncio-задача, яку запускає lifespan застосунку. Вона
+    прокидається не за фіксованим sleep, а за подією: `notify()` з ендпоінтів
+    або keyspace-повідомлення Redis про LPOP з пулу (`listen_keyspace`); без
+    подій — раз на HASH_PRODUCER_POLL_INTERVAL секунд.
+    """
 
+    def __init__(self, client, key):
+        self.client = client
+        self.key = key
+        self.wakeup = asyncio.Event()
+        self.refills = 0
+        self.produced = 0
+        self.minted = 0
+        self.last_refill = None
+        self.recent = deque()  # (час, скільки хешів) за останні HASH_RATE_WINDOW секунд
+
+    def notify(self):
+        self.wakeup.set()
+
+    async def reserve_ids(self, count):
+        """Атомарно резервує `count` id (INCRBY) і повертає перший; репліки отримують діапазони, що не перетинаються."""
+        return int(await self.client.incrby(LAST_ID_KEY, count)) - count
+
+    async def refill(self):
+        """
+        Доповнює пул до HIGH_WATER, якщо він нижче LOW_WATER.
+
+        Returns:
+            int: скільки хешів додано
+        """
+        depth = int(await self.client.llen(POOL_KEY) or 0)
+        if depth >= HASH_POOL_LOW_WATER:
+            return 0
+        started = time.monotonic()
+        need = HASH_POOL_HIGH_WATER - depth
+        first = await self.reserve_ids(need)
+        added = 0
+        while added < need:
+            size = min(need - added, HASH_REFILL_BATCH)
+            await self.client.rpush(POOL_KEY, *[generate_hash(self.key, first + added + i) for i in range(size)])
+            added += size
+        self._record(depth, added, time.monotonic() - started)
+        return added
+
+    async def allocate(self, count):
+        """
+        Видає `count` хешів: з пулу одним LPOP, нестачу — одразу з нового діапазону id.
+
+        Args:
+            count (int): скільки хешів потрібно
+
+        Returns:
+            list: рівно `count` хешів
+        """
+        raw = await self.client.lpop(POOL_KEY, count)
+        if raw and not isinstance(raw, list):
+            raw = [raw]
+        hashes = [_decode(value) for value in raw or [] if value]
+        missing = count - len(hashes)
+        if missing > 0:
+            # Сплеск вичерпав пул — не відмовляємо, а мінтимо решту без пулу
+            first = await self.reserve_ids(missing)
+            hashes.extend(generate_hash(self.key, first + i) for i in range(missing))
+            self.minted += missing
+        self.notify()
+        return hashes
+
+    def _record(self, depth, added, elapsed):
+        now = time.time()
+        self.refills += 1
+        self.produced += added
+        self.last_refill = {"at": now, "depth_before": depth, "added": added, "seconds": round(elapsed, 4)}
+        self.recent.append((now, added))
+        while self.recent and self.recent[0][0] < now - HASH_RATE_WINDOW:
+            self.recent.popleft()
+
+    async def metrics(self):
+        now = time.time()
+        recent = sum(n for ts, n in self.recent if ts >= now - HASH_RATE_WINDOW)
+        data = {
+            "high_water": HASH_POOL_HIGH_WATER,
+            "low_water": HASH_POOL_LOW_WATER,
+            "refills": self.refills,
+            "hashes_produced": self.produced,
+            "hashes_minted": self.minted,  # видані в обхід пулу, коли його не вистачило
+            "refill_rate": round(recent / HASH_RATE_WINDOW, 2),  # хешів/с за останню хвилину
+            "last_refill": self.last_refill,
+        }
+        try:
+            data["pool_depth"] = int(await self.client.llen(POOL_KEY) or 0)
+        except Exception:
+            data["pool_depth"] = None
+        return data
+
+    async def run(self):
+        while True:
+            try:
+                await self.refill()
+            except Exception as e:
+                logger.warning("Hash refill failed: %s", e)
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), HASH_PRODUCER_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+
+    async def listen_keyspace(self):
+        """
+        Будить продюсера на кожен LPOP з пулу (keyspace-події; лише redis.asyncio).
+
+        До наявних прапорців notify-keyspace-events сервера лише додаються `K` і `l`,
+        щоб не вимкнути події, на які розраховують інші клієнти.
+        """
+        if not isinstance(self.client, redis_asyncio.Redis):
+            return
+        try:
+            current = (await self.client.config_get("notify-keyspace-events")).get("notify-keyspace-events", "")
+            flags = merge_keyspace_flags(_decode(current))
+            if flags != _decode(current):
+                await self.client.config_set("notify-keyspace-events", flags)
+        except Exception as e:
+            # Керовані Redis часто забороняють CONFIG — лишається опитування
+            logger.info("Keyspace events unavailable, polling every %ss: %s", HASH_PRODUCER_POLL_INTERVAL, e)
+            return
+        db = self.client.connection_pool.connection_kwargs.get("db", 0)
+        try:
+            async with self.client.pubsub(ignore_subscribe_messages=True) as pubsub:
+                await pubsub.subscribe(f"__keyspace@{db}__:{POOL_KEY}")
+                async for message in pubsub.listen():
+                    if message.get("data") in (b"lpop", "lpop"):
+                        self.notify()
+        except Exception as e:
+            logger.warning("Keyspace listener stopped, polling every %ss: %s", HASH_PRODUCER_POLL_INTERVAL, e)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """Клієнт Redis і задачі продюсера живуть рівно стільки, скільки застосунок."""
+    client = create_redis_client()
+    producer = HashProducer(client, await load_permutation_key(client))
+    app.state.producer = producer
+    tasks = [asyncio.create_task(producer.run()), asyncio.create_task(producer.listen_keyspace())]
+    try:
+        yield
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        close = getattr(client, "aclose", None) or getattr(client, "close", None)
+        if close is not None:
+            await close()
+
+
+app = FastAPI(lifespan=lifespan)
 
-threading.Thread(target=hash_producer, daemon=True).start()
 
 @app.get("/get_hash/")
-def get_hash():
+async def get_hash():
+    try:
+        hashes = await app.state.producer.allocate(1)
+    except Exception:
+        return {"error": "Redis unavailable"}
+    return {"hash": hashes[0]}
+
+
+@app.get("/get_hashes/")
+async def get_hashes(n: int = Query(10, ge=1, le=HASH_MAX_BATCH)):
     try:
-        hash_value = redis_client.lpop(POOL_KEY)
-        if hash_value:
-            if isinstance(hash_value, (bytes, bytearray)):
-                return {"hash": hash_value.decode("utf-8")}
-            return {"hash": str(hash_value)}
+        hashes = await app.state.producer.allocate(n)
     except Exception:
         return {"error": "Redis unavailable"}
-    return {"error": "No hash available"}
+    return {"hashes": hashes}
+
+
+@app.get("/metrics/")
+async def metrics():
+    return await app.state.producer.metrics()
 
 # uvicorn hash_generator.hash_service:app --reload
 # uvicorn hash_generator.hash_service:app --reload --port 8081
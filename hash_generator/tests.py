@@ -0,0 +1,159 @@
+import base64
+import os
+import unittest
+from unittest.mock import patch
+
+from hash_generator import hash_service
+from hash_generator.hash_service import (
+    FEISTEL_ROUNDS,
+    HALF_BITS,
+    HALF_MASK,
+    LEGACY_LIMIT,
+    PERMUTATION_KEY,
+    POOL_KEY,
+    HashProducer,
+    feistel_permute,
+    generate_hash,
+    load_permutation_key,
+    merge_keyspace_flags,
+    _round,
+)
+
+KEY = b"test-permutation-key"
+
+
+def _value(hash):
+    return int.from_bytes(base64.urlsafe_b64decode(hash), "big")
+
+
+def _legacy_hash(id_num):
+    """Хеш старого генератора: id без перестановки."""
+    return base64.urlsafe_b64encode(id_num.to_bytes(6, "big")).decode("utf-8")[:8]
+
+
+def _unpermute(key, value):
+    left, right = value >> HALF_BITS, value & HALF_MASK
+    for index in reversed(range(FEISTEL_ROUNDS)):
+        left, right = right ^ _round(key, left, index), left
+    return (left << HALF_BITS) | right
+
+
+class FakeAsyncRedis:
+    """Мінімальний async-клієнт у пам'яті для тестів hash service."""
+
+    def __init__(self):
+        self.values = {}
+        self.lists = {}
+        self.rpush_calls = 0
+
+    async def get(self, name):
+        return self.values.get(name)
+
+    async def incrby(self, name, amount):
+        self.values[name] = int(self.values.get(name, 0)) + amount
+        return self.values[name]
+
+    async def llen(self, name):
+        return len(self.lists.get(name, []))
+
+    async def rpush(self, name, *values):
+        self.rpush_calls += 1
+        self.lists.setdefault(name, []).extend(v.encode("utf-8") for v in values)
+        return len(self.lists[name])
+
+    async def lpop(self, name, count=None):
+        items = self.lists.get(name, [])
+        taken, self.lists[name] = items[:count or 1], items[count or 1:]
+        if count is None:
+            return taken[0] if taken else None
+        return taken or None
+
+
+class GenerateHashTest(unittest.TestCase):
+    """Тест перестановки id → хеш (hash_generator/hash_service.py)"""
+    def test_distinct_ids_give_distinct_hashes(self):
+        ids = list(range(20000)) + list(range(10**9, 10**9 + 5000))
+        hashes = [generate_hash(KEY, id_num) for id_num in ids]
+        self.assertEqual(len(set(hashes)), len(ids))
+        self.assertTrue(all(len(h) == 8 for h in hashes))
+
+    def test_permutation_is_invertible(self):
+        # Раунди Фейстеля у зворотному порядку відновлюють вхід — отже перестановка бієктивна
+        for value in [LEGACY_LIMIT + i for i in range(5000)] + [0, (1 << 48) - 1]:
+            permuted = feistel_permute(KEY, value)
+            self.assertTrue(0 <= permuted < 1 << 48)
+            self.assertEqual(_unpermute(KEY, permuted), value)
+
+    def test_no_overlap_with_legacy_hashes(self):
+        hashes = [generate_hash(KEY, id_num) for id_num in range(20000)]
+        self.assertTrue(all(_value(h) >= LEGACY_LIMIT for h in hashes))
+        legacy = {_legacy_hash(id_num) for id_num in range(20000)}
+        self.assertFalse(legacy & set(hashes))
+
+    def test_key_changes_hashes(self):
+        self.assertNotEqual(generate_hash(KEY, 1), generate_hash(b"other-key", 1))
+        self.assertEqual(generate_hash(KEY, 1), generate_hash(KEY, 1))
+
+
+class LoadPermutationKeyTest(unittest.IsolatedAsyncioTestCase):
+    """Тест завантаження секрету перестановки"""
+    async def test_key_from_env(self):
+        with patch.dict(os.environ, {"HASH_PERMUTATION_KEY": "secret"}):
+            self.assertEqual(await load_permutation_key(FakeAsyncRedis()), b"secret")
+
+    async def test_refuses_to_start_without_key(self):
+        client = FakeAsyncRedis()
+        with patch.dict(os.environ, {}, clear=True):
+            with self.assertRaises(RuntimeError):
+                await load_permutation_key(client)
+            # Ключ попередньої версії в Redis не використовується, лише підказує, що перенести в env
+            client.values[PERMUTATION_KEY] = b"old-key"
+            with self.assertRaisesRegex(RuntimeError, PERMUTATION_KEY):
+                await load_permutation_key(client)
+
+
+@patch.object(hash_service, "HASH_REFILL_BATCH", 8)
+@patch.object(hash_service, "HASH_POOL_LOW_WATER", 10)
+@patch.object(hash_service, "HASH_POOL_HIGH_WATER", 30)
+class HashProducerTest(unittest.IsolatedAsyncioTestCase):
+    """Тест доповнення пулу між LOW_WATER і HIGH_WATER та видачі хешів"""
+    def setUp(self):
+        self.client = FakeAsyncRedis()
+        self.producer = HashProducer(self.client, KEY)
+
+    async def test_refill_tops_up_to_high_water_in_batches(self):
+        self.assertEqual(await self.producer.refill(), 30)
+        self.assertEqual(await self.client.llen(POOL_KEY), 30)
+        # 30 хешів пачками по 8 — чотири RPUSH
+        self.assertEqual(self.client.rpush_calls, 4)
+        self.assertEqual(len(set(self.client.lists[POOL_KEY])), 30)
+
+        # Не нижче LOW_WATER — нічого не робимо
+        await self.client.lpop(POOL_KEY, 20)
+        self.assertEqual(await self.producer.refill(), 0)
+        await self.client.lpop(POOL_KEY, 1)
+        self.assertEqual(await self.producer.refill(), 21)
+        self.assertEqual(await self.client.llen(POOL_KEY), 30)
+        metrics = await self.producer.metrics()
+        self.assertEqual((metrics["refills"], metrics["hashes_produced"], metrics["pool_depth"]), (2, 51, 30))
+
+    async def test_allocate_mints_shortfall_without_duplicates(self):
+        await self.producer.refill()
+        hashes = await self.producer.allocate(45)
+        self.assertEqual(len(hashes), 45)
+        self.assertEqual(len(set(hashes)), 45)
+        self.assertEqual(self.producer.minted, 15)
+        self.assertTrue(self.producer.wakeup.is_set())
+        # Наступне доповнення бере новий діапазон id — без повторів з уже виданими
+        await self.producer.refill()
+        pool = {value.decode("utf-8") for value in self.client.lists[POOL_KEY]}
+        self.assertFalse(pool & set(hashes))
+
+
+class KeyspaceFlagsTest(unittest.TestCase):
+    """Тест злиття notify-keyspace-events з прапорцями сервера"""
+    def test_merge_keeps_existing_flags(self):
+        self.assertEqual(merge_keyspace_flags(""), "Kl")
+        self.assertEqual(merge_keyspace_flags("Ex"), "ExKl")
+        self.assertEqual(merge_keyspace_flags("KEA"), "KEA")
+        self.assertEqual(merge_keyspace_flags("lK"), "lK")
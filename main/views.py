@@ -3,9 +3,11 @@ from django.views.generic import TemplateView, ListView
 from django.shortcuts import render
 from django.core.paginator import Paginator
 from django.db.models import Q
+from django.http import Http404
 from django.utils import timezone
 
 from bins.models import Create_Bins
+from bins.pagination import RECENT_ORDERING, SEARCH_ORDERING, InvalidCursor, paginate_keyset, use_keyset
 from bins.utils import smart_search
 
 class MainView(ListView):
@@ -19,11 +21,30 @@ class MainView(ListView):
         if query:
             return smart_search(query)
         # show only non-expired bins
-        return Create_Bins.objects.filter(Q(expiry_at__isnull=True) | Q(expiry_at__gt=timezone.now())).order_by("-created_at")
+        return Create_Bins.objects.filter(Q(expiry_at__isnull=True) | Q(expiry_at__gt=timezone.now())).order_by(*RECENT_ORDERING)
+
+    def get_paginate_by(self, queryset):
+        # У курсорному режимі (?pagination=cursor) сторінку будує paginate_keyset — без COUNT і OFFSET
+        if use_keyset(self.request.GET):
+            return None
+        return super().get_paginate_by(queryset)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         query = self.request.GET.get("q", None)
+        if use_keyset(self.request.GET):
+            try:
+                items, next_cursor, previous_cursor = paginate_keyset(
+                    self.object_list,
+                    SEARCH_ORDERING if query else RECENT_ORDERING,
+                    self.paginate_by,
+                    self.request.GET.get("cursor"),
+                )
+            except InvalidCursor:
+                raise Http404("Invalid cursor")
+            context["bins_page"] = items
+            context["next_cursor"] = next_cursor
+            context["previous_cursor"] = previous_cursor
         context["title"] = "Binify — Головна"
         context["content"] = "Легко зберігай та ділись фрагментами коду або тексту."
         context["create_new_bin"] = "Створити новий Bin"